@@ -79,15 +79,94 @@ in the Thermal Mockup for MTD, ETL upgrade for CMS experiemnt at CERN.
 #define MODE_SYSTEM_ZERO_SCALE_CALIBRATION 0x06
 #define MODE_SYSTEM_FULL_SCALE_CALIBRATION 0x07
 
+// Must match baud_rate in the [Microcontroller] section of the run config
+#define BAUD_RATE 9600
+
+// Reported by the hello command so the host can pick how to talk to this build
+#define FIRMWARE_NAME "thermal_mockup"
+#define FIRMWARE_VERSION "2.3"
+#define ADC_NAME "AD7718" // AD7708 boards: "AD7708" and ADC_BITS_AD7708 below
+#define ADC_BITS ADC_BITS_AD7718
+
+// Binary frames, see software/framing.py
+// SYNC | LEN | TYPE | SEQ (uint16) | CHANNEL | VALUE (uint32) | CHECKSUM (xor of payload)
+#define FRAME_SYNC 0xA5
+#define FRAME_PAYLOAD_SIZE 8
+#define FRAME_SENSOR 0x01
+#define FRAME_PROBE 0x02
+#define FRAME_BB 0x03
+
 const int cs_pins[4] = {PIN_CSB, PIN_PROBE_1_CSB, PIN_PROBE_2_CSB, PIN_PROBE_3_CSB};
 
+// Text replies go through out instead of Serial. After "checksum on" it ends
+// every line with *XX, the xor of the line's characters in hex, so the host
+// can drop a line that lost bytes or ran into the next one instead of
+// reading a wrong value. Binary frames carry their own checksum.
+class ChecksumPrint : public Print {
+  public:
+    bool enabled = false;
+
+    size_t write(uint8_t c) override {
+      if (!enabled) return Serial.write(c);
+      if (c == '\r') return 1; // sent along with the newline
+      if (c == '\n') {
+        if (length > 0) {
+          Serial.write('*');
+          if (sum < 0x10) Serial.write('0');
+          Serial.print(sum, HEX);
+        }
+        Serial.write("\r\n");
+        sum = 0;
+        length = 0;
+        return 1;
+      }
+      sum ^= c;
+      length++;
+      return Serial.write(c);
+    }
+
+  private:
+    uint8_t sum = 0;
+    unsigned int length = 0;
+};
+
+ChecksumPrint out;
+
+// ADC settings of every channel, set with adcconfig. The defaults are what
+// the AD7718 has after a reset, a 19.8 Hz conversion rate with chopping.
+#define FILTER_DEFAULT 0x45
+#define FILTER_MIN_CHOP 13
+#define FILTER_MIN_NO_CHOP 3
+uint8_t channel_filter[8] = {FILTER_DEFAULT, FILTER_DEFAULT, FILTER_DEFAULT, FILTER_DEFAULT, FILTER_DEFAULT, FILTER_DEFAULT, FILTER_DEFAULT, FILTER_DEFAULT};
+bool channel_chop[8] = {true, true, true, true, true, true, true, true};
+uint8_t adc_filter = FILTER_DEFAULT; // what REG_FILTER holds, only written when a channel needs another one
+byte adc_channel = 0; // channel the ADC is converting continuously, 0 once anything else used the ADC
+
+bool binary_mode = false;
+uint16_t frame_seq = 0;
+bool timestamp_mode = false;
+uint16_t sweep_seq = 0;
+
+#define TP_MAX_SAMPLES 1024 // analog reads TPavg averages at most
+
+// Streaming, see stream(). Channels are kept here since a Command only has MAX_ARGS of them
+#define STREAM_MAX_CHANNELS 11 // 8 ADC channels and 3 probes
+#define STREAM_MAX_CREDITS 64
+bool stream_mode = false;
+String stream_channels[STREAM_MAX_CHANNELS];
+uint8_t stream_nchannels = 0;
+unsigned long stream_interval = 0; // ms between the starts of two sweeps
+unsigned long stream_last = 0;
+unsigned int stream_credits = 0; // sweeps that can be sent before the host hands back more
+uint16_t stream_seq = 0;
+
 
 /* ----------------------------------------------------- 
   Parsing Functions
 ----------------------------------------------------- */
 unsigned char hex2char(String s) {
   if (s.length() < 2) {
-    Serial.println("ERROR: Bad Hex conversion, must be two characters");
+    out.println("ERROR: Bad Hex conversion, must be two characters");
     return 0;
   }
   unsigned char out = 0;
@@ -144,6 +223,41 @@ Command parse_command(String line) {
 }
 
 
+/* ----------------------------------------------------- 
+  Binary Frame Functions
+----------------------------------------------------- */
+void send_frame(uint8_t type, uint8_t channel, uint32_t value) {
+  uint8_t payload[FRAME_PAYLOAD_SIZE];
+  payload[0] = type;
+  payload[1] = frame_seq & 0xFF;
+  payload[2] = (frame_seq >> 8) & 0xFF;
+  payload[3] = channel;
+  for (uint8_t i = 0; i < 4; i++) {
+    payload[4 + i] = (value >> (8 * i)) & 0xFF;
+  }
+
+  uint8_t checksum = 0;
+  for (uint8_t i = 0; i < FRAME_PAYLOAD_SIZE; i++) {
+    checksum ^= payload[i];
+  }
+
+  Serial.write(FRAME_SYNC);
+  Serial.write(FRAME_PAYLOAD_SIZE);
+  Serial.write(payload, FRAME_PAYLOAD_SIZE);
+  Serial.write(checksum);
+  frame_seq++;
+}
+
+
+// Prints a text reading, followed by " @<millis>" when timestamps are on
+void send_reading(String reply) {
+  if (timestamp_mode) {
+    reply += " @" + String(millis());
+  }
+  out.println(reply);
+}
+
+
 /* ----------------------------------------------------- 
   SPI Functions
 ----------------------------------------------------- */
@@ -216,6 +330,8 @@ void rst() {
   digitalWrite(PIN_RSTB, LOW);
   delayMicroseconds(100);
   digitalWrite(PIN_RSTB, HIGH);
+  adc_filter = FILTER_DEFAULT;
+  adc_channel = 0;
   
   // Setup IO control to set P1 and P2 to inputs
   // they are unconnected on the board and unused
@@ -223,7 +339,8 @@ void rst() {
 }
 
 void calibrate_channel(unsigned char channel_flag, String channel_name){
-  Serial.println("Beginning calibration of channel " + channel_name);
+  out.println("Beginning calibration of channel " + channel_name);
+  adc_channel = 0;
   write_register(REG_MODE, 0b01100011, 8);
   //Serial.println("Mode set to " + String(read_register(REG_MODE,8), BIN));
 
@@ -243,12 +360,12 @@ void calibrate_channel(unsigned char channel_flag, String channel_name){
     delay(10);
     cnt++;
     if (cnt > 100) {
-      Serial.println("ERROR: Calibration failed, timeout.");
+      out.println("ERROR: Calibration failed, timeout.");
       return;
     }
   }
 
-  Serial.println("Zero Scale Calibration succeeded!");
+  out.println("Zero Scale Calibration succeeded!");
 
   write_register(REG_MODE, MODE_FULL_SCALE_CALIBRATION, 8);
   while(true) {
@@ -258,17 +375,29 @@ void calibrate_channel(unsigned char channel_flag, String channel_name){
     delay(10);
   }
 
-  Serial.println("Calibration succeeded!");
+  out.println("Calibration succeeded!");
 }
 
 unsigned long read_channel(unsigned char channel_id) {
-  // write_register(REG_MODE, MODE_NEGBUF | MODE_REFSEL | MODE_CONTINUOUS_CONVERSION, 8); <- REFSEL results in bad range, ie results are clamped.
-  write_register(REG_MODE, MODE_NEGBUF | MODE_CONTINUOUS_CONVERSION, 8);
-  // unsigned long mode_value = read_register(REG_MODE, 8);
-  // Serial.printf("mode:  %08x\n", mode_value);
-  write_register(REG_ADC_CONTROL, ((channel_id - 1)<<4) | ADC_CONTROL_RANGE_2p56V, 8);
-  // unsigned long control_value = read_register(REG_ADC_CONTROL, 8);
-  // Serial.printf("control:  %08x\n", control_value);
+  byte i = channel_id - 1;
+  // The ADC keeps converting the last channel in continuous mode, reading it
+  // again only waits for the next conversion. Streaming one channel runs at
+  // the full conversion rate this way.
+  if (channel_id != adc_channel) {
+    if (channel_filter[i] != adc_filter) {
+      write_register(REG_FILTER, channel_filter[i], 8);
+      adc_filter = channel_filter[i];
+    }
+    // write_register(REG_MODE, MODE_NEGBUF | MODE_REFSEL | MODE_CONTINUOUS_CONVERSION, 8); <- REFSEL results in bad range, ie results are clamped.
+    // setting CHOPB turns chopping off
+    write_register(REG_MODE, MODE_NEGBUF | MODE_CONTINUOUS_CONVERSION | (channel_chop[i] ? 0 : MODE_CHOPB), 8);
+    // unsigned long mode_value = read_register(REG_MODE, 8);
+    // Serial.printf("mode:  %08x\n", mode_value);
+    write_register(REG_ADC_CONTROL, ((channel_id - 1)<<4) | ADC_CONTROL_RANGE_2p56V, 8);
+    // unsigned long control_value = read_register(REG_ADC_CONTROL, 8);
+    // Serial.printf("control:  %08x\n", control_value);
+    adc_channel = channel_id;
+  }
 
 
   unsigned long try_count = 0;
@@ -276,13 +405,14 @@ unsigned long read_channel(unsigned char channel_id) {
     delay(10);
     try_count++;
     if (try_count > 1000) {
-      Serial.println("ERROR: Unable to read ADC value, timeout.");
+      out.println("ERROR: Unable to read ADC value, timeout.");
+      adc_channel = 0;
       return 0;
     }
   }
   // unsigned long status = read_register(REG_STATUS, 8);
   // Serial.printf("status:  %08x\n", status);
-  unsigned long adc_value = read_register(REG_ADC_DATA, ADC_BITS_AD7718);
+  unsigned long adc_value = read_register(REG_ADC_DATA, ADC_BITS);
   return adc_value;
 }
 
@@ -290,10 +420,14 @@ void rw_register(Command cmd, bool enable, String name, unsigned char addr, unsi
   chipSelect(PIN_CSB);
   clk(); clk(); clk(); clk();
   clk(); clk(); clk(); clk();
-  if (enable && (cmd.nargs > 0)) write_register(addr, hex2char(cmd.args[0]), size_bits);
+  if (enable && (cmd.nargs > 0)) {
+    write_register(addr, hex2char(cmd.args[0]), size_bits);
+    adc_channel = 0;
+    if (addr == REG_FILTER) adc_filter = hex2char(cmd.args[0]);
+  }
   unsigned long value = read_register(addr, size_bits);
-  Serial.println(name + " " + String(value, HEX));
-  Serial.println();
+  out.println(name + " " + String(value, HEX));
+  out.println();
 }
 
 /* ----------------------------------------------------- 
@@ -305,7 +439,7 @@ void reset(Command cmd) {
   clk(); clk(); clk(); clk();
   rst();
   delay(10);
-  Serial.println(F("RESET COMPLETE\n"));
+  out.println(F("RESET COMPLETE\n"));
 }
 
 void calibrate(Command cmd) {
@@ -330,14 +464,14 @@ void calibrate(Command cmd) {
 
     // skip iteration if invalid channel
     if (channel_id < 1 || channel_id > 8) {
-        Serial.println(F("ERROR: Channel ID Invalid"));
+        out.println(F("ERROR: Channel ID Invalid"));
         continue;
     }
 
     calibrate_channel((unsigned char)(channel_id-1), cmd.args[j]);
     delay(10);
   }
-  Serial.println(F("CALIBRATION COMPLETE\n"));
+  out.println(F("CALIBRATION COMPLETE\n"));
 }
 
 void measure(Command cmd) {
@@ -346,7 +480,7 @@ void measure(Command cmd) {
   clk(); clk(); clk(); clk();
 
   if (cmd.nargs == 0){
-    Serial.println(F("ERROR: No channel selected for measurement\n"));
+    out.println(F("ERROR: No channel selected for measurement\n"));
     return;
   }
 
@@ -355,12 +489,16 @@ void measure(Command cmd) {
 
     // skip iteration if invalid channel
     if (channel_id < 1 || channel_id > 8) {
-        Serial.println(F("ERROR: Channel ID Invalid"));
+        out.println(F("ERROR: Channel ID Invalid"));
         continue;
     }
 
     unsigned long adc_value = read_channel(channel_id);
-    Serial.println("measure " + String(channel_id) + " " + String(adc_value, HEX));
+    if (binary_mode) {
+      send_frame(FRAME_SENSOR, channel_id, adc_value);
+      continue;
+    }
+    send_reading("measure " + String(channel_id) + " " + String(adc_value, HEX));
   }
   //Serial.println(F("MEASUREMENT COMPLETE\n"));
 }
@@ -397,9 +535,21 @@ void id(Command cmd) {
   rw_register(cmd, true, "id", REG_ID, 8);
 }
 
+unsigned long read_probe(byte probe_id) {
+  // probe_id has to be 1, 2 or 3
+  int cs_signal = cs_pins[probe_id];
+  adc_channel = 0; // set up the ADC again after the probe had the bus
+  delay(320);
+  chipSelect(cs_signal);
+  delay(10);
+  unsigned long rawValue = readSPI(16);
+  digitalWrite(cs_signal, HIGH);
+  return rawValue;
+}
+
 void temp_probe(Command cmd) {
   if (cmd.nargs == 0){
-    Serial.println(F("ERROR: No probe selected for measurement\n"));
+    out.println(F("ERROR: No probe selected for measurement\n"));
     return;
   }
 
@@ -408,32 +558,16 @@ void temp_probe(Command cmd) {
     
     // skip iteration if invalid probe
     if (probe_id < 1 || probe_id > 3) {
-        Serial.println(F("ERROR: Probe Invalid"));
+        out.println(F("ERROR: Probe Invalid"));
         continue;
     }
 
-    int cs_signal;
-    //Serial.println("Before switch statement");
-    switch (probe_id) {
-      case 1:
-        cs_signal = PIN_PROBE_1_CSB;
-        break;
-      case 2:
-        cs_signal = PIN_PROBE_2_CSB;
-        break;
-      case 3:
-        cs_signal = PIN_PROBE_3_CSB;
-        break;
-      default:
-        Serial.println("ERROR: Invalid Probe ID");
-        return;
+    unsigned long rawValue = read_probe(probe_id);
+    if (binary_mode) {
+      send_frame(FRAME_PROBE, probe_id, rawValue);
+    } else {
+      send_reading("Probe " + String(probe_id) + ": 0x" + String(rawValue, HEX));
     }
-    delay(320);
-    chipSelect(cs_signal);
-    delay(10);
-    unsigned long rawValue = readSPI(16);
-    digitalWrite(cs_signal, HIGH);
-    Serial.println("Probe " + String(probe_id) + ": 0x" + String(rawValue, HEX));
     
     // rawValue >>= 3;
 
@@ -449,42 +583,291 @@ void temp_probe(Command cmd) {
   //Serial.println(F("TEMPERATURE READOUT COMPLETE\n"));
 }
 
+// Analog pin of a bump bond path, -1 if there is no such path
+int bb_analog_pin(byte bb_path_id) {
+  switch (bb_path_id) {
+    // A0, A1, A2 and A3 are already defined in the header file from Arduino.h
+    case 1: return A0;
+    case 2: return A1;
+    case 3: return A2;
+    case 4: return A3;
+    default: return -1;
+  }
+}
+
 void bb_path(Command cmd) {
   if (cmd.nargs == 0){
-    Serial.println(F("ERROR: No TP number selected for measurement"));
+    out.println(F("ERROR: No TP number selected for measurement"));
     return;
   }
 
   for (uint8_t j=0; j<cmd.nargs; j++){
     byte bb_path_id = cmd.args[j].toInt();
 
-    int analog_pin;
-    switch (bb_path_id) {
-      // A0, A1, A2 and A3 are already defined in the header file from Arduino.h
-      case 1:
-        analog_pin = A0;
-        break;
-      case 2:
-        analog_pin = A1;
-        break;
-      case 3:
-        analog_pin = A2;
-        break;
-      case 4:
-        analog_pin = A3;
-        break;
-      default:
-        Serial.println("ERROR: Invalid bb path id. Choices: 1, 2, 3, and 4");
-        return;
+    int analog_pin = bb_analog_pin(bb_path_id);
+    if (analog_pin < 0) {
+      out.println("ERROR: Invalid bb path id. Choices: 1, 2, 3, and 4");
+      return;
     }
     delay(320);
     int rawValue = analogRead(analog_pin);
-    float voltage = rawValue * (3.3 / 1023.0);
-    Serial.println("TP" + String(bb_path_id) + " " + String(voltage));
+    if (binary_mode) {
+      // the host converts the raw code to volts
+      send_frame(FRAME_BB, bb_path_id, rawValue);
+    } else {
+      float voltage = rawValue * (3.3 / 1023.0);
+      send_reading("TP" + String(bb_path_id) + " " + String(voltage));
+    }
+    delay(500);
+  }
+}
+
+// Averages analog reads of each path, ex: "TPavg 64 1 2" answers
+// "TPavg1 1.6512 0.0031 64" and "TPavg2 ..." with the mean and standard
+// deviation of the 64 reads in volts. One line instead of 64 TP commands.
+void bb_path_avg(Command cmd) {
+  if (cmd.nargs < 2){
+    out.println(F("ERROR: No sample count or TP number selected. Ex: TPavg 64 1 2"));
+    return;
+  }
+
+  long n = cmd.args[0].toInt();
+  if (n < 1 || n > TP_MAX_SAMPLES) {
+    out.println(F("ERROR: Invalid sample count. Choices: 1 to 1024"));
+    return;
+  }
+
+  for (uint8_t j=1; j<cmd.nargs; j++){
+    byte bb_path_id = cmd.args[j].toInt();
+    int analog_pin = bb_analog_pin(bb_path_id);
+    if (analog_pin < 0) {
+      out.println("ERROR: Invalid bb path id. Choices: 1, 2, 3, and 4");
+      return;
+    }
+    delay(320);
+    // 10 bit codes, 1024 of them squared still fit in 32 bits
+    uint32_t sum = 0;
+    uint32_t sum_squares = 0;
+    for (long i = 0; i < n; i++) {
+      uint32_t raw = analogRead(analog_pin);
+      sum += raw;
+      sum_squares += raw * raw;
+    }
+    float mean = (float)sum / n;
+    // exact in integers, sum_squares / n - mean^2 in floats loses the small spread
+    uint64_t spread = (uint64_t)n * sum_squares - (uint64_t)sum * sum;
+    float variance = (float)spread / n / n;
+    float volts_per_code = 3.3 / 1023.0;
+    send_reading("TPavg" + String(bb_path_id) + " " + String(mean * volts_per_code, 4) + " " + String(sqrt(variance) * volts_per_code, 4) + " " + String(n));
     delay(500);
   }
 }
 
+// Reads channels and probes, ex: {"1", "2", "P1"} -> " 1:72a4ff 2:72b1c0 P1:c80"
+String read_sweep(String channels[], uint8_t nchannels) {
+  String reply = "";
+  bool adc_selected = false;
+  for (uint8_t j=0; j<nchannels; j++){
+    String arg = channels[j];
+    if (arg.startsWith("P")) {
+      byte probe_id = arg.substring(1).toInt();
+      if (probe_id < 1 || probe_id > 3) {
+        out.println(F("ERROR: Probe Invalid"));
+        continue;
+      }
+      reply += " P" + String(probe_id) + ":" + String(read_probe(probe_id), HEX);
+      adc_selected = false; // reading a probe deselects the adc
+      delay(1000);
+      continue;
+    }
+
+    byte channel_id = arg.toInt();
+    if (channel_id < 1 || channel_id > 8) {
+      out.println(F("ERROR: Channel ID Invalid"));
+      continue;
+    }
+    if (!adc_selected) {
+      chipSelect(PIN_CSB);
+      clk(); clk(); clk(); clk();
+      clk(); clk(); clk(); clk();
+      adc_selected = true;
+    }
+    reply += " " + String(channel_id) + ":" + String(read_channel(channel_id), HEX);
+  }
+  return reply;
+}
+
+// One reply line for a whole sweep, ex: "sweep 1 2 8 P1 P3" answers
+// "sweep <seq> 1:72a4ff 2:72b1c0 8:7301aa P1:c80 P3:c90"
+void sweep(Command cmd) {
+  if (cmd.nargs == 0){
+    out.println(F("ERROR: No channel selected for sweep"));
+    return;
+  }
+  String reply = "sweep " + String(sweep_seq++);
+  send_reading(reply + read_sweep(cmd.args, cmd.nargs));
+}
+
+// Ex: "stream start 1,2,8,P1 2 8" sweeps channels 1, 2, 8 and probe 1 twice a
+// second without being asked again, each sweep sent as
+// "stream <seq> 1:72a4ff 2:72b1c0 8:7301aa P1:c80". A rate of 0 sweeps back to back.
+// The last argument is how many sweeps can be sent before the host has read
+// them, "stream credit 4" lets it send 4 more so a busy host is never flooded.
+// "stream stop" ends it, commands are still answered between sweeps.
+void stream(Command cmd) {
+  if (cmd.nargs == 0) {
+    out.println(F("ERROR: No stream action selected. Choices: start, credit, stop"));
+    return;
+  }
+
+  String action = cmd.args[0];
+  if (action == "credit" && cmd.nargs > 1) {
+    // no reply, one is sent every few sweeps
+    stream_credits = min(stream_credits + (unsigned int)cmd.args[1].toInt(), (unsigned int)STREAM_MAX_CREDITS);
+    return;
+  }
+  if (action == "stop") {
+    stream_mode = false;
+    out.println("STREAM STOP " + String(stream_seq));
+    return;
+  }
+  if (action != "start" || cmd.nargs < 4) {
+    out.println(F("ERROR: Invalid stream command. Ex: stream start 1,2,P1 2 8"));
+    return;
+  }
+
+  String channels = cmd.args[1];
+  stream_nchannels = 0;
+  while (channels.length() > 0 && stream_nchannels < STREAM_MAX_CHANNELS) {
+    int split = channels.indexOf(',');
+    if (split < 0) split = channels.length();
+    stream_channels[stream_nchannels++] = channels.substring(0, split);
+    channels = channels.substring(min(split + 1, (int)channels.length()));
+  }
+  float rate = cmd.args[2].toFloat();
+  stream_interval = rate > 0 ? (unsigned long)(1000 / rate) : 0;
+  stream_credits = min((unsigned int)cmd.args[3].toInt(), (unsigned int)STREAM_MAX_CREDITS);
+  stream_seq = 0;
+  stream_last = millis() - stream_interval; // first sweep right away
+  stream_mode = true;
+  out.println("STREAM START " + String(stream_nchannels) + " " + cmd.args[2]);
+}
+
+// Called every loop, sends the next sweep when it is due and the host has room for it
+void stream_step() {
+  if (!stream_mode || stream_credits == 0) return;
+  if (millis() - stream_last < stream_interval) return;
+  stream_last = millis();
+  stream_credits--;
+  String reply = "stream " + String(stream_seq++);
+  send_reading(reply + read_sweep(stream_channels, stream_nchannels));
+}
+
+void binary(Command cmd) {
+  if (cmd.nargs == 0) {
+    out.println(F("ERROR: No binary state selected. Choices: on, off"));
+    return;
+  }
+
+  String state = cmd.args[0];
+  state.toUpperCase();
+  if (state != "ON" && state != "OFF") {
+    out.println(F("ERROR: Invalid binary state selected. Choices: on, off"));
+    return;
+  }
+
+  binary_mode = (state == "ON");
+  frame_seq = 0;
+  out.println("BINARY " + state);
+}
+
+// Ex: "adcconfig 45 ON" sets every channel, "adcconfig 0D OFF 1 2" only channels 1 and 2.
+// The filter word SF (hex) sets the conversion rate, 32768 / (3 * 8 * SF) Hz with
+// chopping and 32768 / (8 * SF) Hz without. Chopping removes offset drift but is 3x slower.
+void adc_config(Command cmd) {
+  if (cmd.nargs < 2) {
+    out.println(F("ERROR: No ADC config selected. Ex: adcconfig 45 ON 1 2"));
+    return;
+  }
+
+  uint8_t sf = hex2char(cmd.args[0]);
+  String chop = cmd.args[1];
+  chop.toUpperCase();
+  if (chop != "ON" && chop != "OFF") {
+    out.println(F("ERROR: Invalid chop state selected. Choices: on, off"));
+    return;
+  }
+  if (sf < (chop == "ON" ? FILTER_MIN_CHOP : FILTER_MIN_NO_CHOP)) {
+    out.println(F("ERROR: Filter word too small for this chop state"));
+    return;
+  }
+
+  for (byte channel_id=1; channel_id<=8; channel_id++) {
+    // no channels means all of them
+    bool selected = (cmd.nargs == 2);
+    for (uint8_t j=2; j<cmd.nargs; j++) {
+      if (cmd.args[j].toInt() == channel_id) selected = true;
+    }
+    if (!selected) continue;
+    channel_filter[channel_id - 1] = sf;
+    channel_chop[channel_id - 1] = (chop == "ON");
+  }
+  adc_channel = 0; // applied the next time a channel is set up
+  String reply = "ADCCONFIG " + cmd.args[0] + " " + chop;
+  for (uint8_t j=2; j<cmd.nargs; j++) reply += " " + cmd.args[j];
+  out.println(reply);
+}
+
+void checksum_mode(Command cmd) {
+  if (cmd.nargs == 0) {
+    out.println(F("ERROR: No checksum state selected. Choices: on, off"));
+    return;
+  }
+
+  String state = cmd.args[0];
+  state.toUpperCase();
+  if (state != "ON" && state != "OFF") {
+    out.println(F("ERROR: Invalid checksum state selected. Choices: on, off"));
+    return;
+  }
+
+  out.enabled = (state == "ON");
+  out.println("CHECKSUM " + state);
+}
+
+void timestamps(Command cmd) {
+  if (cmd.nargs == 0) {
+    out.println(F("ERROR: No timestamp state selected. Choices: on, off"));
+    return;
+  }
+
+  String state = cmd.args[0];
+  state.toUpperCase();
+  if (state != "ON" && state != "OFF") {
+    out.println(F("ERROR: Invalid timestamp state selected. Choices: on, off"));
+    return;
+  }
+
+  timestamp_mode = (state == "ON");
+  out.println("TIMESTAMPS " + state);
+}
+
+extern CommandEntry command_table[];
+
+// Handshake, tells the host what this build supports, ex:
+// "HELLO firmware=thermal_mockup version=2.3 adc=AD7718 adc_bits=24 max_args=10 binary=1 commands=reset,calibrate,..."
+void hello(Command cmd) {
+  String reply = F("HELLO firmware=" FIRMWARE_NAME " version=" FIRMWARE_VERSION " adc=" ADC_NAME);
+  reply += " adc_bits=" + String(ADC_BITS);
+  reply += " max_args=" + String(MAX_ARGS);
+  reply += F(" binary=1 commands=");
+  for (int i = 0; command_table[i].name != NULL; i++) {
+    if (i > 0) reply += ",";
+    reply += command_table[i].name;
+  }
+  out.println(reply);
+}
+
 /* ----------------------------------------------------- 
   Setup 
 ----------------------------------------------------- */
@@ -502,6 +885,14 @@ CommandEntry command_table[] = {
   {"id", id},
   {"probe", temp_probe},
   {"TP", bb_path},
+  {"TPavg", bb_path_avg},
+  {"binary", binary},
+  {"timestamps", timestamps},
+  {"sweep", sweep},
+  {"checksum", checksum_mode},
+  {"adcconfig", adc_config},
+  {"stream", stream},
+  {"hello", hello},
   {NULL, NULL}
 };
 
@@ -536,10 +927,11 @@ void setup() {
   pinMode(PIN_DOUT, INPUT_PULLUP);
   pinMode(PIN_RDYB, INPUT);
 
-  Serial.begin(9600);
+  Serial.begin(BAUD_RATE);
 }
 
 void loop() {
+  stream_step();
   if (Serial.available() == 0) return;
 
   String line = Serial.readStringUntil('\n');
@@ -556,7 +948,7 @@ void loop() {
     }
   }
   if (!found) { 
-    Serial.println("ERROR: Unknown command\n");
+    out.println("ERROR: Unknown command\n");
     return;
   }
 }
\ No newline at end of file
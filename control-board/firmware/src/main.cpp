@@ -99,6 +99,44 @@
 
 const String allTM = "abcd";
 
+// ADC settings of every channel on every TM board, set with adcconfig. The defaults
+// are what the AD7718 has after a reset, a 19.8 Hz conversion rate with chopping.
+#define FILTER_DEFAULT 0x45
+#define FILTER_MIN_CHOP 13
+#define FILTER_MIN_NO_CHOP 3
+uint8_t channel_filter[4][8];
+bool channel_chop[4][8];
+uint8_t adc_filter[4] = {FILTER_DEFAULT, FILTER_DEFAULT, FILTER_DEFAULT, FILTER_DEFAULT}; // what each REG_FILTER holds
+int selected_board = 0; // set by board_select
+
+// Heater duty cycle of every TM board, set with heater. The heater pins have no
+// hardware PWM and switch solid state relays, so each heater is on for duty % of
+// every HEATER_WINDOW instead.
+#define HEATER_WINDOW 2000 // ms
+const uint8_t heater_pins[4] = {PIN_HEATER_1, PIN_HEATER_2, PIN_HEATER_3, PIN_HEATER_4};
+uint8_t heater_duty[4] = {0, 0, 0, 0}; // % on
+unsigned long heater_window_start = 0;
+
+// Switches every heater on or off for its part of the current window,
+// called from loop(), between channels and while waiting so the duty cycle keeps running
+void heater_step() {
+  unsigned long elapsed = millis() - heater_window_start;
+  if (elapsed >= HEATER_WINDOW) {
+    heater_window_start += (elapsed / HEATER_WINDOW) * HEATER_WINDOW;
+    elapsed %= HEATER_WINDOW;
+  }
+  for (uint8_t i=0; i<4; i++) {
+    bool on = elapsed < (unsigned long)heater_duty[i] * HEATER_WINDOW / 100;
+    digitalWrite(heater_pins[i], on ? HIGH : LOW);
+  }
+}
+
+// delay() that keeps the heaters switching
+void wait_heaters(unsigned long ms) {
+  unsigned long start = millis();
+  while (millis() - start < ms) heater_step();
+}
+
 /* ----------------------------------------------------- 
   Parsing Functions
 ----------------------------------------------------- */
@@ -243,6 +281,7 @@ void rst() {
   digitalWrite(PIN_RST_B, LOW);
   delayMicroseconds(100);
   digitalWrite(PIN_RST_B, HIGH);
+  for (uint8_t b=0; b<4; b++) adc_filter[b] = FILTER_DEFAULT;
   
   // Setup IO control to set P1 and P2 to inputs
   // they are unconnected on the board and unused
@@ -291,8 +330,14 @@ void calibrate_channel(unsigned char channel_flag, String channel_name){
 }
 
 unsigned long read_channel(unsigned char channel_id) {
+  byte i = channel_id - 1;
+  if (channel_filter[selected_board][i] != adc_filter[selected_board]) {
+    write_register(REG_FILTER, channel_filter[selected_board][i], 8);
+    adc_filter[selected_board] = channel_filter[selected_board][i];
+  }
   // write_register(REG_MODE, MODE_NEGBUF | MODE_REFSEL | MODE_CONTINUOUS_CONVERSION, 8); <- REFSEL results in bad range, ie results are clamped.
-  write_register(REG_MODE, MODE_NEGBUF | MODE_CONTINUOUS_CONVERSION, 8);
+  // setting CHOPB turns chopping off
+  write_register(REG_MODE, MODE_NEGBUF | MODE_CONTINUOUS_CONVERSION | (channel_chop[selected_board][i] ? 0 : MODE_CHOPB), 8);
 
   write_register(REG_ADC_CONTROL, ((channel_id - 1)<<4) | ADC_CONTROL_RANGE_2p56V, 8);
   // unsigned long control_value = read_register(REG_ADC_CONTROL, 8);
@@ -301,6 +346,8 @@ unsigned long read_channel(unsigned char channel_id) {
 
   unsigned long try_count = 0;
   while(true) {
+    // a slow filter word can keep this polling for a good part of the heater window
+    heater_step();
     unsigned long status_value = read_register(REG_STATUS, 8);
     if (status_value & STATUS_RDY) break;
     try_count++;
@@ -377,6 +424,7 @@ int board_select(char board) {
       return -1;
       break;
   }
+  selected_board = board - 'a';
   delay(10);
   return 0;
 }
@@ -400,7 +448,7 @@ int probe_select(byte i) {
       return -1;
       break;
   }
-  delay(320);
+  wait_heaters(320);
   return 0;
 }
 
@@ -540,6 +588,9 @@ void measure(Command cmd) {
     if (board_select(board) == -1) continue;
 
     for (uint8_t j=0; j<cmd.nargs; j++) {
+      // keep the heaters switching through a long measure
+      heater_step();
+
       //measure specified channels
       byte channel_id = cmd.args[j].toInt();
 
@@ -556,6 +607,48 @@ void measure(Command cmd) {
   Serial.println(F("MEASURE COMPLETE\n"));
 }
 
+// Ex: "adcconfig -ab 45 ON" sets every channel of boards a and b, "adcconfig 0D OFF 1 2"
+// channels 1 and 2 of every board. The filter word SF (hex) sets the conversion rate,
+// 32768 / (3 * 8 * SF) Hz with chopping and 32768 / (8 * SF) Hz without.
+void adc_config(Command cmd) {
+  if (cmd.nargs < 2) {
+    Serial.println(F("ERROR: No ADC config selected. Ex: adcconfig -a 45 ON 1 2"));
+    return;
+  }
+
+  uint8_t sf = hex2char(cmd.args[0]);
+  String chop = cmd.args[1];
+  chop.toUpperCase();
+  if (chop != "ON" && chop != "OFF") {
+    Serial.println(F("ERROR: Invalid chop state selected. Choices: on, off"));
+    return;
+  }
+  if (sf < (chop == "ON" ? FILTER_MIN_CHOP : FILTER_MIN_NO_CHOP)) {
+    Serial.println(F("ERROR: Filter word too small for this chop state"));
+    return;
+  }
+
+  if (cmd.flag == "") cmd.flag = allTM;
+  for (uint8_t i=0; i<cmd.flag.length(); i++) {
+    char board = cmd.flag.charAt(i);
+    if (board < 'a' || board > 'd') {
+      Serial.println(F("ERROR: Invalid board selected"));
+      continue;
+    }
+    for (byte channel_id=1; channel_id<=8; channel_id++) {
+      // no channels means all of them
+      bool selected = (cmd.nargs == 2);
+      for (uint8_t j=2; j<cmd.nargs; j++) {
+        if (cmd.args[j].toInt() == channel_id) selected = true;
+      }
+      if (!selected) continue;
+      channel_filter[board - 'a'][channel_id - 1] = sf;
+      channel_chop[board - 'a'][channel_id - 1] = (chop == "ON");
+    }
+  }
+  Serial.println(F("ADC CONFIG COMPLETE\n"));
+}
+
 void status(Command cmd) {
   //Serial.println("Status...");
   multi_read(cmd.flag, "Status", REG_STATUS, 8);
@@ -653,13 +746,14 @@ void temp_probe(Command cmd){
       }
       float temperatureC = rawValue * 0.0625;
       Serial.println("  " + String(temperatureC) + " °C");
-      delay(1000);
+      wait_heaters(1000);
     }
     Serial.println("\n");
   }
   Serial.println(F("TEMP PROBE READ COMPLETE\n"));
 }
 
+// Ex: "heater -a on", "heater off" or "heater -bc 35" for 35 % of the time
 void heater(Command cmd){
   //Serial.println("Heater...");
   if (cmd.nargs == 0) {
@@ -669,39 +763,32 @@ void heater(Command cmd){
 
   String state = cmd.args[0];
   state.toUpperCase();
-  if (state != "ON" && state != "OFF") {
-    Serial.println("ERROR: Invalid heater state selected.");
-    return;
+  int duty;
+  if (state == "ON") {
+    duty = 100;
+  } else if (state == "OFF") {
+    duty = 0;
+  } else {
+    duty = state.toInt();
+    // toInt() is 0 for anything that is not a number
+    if (duty < 0 || duty > 100 || (duty == 0 && state != "0")) {
+      Serial.println("ERROR: Invalid heater state selected. Choices: on, off, 0-100");
+      return;
+    }
   }
 
   if (cmd.flag == "") cmd.flag = allTM;
 
-  byte control = (state == "ON") ? HIGH : LOW;
-
   for (uint8_t i=0; i<cmd.flag.length(); i++){
     char board = cmd.flag.charAt(i);
     
     // skip itteration if invalid board
     if (board_select(board) == -1) continue;
 
-    switch (board){
-      case 'a':
-        digitalWrite(PIN_HEATER_1, control);
-        break;
-      case 'b':
-        digitalWrite(PIN_HEATER_2, control);
-        break;
-      case 'c':
-        digitalWrite(PIN_HEATER_3, control);
-        break;
-      case 'd':
-        digitalWrite(PIN_HEATER_4, control);
-        break;
-      default:
-        break;
-    }
+    heater_duty[board - 'a'] = duty;
     Serial.println("Heater " + String(board) + " " + state);
   }
+  heater_step();
   Serial.println(F("HEATER TOGGLE COMPLETE\n"));
 }
 
@@ -795,9 +882,18 @@ CommandEntry command_table[] = {
   {"current", current},
   {"enable", enable},
   {"select", select},
+  {"adcconfig", adc_config},
+  {NULL, NULL}
 };
 
 void setup() {
+  for (uint8_t b=0; b<4; b++) {
+    for (uint8_t c=0; c<8; c++) {
+      channel_filter[b][c] = FILTER_DEFAULT;
+      channel_chop[b][c] = true;
+    }
+  }
+
   pinMode(PIN_DOUT, INPUT_PULLUP);
 
   pinMode(PIN_CLK, OUTPUT);
@@ -836,6 +932,7 @@ void setup() {
   Main Logic Loop 
 ----------------------------------------------------- */
 void loop() {
+  heater_step();
   if (Serial.available() == 0) return;
 
   String line = Serial.readStringUntil('\n');
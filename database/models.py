@@ -1,6 +1,6 @@
 from typing import List
 from sqlalchemy import ForeignKey, ForeignKeyConstraint
-from sqlalchemy import String, Integer, Float, DateTime
+from sqlalchemy import String, Integer, Float, DateTime, Boolean
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import mapped_column, relationship, Mapped, DeclarativeBase
 from sqlalchemy.types import LargeBinary
@@ -8,6 +8,9 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime
 
 PROBE_SENSOR_NAMES = ["p1", "p2", "p3"]
+# nominal PT1000 curve, only used where the module's calibration is not needed
+PT_R0 = 1000 # ohms at 0 C
+PT_ALPHA = 0.00385 # per C
 
 def create_all(engine) -> None:
     """
@@ -63,7 +66,7 @@ class Data(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     run_id: Mapped[int] = mapped_column(ForeignKey("run.id"), nullable=False, index=True)
     control_board_id: Mapped[int] = mapped_column(ForeignKey("control_board.id"), nullable=True)
-    control_board_position: Mapped[int] = mapped_column(Integer, nullable=True)
+    control_board_position: Mapped[str] = mapped_column(String(1), nullable=True) # A-D, like the run config
     module_id: Mapped[int] = mapped_column(ForeignKey("module.id"), index=True, nullable=False)
     module_orientation: Mapped[str] = mapped_column(String(50), nullable=True) # up or down, relative to the beam pipe
     plate_position: Mapped[int] = mapped_column(Integer, nullable=True) # 1, 2, 3, 4, etc...
@@ -71,6 +74,7 @@ class Data(Base):
     sensor: Mapped[str] = mapped_column(String(50), nullable=False)
     timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     raw_adc: Mapped[str] = mapped_column(String(50))
+    frame_id: Mapped[int] = mapped_column(ForeignKey("sweep_frame.id"), index=True, nullable=True) # null for data from before frames
 
     @hybrid_property
     def volts(self) -> float:
@@ -81,21 +85,42 @@ class Data(Base):
 
     @hybrid_property
     def ohms(self) -> float:
+        """None for a saturated or garbage code, the divider has no resistance for it"""
         if self.sensor.lower() in PROBE_SENSOR_NAMES:
             return None
-        return 1E3 / (5 / self.volts - 1)
+        volts = self.volts
+        if not 0 < volts < 5:
+            return None
+        return 1E3 / (5 / volts - 1)
     
+    @hybrid_property
+    def probe_celcius(self) -> float:
+        if self.sensor.lower() not in PROBE_SENSOR_NAMES:
+            return None
+        int_value = int(self.raw_adc, 16)
+        # Shift right by 3 bits (ignoring the 3 least significant bits)
+        int_value >>= 3
+        # Check if the 12th bit is set for sign and 2's complement adjustment
+        if int_value & 0x1000:
+            int_value -= 0x2000
+        return int_value * 0.0625
+
+    @hybrid_property
+    def nominal_celcius(self) -> float:
+        """Without the module's calibration, close enough to tell how fast the temperature changes"""
+        if self.sensor.lower() in PROBE_SENSOR_NAMES:
+            return self.probe_celcius
+        if (ohms := self.ohms) is None:
+            return None
+        return (ohms / PT_R0 - 1) / PT_ALPHA
+
     @hybrid_property
     def celcius(self) -> float:
         value_to_convert = self.ohms
         if self.sensor.lower() in PROBE_SENSOR_NAMES:
-            int_value = int(self.raw_adc, 16)
-            # Shift right by 3 bits (ignoring the 3 least significant bits)
-            int_value >>= 3
-            # Check if the 12th bit is set for sign and 2's complement adjustment
-            if int_value & 0x1000:
-                int_value -= 0x2000
-            value_to_convert = int_value * 0.0625
+            value_to_convert = self.probe_celcius
+        if value_to_convert is None:
+            return None
         
         calib_map = self.module.calib_map()
         calib_sensor = calib_map[self.sensor]
@@ -107,6 +132,7 @@ class Data(Base):
     module: Mapped["Module"] = relationship(back_populates="data")
     run: Mapped["Run"] = relationship(back_populates="data")
     control_board: Mapped["ControlBoard"] = relationship(back_populates="data")
+    frame: Mapped["SweepFrame"] = relationship(back_populates="data")
 
     def __repr__(self) -> str:
         return f"Data(id={self.id!r}, module_id={self.module_id!r}, sensor={self.sensor!r}, timestamp={self.timestamp!r}, raw_adc={self.raw_adc!r}, voltage={self.volts!r}, resistance={self.ohms!r}, temperature={self.celcius!r})"
@@ -122,7 +148,9 @@ class BbResistancePathData(Base):
     ref_resistor_value: Mapped[float] = mapped_column(Float, nullable=False)
     path_id: Mapped[int] = mapped_column(Integer, nullable=False)
     timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True))
-    raw_voltage: Mapped[float] = mapped_column(Float)
+    raw_voltage: Mapped[float] = mapped_column(Float) # mean of the samples when the firmware averaged them
+    raw_voltage_std: Mapped[float] = mapped_column(Float, nullable=True) # null for a single read
+    samples: Mapped[int] = mapped_column(Integer, nullable=True) # analog reads averaged, null for a single read
 
     run: Mapped["Run"] = relationship(back_populates="bb_resistance_path_data")
     module: Mapped["Module"] = relationship(back_populates="bb_resistance_path_data")
@@ -133,6 +161,13 @@ class BbResistancePathData(Base):
             return 0
         return self.raw_voltage * self.ref_resistor_value / (3.3 - self.raw_voltage)
 
+    @hybrid_property
+    def ohms_std(self) -> float:
+        """Spread of the single reads in ohms, from the slope of ohms at the mean voltage"""
+        if self.raw_voltage_std is None or self.raw_voltage == 3.3:
+            return None
+        return self.raw_voltage_std * self.ref_resistor_value * 3.3 / (3.3 - self.raw_voltage)**2
+
 class Run(Base):
     __tablename__ = "run"
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -145,6 +180,9 @@ class Run(Base):
     bb_resistance_path_data: Mapped[List["BbResistancePathData"]] = relationship(back_populates="run")
 
     notes: Mapped[List["RunNote"]] = relationship(back_populates="run")
+    adc_settings: Mapped[List["AdcSetting"]] = relationship(back_populates="run")
+    frames: Mapped[List["SweepFrame"]] = relationship(back_populates="run")
+    heater_logs: Mapped[List["HeaterLog"]] = relationship(back_populates="run")
 
     def __repr__(self) -> str:
         return f"Run(id={self.id!r}, mode={self.mode!r}), comment={self.comment!r}"
@@ -160,6 +198,79 @@ class RunNote(Base):
     run: Mapped["Run"] = relationship(back_populates="notes")
 
 
+class AdcSetting(Base):
+    """
+    ADC conversion settings used during a run, a new row every time they are set
+    so data can be matched with the settings it was taken with by timestamp
+    """
+    __tablename__ = "adc_setting"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    run_id: Mapped[int] = mapped_column(ForeignKey("run.id"), nullable=False, index=True)
+    control_board_id: Mapped[int] = mapped_column(ForeignKey("control_board.id"), nullable=True)
+    control_board_position: Mapped[str] = mapped_column(String(1), nullable=True) # A-D, null is every board on the port
+    sensor: Mapped[str] = mapped_column(String(50), nullable=True) # null is every channel
+    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    profile: Mapped[str] = mapped_column(String(50), nullable=True) # fast, default, low_noise, null if set by hand
+    filter_word: Mapped[int] = mapped_column(Integer, nullable=False) # SF, REG_FILTER of the AD7718
+    chop: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    conversion_rate: Mapped[float] = mapped_column(Float, nullable=False) # Hz
+
+    run: Mapped["Run"] = relationship(back_populates="adc_settings")
+    control_board: Mapped["ControlBoard"] = relationship()
+
+    def __repr__(self) -> str:
+        return f"AdcSetting(id={self.id!r}, run_id={self.run_id!r}, sensor={self.sensor!r}, profile={self.profile!r}, filter_word={self.filter_word!r}, chop={self.chop!r}, conversion_rate={self.conversion_rate!r})"
+
+
+class SweepFrame(Base):
+    """
+    One read of a module, a sweep line or the replies to one command. Every
+    Data row points at the frame it was read in, so the sensors of one sweep
+    can be lined up by frame_id instead of by timestamp. Sensors and probes are
+    read on their own intervals, so they are in frames of their own kind
+    """
+    __tablename__ = "sweep_frame"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    run_id: Mapped[int] = mapped_column(ForeignKey("run.id"), nullable=False, index=True)
+    module_id: Mapped[int] = mapped_column(ForeignKey("module.id"), nullable=False, index=True)
+    kind: Mapped[str] = mapped_column(String, nullable=True) # sensors, probes, sweep (both) or stream, null for frames from before it was stored
+    seq: Mapped[int] = mapped_column(Integer, nullable=True) # the firmware's sweep count, null for frames it did not number
+    start_time: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False) # command sent or sweep line read
+    end_time: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True) # last reading saved
+
+    run: Mapped["Run"] = relationship(back_populates="frames")
+    module: Mapped["Module"] = relationship()
+    data: Mapped[List["Data"]] = relationship(back_populates="frame")
+
+    def __repr__(self) -> str:
+        return f"SweepFrame(id={self.id!r}, run_id={self.run_id!r}, module_id={self.module_id!r}, kind={self.kind!r}, seq={self.seq!r}, start_time={self.start_time!r}, end_time={self.end_time!r})"
+
+
+class HeaterLog(Base):
+    """
+    Every setpoint change and every output of the heater loop of a module, see
+    software/heater.py. A row with a temperature is an update of the loop, one
+    without is the setpoint being changed or the heater being turned off
+    """
+    __tablename__ = "heater_log"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    run_id: Mapped[int] = mapped_column(ForeignKey("run.id"), nullable=False, index=True)
+    module_id: Mapped[int] = mapped_column(ForeignKey("module.id"), nullable=False, index=True)
+    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    sensor: Mapped[str] = mapped_column(String(50), nullable=False) # the sensor held at the setpoint
+    setpoint: Mapped[float] = mapped_column(Float, nullable=True) # C, null once the loop is stopped
+    temperature: Mapped[float] = mapped_column(Float, nullable=True) # C, the reading the output was worked out from
+    duty: Mapped[float] = mapped_column(Float, nullable=False) # % of the time the heater is on
+
+    run: Mapped["Run"] = relationship(back_populates="heater_logs")
+    module: Mapped["Module"] = relationship()
+
+    def __repr__(self) -> str:
+        return f"HeaterLog(id={self.id!r}, run_id={self.run_id!r}, module_id={self.module_id!r}, sensor={self.sensor!r}, setpoint={self.setpoint!r}, temperature={self.temperature!r}, duty={self.duty!r})"
+
+
 class ColdPlate(Base):
     """
     Defines all the module positions on the plate / wedge / dee etc...
@@ -4,18 +4,25 @@ This widget is used to readout the bump bonds and plot
 import PySide6.QtWidgets as qtw
 import pyqtgraph as pg
 from PySide6.QtCore import Slot, QTimer, Qt, Signal
-from firmware_interface import ModuleFirmwareInterface
-from com_port import ComPort
+from firmware_interface import ModuleFirmwareInterface, BbStats
+from com_port import RawLine
+from dispatcher import MessageDispatcher
+from transactions import TransactionManager
+from scheduler import AdaptiveScheduler
+from db_writer import BufferedWriter
 from datetime import datetime, timezone
 import time
 from database import models as dm
 from sqlalchemy.orm import scoped_session
 from sqlalchemy import select
 from run_config import ModuleConfig
+from functools import partial
+
+BB_REPLY_TIMEOUT = 1_500 # ms per path, the firmware waits 820 ms per path
 
 class BumpBondMonitor(qtw.QFrame):
 
-    def __init__(self, name: str, run: dm.Run, module_config: ModuleConfig, bb_path_ids: list[str], firmware: ModuleFirmwareInterface, com_port: ComPort, timer: QTimer, db_session: scoped_session):
+    def __init__(self, name: str, run: dm.Run, module_config: ModuleConfig, bb_path_ids: list[str], firmware: ModuleFirmwareInterface, dispatcher: MessageDispatcher, transactions: TransactionManager, scheduler: AdaptiveScheduler, timer: QTimer, db_session: scoped_session, writer: BufferedWriter):
         """
         bb_path_ids: are the ids that is used to input into the firmware. EX: TP 1, 1 is the bb_path_id
         """
@@ -39,11 +46,12 @@ class BumpBondMonitor(qtw.QFrame):
         self.module_config = module_config
         self.bb_path_ids = bb_path_ids
         self.firmware = firmware
-        self.com_port = com_port
-        self.timer = timer
+        self.dispatcher = dispatcher
+        self.transactions = transactions
+        self.scheduler = scheduler
+        self.timer = timer # redraws the plot
         self.session = db_session
-
-        self.measurement_pendings = {bb_id: False for bb_id in bb_path_ids}
+        self.writer = writer # readings are written in batches
 
         # layout with a button and empty plot that can hide/show
         self.main_layout = qtw.QVBoxLayout(self)
@@ -74,52 +82,56 @@ class BumpBondMonitor(qtw.QFrame):
 
         # READ AND SAVE SIGNAL/SLOTS
         #self.write[str].connect(self.com_port._write)
-        self.com_port.read[str].connect(self.save)
+        position = self.module_config.control_board_position if self.firmware.supports_board_positions else None
+        self.dispatcher.subscribe(self.save, "bb", self.bb_path_ids, position)
 
-        self.timer.timeout.connect(self.write_bb)
+        # every path is read at its own rate, faster while its resistance is changing
+        for bb_path in self.bb_path_ids:
+            self.scheduler.add_group(
+                self.group_name(bb_path),
+                partial(self.write_bb, [bb_path]),
+                int(self.module_config.bb_interval * 1000),
+                self.module_config.bb_transient_threshold,
+                int(self.module_config.fast_interval * 1000)
+            )
         self.timer.timeout.connect(self.update_plot)
 
+    def group_name(self, bb_path: int) -> str:
+        return f"{self.name} TP{bb_path}"
+
     def toggle_show(self):
         self.bb_resistance_plot.setVisible(not self.bb_resistance_plot.isVisible())
 
-    def save(self, raw_output: str):
-        # will need to extract bb id
-        # will need to extract raw_adc from it
-        data = self.firmware.read_bb(raw_output)
-        if not data:
-            return
-    
-        bb_path_id, value = data
-        if bb_path_id not in self.bb_path_ids:
-            return
-
-        # convert to resistance?  yea but for now just do voltage
-        self.measurement_pendings[bb_path_id] = False
-
-        db_data = dm.BbResistancePathData(
-            run = self.run,
-            module = self.module_config.module,
-            module_orientation = self.module_config.orientation,
-            plate_position = self.module_config.cold_plate_position,
-            path_id = bb_path_id,
-            timestamp = datetime.now(timezone.utc),
-            ref_resistor_value = self.module_config.reference_resistors[bb_path_id],
-            raw_voltage = float(value)
-        )
-    
-        self.session.add(db_data)
-        self.session.commit()
-
-    def write_bb(self):
-        if all(self.measurement_pendings.values()):
-            # Make sure you have read all values before trying to read bumps again
-            return
-        command = self.firmware.write_bbs(self.bb_path_ids)
-        for bb_id in self.bb_path_ids:
-            self.measurement_pendings[bb_id] = True
-
-        self.com_port._write(command)
-        return command
+    @Slot(list)
+    def save(self, lines: list[RawLine]):
+        """Saves the bump bond readings the dispatcher routed to this monitor"""
+        for line in lines:
+            bb_path_id, value = line.parsed.channel, line.parsed.value
+            # averaged on the board, or a single read
+            stats = value if isinstance(value, BbStats) else None
+
+            # convert to resistance?  yea but for now just do voltage
+            self.transactions.reply(self.name, bb_path_id)
+
+            db_data = dm.BbResistancePathData(
+                run = self.run,
+                module = self.module_config.module,
+                module_orientation = self.module_config.orientation,
+                plate_position = self.module_config.cold_plate_position,
+                path_id = bb_path_id,
+                timestamp = line.timestamp,
+                ref_resistor_value = self.module_config.reference_resistors[bb_path_id],
+                raw_voltage = stats.mean if stats else float(value),
+                raw_voltage_std = stats.std if stats else None,
+                samples = stats.n if stats else None
+            )
+            self.writer.add(db_data)
+            self.scheduler.observe(self.group_name(bb_path_id), bb_path_id, line.timestamp, db_data.ohms)
+
+    def write_bb(self, bb_path_ids: list[int] | None = None):
+        # paths still waiting on a reply are left out, the transaction manager retries them
+        write_bbs = partial(self.firmware.write_bbs, samples=self.module_config.bb_samples)
+        return self.transactions.request(self.name, bb_path_ids or self.bb_path_ids, write_bbs, BB_REPLY_TIMEOUT)
     
     def update_plot(self):
         # this should fetch whatever is in the db and plot it periodically
@@ -9,6 +9,7 @@ from datetime import datetime
 import numpy as np
 import pyqtgraph as pg
 from com_port import ComPort
+from serial_log import SerialLogView
 from module import ModuleController, Sensor
 import firmware_interface as fw
 
@@ -19,6 +20,7 @@ firmware_interface = fw.ThermalMockupV2()
 MODULE_WRITE_TIMER = 1500
 COM_PORT_TIMER = 500
 UPDATE_PLOT_TIMER = 1500
+SERIAL_LOG_FILE = 'calibrate_serial.log'
 
 def is_float(string):
     try:
@@ -282,8 +284,7 @@ class MainWindow(qtw.QMainWindow):
         readout_info_layout.addWidget(self.OhmTimePlot, stretch=1)
 
         # >>  SERIAL MONITOR
-        self.serial_display = qtw.QPlainTextEdit()
-        self.serial_display.setReadOnly(True)
+        self.serial_display = SerialLogView(SERIAL_LOG_FILE)
         readout_info_layout.addWidget(self.serial_display, stretch=0)
 
         main_layout.addWidget(readout_info)
@@ -311,7 +312,7 @@ class MainWindow(qtw.QMainWindow):
         #----------CONNECTING SIGNALS AND SLOTS FOR EXTERNAL WIDGETS------------#
         # REMEMBER: Widget.Signal.connect(Slot)
         self.com_port.log_message[str].connect(self.log) 
-        self.com_port.read[str].connect(self.log)
+        self.com_port.read[str].connect(self.serial_display.log_line)
 
         self.module.write[str].connect(self.com_port._write)
         self.com_port.read[str].connect(self.module.read_sensor)
@@ -402,11 +403,12 @@ class MainWindow(qtw.QMainWindow):
 
     @Slot(str)
     def log(self, text: str) -> None:
-        self.serial_display.appendPlainText(text)
+        self.serial_display.log_event(text)
 
     @Slot()
     def _close(self) -> None:
         self.com_port.disconnect_port()
+        self.serial_display.close_log_file()
         self.close()
 
 def main():
@@ -0,0 +1,119 @@
+"""
+Records every line read from a serial port to a compact append-only file,
+and plays a recording back into a ComPort as if it had just come over the wire.
+
+File layout: CAPTURE_MAGIC then one record per line
+    ARRIVAL (float64, unix seconds) | LENGTH (uint16) | TEXT (utf-8)
+"""
+from PySide6.QtCore import QObject, Signal, Slot, QTimer
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+import struct
+import time
+from com_port import ComPort, RawLine
+
+CAPTURE_MAGIC = b"TMCAP1\n"
+CAPTURE_RECORD = struct.Struct("<dH")
+REPLAY_BATCH = 200 # lines emitted per event loop turn when replaying as fast as possible
+
+class CaptureWriter:
+    """Appends lines to a capture file, a new file gets the header first"""
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(CAPTURE_MAGIC)
+        self.lines_written = 0
+
+    def write(self, lines: list[RawLine]) -> None:
+        for line in lines:
+            text = line.text.encode()[:0xFFFF]
+            self.file.write(CAPTURE_RECORD.pack(line.timestamp.timestamp(), len(text)) + text)
+        # flushed every batch so a crash only loses what is still in the port
+        self.file.flush()
+        self.lines_written += len(lines)
+
+    def close(self) -> None:
+        self.file.close()
+
+def read_capture(path: str) -> Iterator[RawLine]:
+    """Yields the captured lines in order, a record cut short by a crash ends the file"""
+    with open(path, "rb") as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a serial capture file")
+        while True:
+            header = file.read(CAPTURE_RECORD.size)
+            if len(header) < CAPTURE_RECORD.size:
+                return
+            arrival, length = CAPTURE_RECORD.unpack(header)
+            text = file.read(length)
+            if len(text) < length:
+                return
+            yield RawLine(text.decode(errors="replace"), datetime.fromtimestamp(arrival, timezone.utc))
+
+class CaptureReplay(QObject):
+    """
+    Signals: log_message, finished \n
+    Emits a capture through com_port's read, read_batch and received signals.
+    speed scales the original timing (1 is real time, 10 is ten times faster),
+    0 replays as fast as the event loop allows. Lines keep their captured timestamps.
+    """
+    log_message = Signal(str)
+    finished = Signal()
+
+    def __init__(self, path: str, com_port: ComPort, speed: float = 1.0):
+        super(CaptureReplay, self).__init__()
+        self.path = path
+        self.com_port = com_port
+        self.speed = speed
+        self.lines = read_capture(path)
+        self.next_line: Optional[RawLine] = None
+        self.lines_replayed = 0
+
+        self.first_arrival = None
+        self.started_at = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.replay_due)
+
+    def start(self) -> None:
+        self.next_line = next(self.lines, None)
+        if self.next_line is None:
+            self.log_message.emit(f"Nothing to replay in {self.path}")
+            self.finished.emit()
+            return
+        self.first_arrival = self.next_line.timestamp.timestamp()
+        self.started_at = time.monotonic()
+        self.log_message.emit(f"Replaying {self.path}")
+        self.timer.start(0)
+
+    def stop(self) -> None:
+        self.timer.stop()
+        self.next_line = None
+
+    def _due_in(self, line: RawLine) -> float:
+        """Seconds until this line should be emitted"""
+        if not self.speed:
+            return 0
+        offset = (line.timestamp.timestamp() - self.first_arrival) / self.speed
+        return offset - (time.monotonic() - self.started_at)
+
+    @Slot()
+    def replay_due(self) -> None:
+        batch = []
+        parser = self.com_port.parser
+        while self.next_line is not None and self._due_in(self.next_line) <= 0:
+            line = self.next_line
+            batch.append(line._replace(parsed=parser(line.text) if parser is not None else None))
+            self.next_line = next(self.lines, None)
+            if len(batch) >= REPLAY_BATCH:
+                break
+        self.lines_replayed += len(batch)
+        self.com_port._emit_lines(batch)
+
+        if self.next_line is None:
+            self.log_message.emit(f"Replayed {self.lines_replayed} lines from {self.path}")
+            self.finished.emit()
+            return
+        self.timer.start(max(0, int(self._due_in(self.next_line) * 1000)))
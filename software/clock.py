@@ -0,0 +1,80 @@
+"""
+Timestamps for serial lines. Lines are stamped with a monotonic host clock the
+moment they are read, and converted to UTC with one fixed offset so NTP steps
+during a run cannot reorder samples. When the firmware reports its own millis()
+those are mapped onto the host clock instead, with drift correction.
+"""
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import time
+
+# wall clock at monotonic zero, taken once so every conversion uses the same offset
+_UTC_AT_MONOTONIC_ZERO = datetime.now(timezone.utc) - timedelta(seconds=time.monotonic())
+
+CLOCK_HISTORY = 256 # device/host pairs kept for the fit
+CLOCK_REFIT = 16 # refit after this many new pairs
+MILLIS_WRAP = 2**32 # millis() is an unsigned long
+REBOOT_JUMP = 60_000 # ms, millis going back further than this means the board restarted
+MIN_FIT_SPAN = 10 # s of device time needed before the drift is trusted
+MAX_DRIFT = 0.01 # arduino resonators are good to about 0.5 %
+
+def monotonic_to_utc(monotonic: float) -> datetime:
+    return _UTC_AT_MONOTONIC_ZERO + timedelta(seconds=monotonic)
+
+class DeviceClock:
+    """
+    Maps the firmware's millis() onto time.monotonic().
+    A line arrives some unknown (but never negative) latency after it was stamped,
+    so the slope of a least squares fit gives the drift between the two crystals
+    and the line is then lowered until it touches the earliest arrivals.
+    """
+    def __init__(self):
+        self.pairs: deque[tuple[float, float]] = deque(maxlen=CLOCK_HISTORY) # (device s, host s)
+        self.offset = None
+        self.rate = 1.0 # host seconds per device second
+        self.last_millis = None
+        self.wraps = 0
+        self.resets = 0
+        self._since_fit = 0
+
+    def reset(self) -> None:
+        self.pairs.clear()
+        self.offset = None
+        self.rate = 1.0
+        self.last_millis = None
+        self.wraps = 0
+        self._since_fit = 0
+
+    def _unwrap(self, millis: int) -> float:
+        if self.last_millis is not None and millis < self.last_millis:
+            if self.last_millis - millis > MILLIS_WRAP // 2:
+                self.wraps += 1
+            elif self.last_millis - millis > REBOOT_JUMP:
+                # the board rebooted, the old pairs no longer apply
+                self.reset()
+                self.resets += 1
+        self.last_millis = millis
+        return (millis + self.wraps * MILLIS_WRAP) / 1000
+
+    def to_host(self, millis: int, arrival: float) -> float:
+        """Adds a sample and returns the monotonic host time the device stamped it at"""
+        device = self._unwrap(millis)
+        self.pairs.append((device, arrival))
+        self._since_fit += 1
+        if self.offset is None or self._since_fit >= CLOCK_REFIT:
+            self._fit()
+        else:
+            # keep the line under every arrival between fits
+            self.offset = min(self.offset, arrival - self.rate * device)
+        return self.offset + self.rate * device
+
+    def _fit(self) -> None:
+        self._since_fit = 0
+        n = len(self.pairs)
+        mean_device = sum(d for d, _ in self.pairs) / n
+        mean_host = sum(h for _, h in self.pairs) / n
+        spread = sum((d - mean_device) ** 2 for d, _ in self.pairs)
+        if self.pairs[-1][0] - self.pairs[0][0] >= MIN_FIT_SPAN:
+            rate = sum((d - mean_device) * (h - mean_host) for d, h in self.pairs) / spread
+            self.rate = min(max(rate, 1 - MAX_DRIFT), 1 + MAX_DRIFT)
+        self.offset = min(h - self.rate * d for d, h in self.pairs)
@@ -1,32 +1,267 @@
 import PySide6.QtWidgets as qtw
 from PySide6.QtSerialPort import QSerialPort, QSerialPortInfo
-from PySide6.QtCore import Signal, Slot, QIODevice, QTextStream, QTimer
+from PySide6.QtCore import Signal, Slot, QIODevice, QTimer, QObject, QThread, Qt
+from datetime import datetime
+import os
+import re
+import time
+from typing import Any, Callable, NamedTuple, Optional
+from clock import DeviceClock, monotonic_to_utc
+from framing import LineFramer
+
+# "ready_read" drains the port every time Qt says bytes arrived,
+# "poll" keeps the old behaviour of checking on a QTimer
+READ_MODE_READY_READ = "ready_read"
+READ_MODE_POLL = "poll"
+
+DEFAULT_BAUD_RATE = 9600
+
+# errors after which the port has to be reopened, like the cable being pulled
+FATAL_PORT_ERRORS = (
+    QSerialPort.SerialPortError.ResourceError,
+    QSerialPort.SerialPortError.DeviceNotFoundError,
+    QSerialPort.SerialPortError.PermissionError,
+)
+
+# firmware with "timestamps on" ends readings with " @<millis>"
+DEVICE_TIMESTAMP = re.compile(r"^(.*) @(\d+)$")
+
+class RawLine(NamedTuple):
+    """One line read from the serial port"""
+    text: str
+    timestamp: datetime # UTC, from the device clock when it sent one, otherwise the arrival
+    parsed: Any = None # output of the port's parser, None if it did not match
+    arrival: Optional[float] = None # time.monotonic() when the bytes were read
+    device_ms: Optional[int] = None # the firmware's millis() when it took the reading
+
+def configure_port(port: QSerialPort, baud_rate: int = DEFAULT_BAUD_RATE) -> None:
+    """Serial settings shared by the direct and threaded backends"""
+    port.setBaudRate(baud_rate)
+    port.setDataBits(QSerialPort.DataBits.Data8)
+    port.setFlowControl(QSerialPort.FlowControl.NoFlowControl)
+    port.setParity(QSerialPort.Parity.NoParity)
+    port.setStopBits(QSerialPort.StopBits.OneStop)
+
+def _read_texts(port: QSerialPort, framer: Any = None) -> list[str]:
+    if framer is not None:
+        # the framer keeps any partial frame until the rest arrives
+        return framer.feed(port.readAll().data())
+    texts = []
+    while port.canReadLine():
+        data = port.readLine().data().decode(errors='replace').strip()
+        if data:
+            texts.append(data)
+    return texts
+
+def drain_lines(port: QSerialPort, parser: Optional[Callable[[str], Any]] = None, framer: Any = None, clock: Optional[DeviceClock] = None) -> list[RawLine]:
+    """
+    Reads every complete line in the port buffer, a partial line is left 
+    in the buffer until its newline arrives.
+    """
+    texts = _read_texts(port, framer)
+    # stamped before parsing so slow parsing never shows up in the timestamps
+    arrival = time.monotonic()
+    lines = []
+    for data in texts:
+        device_ms = None
+        host_time = arrival
+        if (match := DEVICE_TIMESTAMP.match(data)):
+            data, device_ms = match.group(1), int(match.group(2))
+            if clock is not None:
+                host_time = clock.to_host(device_ms, arrival)
+        parsed = parser(data) if parser is not None else None
+        lines.append(RawLine(data, monotonic_to_utc(host_time), parsed, arrival, device_ms))
+    return lines
+
+class SerialWorker(QObject):
+    """
+    Owns a QSerialPort on a worker thread so reading never waits on the GUI.
+    Only talk to it through signals, the port is created inside open().
+    """
+    lines_read = Signal(list) # list[RawLine]
+    buffer_depth_changed = Signal(int)
+    log_message = Signal(str)
+    opened = Signal(bool)
+    connection_lost = Signal(str)
+    finished = Signal()
+
+    def __init__(self, port_name: str, parser: Optional[Callable[[str], Any]] = None, framer: Any = None, baud_rate: int = DEFAULT_BAUD_RATE):
+        super(SerialWorker, self).__init__()
+        self.port_name = port_name
+        self.parser = parser
+        self.framer = framer
+        self.baud_rate = baud_rate
+        self.clock = DeviceClock()
+        self.port = None
+
+    @Slot()
+    def open(self) -> None:
+        self.port = QSerialPort(self)
+        self.port.setPortName(self.port_name)
+        configure_port(self.port, self.baud_rate)
+        if not self.port.open(QIODevice.ReadWrite):
+            self.port = None
+            self.log_message.emit(f"Failed to open port: {self.port_name}")
+            self.opened.emit(False)
+            return
+        self.port.clear()
+        self.port.readyRead.connect(self.drain)
+        self.port.errorOccurred.connect(self.check_error)
+        self.log_message.emit(f"Successfully connected to: {self.port_name}")
+        self.opened.emit(True)
+
+    @Slot(QSerialPort.SerialPortError)
+    def check_error(self, error: QSerialPort.SerialPortError) -> None:
+        if error in FATAL_PORT_ERRORS and self.port is not None:
+            message = self.port.errorString()
+            self.port.close()
+            self.port = None
+            self.connection_lost.emit(message)
+
+    @Slot()
+    def drain(self) -> None:
+        if self.port is None:
+            return
+        lines = drain_lines(self.port, self.parser, self.framer, self.clock)
+        self.buffer_depth_changed.emit(self.port.bytesAvailable())
+        if lines:
+            self.lines_read.emit(lines)
+
+    @Slot(object)
+    def set_parser(self, parser: Optional[Callable[[str], Any]]) -> None:
+        self.parser = parser
+
+    @Slot(object)
+    def set_framer(self, framer: Any) -> None:
+        self.framer = framer
+
+    @Slot(bytes)
+    def write(self, data: bytes) -> None:
+        if self.port is not None:
+            self.port.write(data)
+
+    @Slot()
+    def close(self) -> None:
+        if self.port is not None:
+            self.port.close()
+            self.port = None
+        self.finished.emit()
 
 class ComPort(qtw.QComboBox):
     """
-    Signals: log_message, data_read_signal \n
+    Signals: log_message, read, read_batch, received, buffer_depth_changed \n
     """
 
     log_message = Signal(str)  # Signal to propagate log messages
     read = Signal(str) # Signal to propogate to Sensors
+    read_batch = Signal(list) # Every complete line drained in one go
+    received = Signal(list) # Same lines as read_batch but as timestamped, parsed RawLines
+    buffer_depth_changed = Signal(int) # Bytes still waiting in the port after a drain
+    port_opened = Signal(bool) # whether connecting to the selected port worked
+    connection_lost = Signal(str) # the port went away, ex: the usb cable was pulled
+
+    # used to hand work to the SerialWorker on its own thread
+    _open_requested = Signal()
+    _write_requested = Signal(bytes)
+    _close_requested = Signal()
+    # the worker may be draining on its thread, so it is handed these instead of them being set from here
+    _parser_changed = Signal(object)
+    _framer_changed = Signal(object)
 
-    def __init__(self, readout_interval=1000):
+    def __init__(self, readout_interval=1000, read_mode=READ_MODE_READY_READ, threaded=False):
         super(ComPort, self).__init__()
         self.port = None
         self.readout_interval = readout_interval #ms
+        self.read_mode = read_mode
+        self.threaded = threaded
+        self.parser = None
+        self.framer = LineFramer()
+        self.baud_rate = DEFAULT_BAUD_RATE
+        self.capture = None # CaptureWriter, records every line read
+        self.clock = DeviceClock() # maps firmware millis() to host time, direct backend only
+
+        # only used by the threaded backend
+        self.worker = None
+        self.worker_thread = None
+        # the worker opens the port on its own thread, so this follows its signals
+        self.connected = False
+        self.port_opened.connect(self._set_connected)
+        self.connection_lost.connect(self._lost)
+
+        # counters so we can check the buffer never backs up
+        self.buffer_depth = 0
+        self.max_buffer_depth = 0
+        self.lines_read = 0
 
         self.clear()
         self.addItem('Select Port')
-        for port_info in QSerialPortInfo.availablePorts():
-            self.addItem(port_info.portName(), port_info)
+        self.refresh_ports()
 
         #The Signal of a QComboBox - if current index change 
         self.currentIndexChanged.connect(self.select_port) 
 
-        # Set up continuous reading
+        # Set up continuous reading, only needed when polling
         self.timer = QTimer(self)
         self.timer.timeout.connect(self._read)
-        self.timer.start(self.readout_interval) # ms 
+        if self.read_mode == READ_MODE_POLL and not self.threaded:
+            self.timer.start(self.readout_interval) # ms 
+
+    def set_parser(self, parser: Optional[Callable[[str], Any]]) -> None:
+        """Every line is parsed once with this before it is emitted on received"""
+        self.parser = parser
+        if self.worker is not None:
+            self._parser_changed.emit(parser)
+
+    def set_framer(self, framer: Any) -> None:
+        """Splits the byte stream into lines, None reads newline terminated text without checksums"""
+        if framer is None:
+            framer = LineFramer()
+        self.framer = framer
+        if self.worker is not None:
+            self._framer_changed.emit(framer)
+
+    def set_baud_rate(self, baud_rate: int) -> None:
+        """Takes effect the next time a port is connected"""
+        self.baud_rate = baud_rate
+
+    def set_capture(self, capture: Any) -> None:
+        """Every line read is also written to this CaptureWriter, None stops capturing"""
+        if self.capture is not None:
+            self.capture.close()
+            self.log(f"Stopped capture, {self.capture.lines_written} lines written to: {self.capture.path}")
+        self.capture = capture
+        if capture is not None:
+            self.log(f"Capturing serial lines to: {capture.path}")
+
+    @property
+    def corrupt_frames(self) -> int:
+        """Lines or frames dropped for a bad checksum"""
+        return self.framer.corrupt_frames
+
+    def is_connected(self) -> bool:
+        """The port is open, not just a worker started that may still fail to open it or has lost it"""
+        return self.connected
+
+    @Slot(bool)
+    def _set_connected(self, connected: bool) -> None:
+        # the worker can report after disconnect_port already let go of it
+        self.connected = connected and (self.worker is not None or self.port is not None)
+
+    @Slot(str)
+    def _lost(self, message: str) -> None:
+        self.connected = False
+
+    def refresh_ports(self) -> None:
+        """Rescans the serial ports, so boards plugged in after startup can be picked"""
+        current = self.currentText()
+        self.blockSignals(True)
+        while self.count() > 1:
+            self.removeItem(1)
+        for port_info in QSerialPortInfo.availablePorts():
+            self.addItem(port_info.portName(), port_info)
+        index = self.findText(current)
+        self.setCurrentIndex(max(index, 0))
+        self.blockSignals(False)
 
     @Slot() #can be made type safe 
     def select_port(self) -> None:
@@ -36,52 +271,128 @@ class ComPort(qtw.QComboBox):
             port_info = self.itemData(index)
             self._connect_port(port_info)
 
-    def _connect_port(self, port: QSerialPortInfo) -> None:
-        """Connects and sets port to the corresponding port info"""
+    def _connect_port(self, port: QSerialPortInfo | str) -> None:
+        """Connects and sets port to the corresponding port info, or a device path like /dev/pts/3"""
+        port_name = port.portName() if isinstance(port, QSerialPortInfo) else port
         self.disconnect_port() #if already connected to another port, disconnect
-        self.log(f"Connecting to port: {port.portName()}")
-        self.port = QSerialPort(port)
-
-        self.port.baudRate = QSerialPort.BaudRate.Baud9600
-        #self.port.baudRate = QSerialPort.BaudRate.Baud115200
-        self.port.breakEnabled = False
-        self.port.dataBits = QSerialPort.DataBits.Data8
-        self.port.flowControl = QSerialPort.FlowControl.NoFlowControl
-        self.port.parity = QSerialPort.Parity.NoParity
-        self.port.stopBits = QSerialPort.StopBits.OneStop
+        self.log(f"Connecting to port: {port_name}")
+        if self.threaded:
+            self._start_worker(port_name)
+            return
+
+        self.port = QSerialPort()
+        self.port.setPortName(port_name)
+        configure_port(self.port, self.baud_rate)
         if not self.port.open(QIODevice.ReadWrite):
             self.port = None
-            self.log(f"Failed to open port: {port.portName()}")
+            self.log(f"Failed to open port: {port_name}")
+            self.port_opened.emit(False)
             return
         self.port.clear()
-        self.log(f"Successfully connected to: {port.portName()}")
-        # self.port._error_handler = self.port.errorOccurred.connect(self.log_port_error)
+        self.clock.reset()
+        if self.read_mode == READ_MODE_READY_READ:
+            self.port.readyRead.connect(self._read)
+        self.port.errorOccurred.connect(self._check_error)
+        self.log(f"Successfully connected to: {port_name}")
+        self.port_opened.emit(True)
+
+    def _start_worker(self, port_name: str) -> None:
+        self.worker_thread = QThread(self)
+        self.worker = SerialWorker(port_name, self.parser, self.framer, self.baud_rate)
+        self.worker.moveToThread(self.worker_thread)
+
+        self._open_requested.connect(self.worker.open)
+        self._write_requested.connect(self.worker.write)
+        self._close_requested.connect(self.worker.close)
+        self._parser_changed.connect(self.worker.set_parser)
+        self._framer_changed.connect(self.worker.set_framer)
+        # direct so the thread can stop even while the GUI thread waits on it
+        self.worker.finished.connect(self.worker_thread.quit, Qt.ConnectionType.DirectConnection)
+        self.worker_thread.finished.connect(self.worker.deleteLater)
+
+        self.worker.log_message.connect(self.log_message)
+        self.worker.opened.connect(self.port_opened)
+        self.worker.connection_lost.connect(self.connection_lost)
+        self.worker.lines_read.connect(self._emit_lines)
+        self.worker.buffer_depth_changed.connect(self._update_buffer_depth)
 
-    def connect_by_name(self, port_name:str) -> None:
-        ''' Connect to a port by name '''
+        self.worker_thread.start()
+        self._open_requested.emit()
+
+    def connect_by_name(self, port_name:str) -> bool:
+        ''' Connect to a port by name, returns False if there is no such port '''
         for i in range(1, self.count()):
             if self.itemText(i) == port_name:
-                self.setCurrentIndex(i)
-                break
+                if self.currentIndex() == i:
+                    self.select_port() # reconnecting to the port already selected
+                else:
+                    self.setCurrentIndex(i)
+                return True
+        # ports Qt does not list, like the pty made by simulator.py, can still be opened by path
+        if os.path.exists(port_name):
+            self.addItem(port_name, port_name)
+            self.setCurrentIndex(self.count() - 1)
+            return True
+        return False
+
+    @Slot(QSerialPort.SerialPortError)
+    def _check_error(self, error: QSerialPort.SerialPortError) -> None:
+        if error in FATAL_PORT_ERRORS and self.port is not None:
+            message = self.port.errorString()
+            self.disconnect_port()
+            self.connection_lost.emit(message)
 
-    def _read(self) -> str:
+    @Slot()
+    def _read(self) -> list[str]:
+        """
+        Drains every complete line in the port buffer and emits them.
+        A partial line is left in the buffer until its newline arrives.
+        """
         if self.port is None:
+            return []
+        lines = drain_lines(self.port, self.parser, self.framer, self.clock)
+        self._update_buffer_depth(self.port.bytesAvailable())
+        self._emit_lines(lines)
+        return [line.text for line in lines]
+
+    @Slot(int)
+    def _update_buffer_depth(self, depth: int) -> None:
+        self.buffer_depth = depth
+        self.max_buffer_depth = max(self.max_buffer_depth, depth)
+        self.buffer_depth_changed.emit(depth)
+
+    @Slot(list)
+    def _emit_lines(self, lines: list[RawLine]) -> None:
+        if not lines:
             return
-        data = self.port.readLine()
-        data = QTextStream(data).readAll().strip()
-        if data:
+        self.lines_read += len(lines)
+        if self.capture is not None:
+            self.capture.write(lines)
+        for line in lines:
             #EMITS DATA READ SIGNAL
-            self.read.emit(data)
-        return data
+            self.read.emit(line.text)
+        self.read_batch.emit([line.text for line in lines])
+        self.received.emit(lines)
     
     def _write(self, message: str) -> None:
-        if self.port is not None:
+        if self.worker is not None:
+            self._write_requested.emit(message.encode() + b'\n')
+        elif self.port is not None:
             self.port.write(message.encode() + b'\n')
 
     def disconnect_port(self) -> None:
+        self.connected = False
+        if self.worker is not None:
+            port_name = self.worker.port_name
+            self._close_requested.emit()
+            # the worker is deleted once its thread stops, which drops its connections
+            self.worker_thread.wait(2000)
+            self.worker = None
+            self.worker_thread = None
+            self.log(f"Disconnected from port: {port_name}")
+            self.setCurrentIndex(0)
         if self.port is not None:
-            # if hasattr(self.port, '_error_handler'):
-            #     self.port.errorOccurred.disconnect(self.port._error_handler)
+            self.port.errorOccurred.disconnect(self._check_error)
             self.port.close()
             self.log(f"Disconnected from port: {self.port.portName()}")
             self.setCurrentIndex(0)
@@ -90,4 +401,4 @@ class ComPort(qtw.QComboBox):
     def log(self, message: str) -> None:
         ''' Emit log messages via signal '''
         #when a signal is emitted, any widget (slot) connected to it triggers
-        self.log_message.emit(message)
\ No newline at end of file
+        self.log_message.emit(message)
@@ -0,0 +1,135 @@
+"""
+Buffers the readings the monitors save and writes them in one go, instead of
+a commit (a round trip and an fsync on the server) for every batch of lines.
+The rows go out when FLUSH_ROWS have piled up or FLUSH_INTERVAL after the
+first one, whichever is first, and SQLAlchemy sends them as multi row inserts.
+"""
+from PySide6.QtCore import QObject, Signal, Slot, QTimer
+from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from sqlalchemy.orm import scoped_session
+import time
+
+FLUSH_ROWS = 500
+FLUSH_INTERVAL = 1_000 # ms, how stale the database can be behind the readings
+MAX_PENDING = 100_000 # rows kept while the database cannot be reached, the oldest are dropped past this
+ROW_ATTEMPTS = 3 # a row the database keeps refusing is dropped after this many tries
+
+class BufferedWriter(QObject):
+    """
+    Signals: log_message \n
+    One per database session, shared by every monitor so the readings of all
+    modules go out together. Call flush() before anything that has to see
+    every reading, it is called when the readout stops and on close.
+    While the database cannot be reached the rows wait and are tried again
+    as a whole. A batch the database refuses is split in halves until the
+    rows it refuses are found, the rest is written and those are dropped
+    after ROW_ATTEMPTS.
+    """
+    log_message = Signal(str)
+
+    def __init__(self, db_session: scoped_session, max_rows: int = FLUSH_ROWS, interval: int = FLUSH_INTERVAL):
+        super(BufferedWriter, self).__init__()
+        self.session = db_session
+        self.max_rows = max_rows
+        self.pending: list = [] # ORM objects not in the session yet, in the order they were added
+
+        self.attempts: dict[object, int] = {} # refused row -> times it was tried
+        self.unreachable = False # the last write could not reach the database
+        self.last_error = None
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flushes = 0
+        self.flush_time = 0.0 # s spent writing
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+
+    def add(self, row) -> None:
+        self.pending.append(row)
+        # while the database is unreachable only the timer tries again, not every row
+        if len(self.pending) >= self.max_rows and not self.unreachable:
+            self.flush()
+        elif not self.timer.isActive():
+            self.timer.start()
+
+    @Slot()
+    def flush(self) -> None:
+        self.timer.stop()
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        start = time.perf_counter()
+        try:
+            refused = self._write(rows)
+        except OperationalError as error:
+            # nothing wrong with the rows, rows already written are not written again
+            if not self.unreachable:
+                self.log_message.emit(f"Database unreachable, keeping {len(rows)} rows until it is back: {error.orig}")
+            self.unreachable = True
+            self._requeue(rows)
+            return
+        if self.unreachable:
+            self.log_message.emit("Database reachable again")
+        self.unreachable = False
+        self.flush_time += time.perf_counter() - start
+        self.flushes += 1
+        if refused:
+            self._refused(refused)
+
+    def _write(self, rows: list) -> list:
+        """Commits rows, returns the ones the database refused"""
+        try:
+            self.session.add_all(rows)
+            self.session.commit()
+        except OperationalError:
+            self.session.rollback()
+            raise
+        except SQLAlchemyError as error:
+            self.session.rollback()
+            if len(rows) == 1:
+                self.last_error = error
+                return rows
+            half = len(rows) // 2
+            return self._write(rows[:half]) + self._write(rows[half:])
+        self.rows_written += len(rows)
+        return []
+
+    def _refused(self, rows: list) -> None:
+        retry = []
+        dropped = 0
+        for row in rows:
+            attempts = self.attempts.pop(row, 0) + 1
+            if attempts >= ROW_ATTEMPTS:
+                dropped += 1
+                continue
+            self.attempts[row] = attempts
+            retry.append(row)
+        self.rows_dropped += dropped
+        self.log_message.emit(
+            f"Database refused {len(rows)} rows, {dropped} dropped after {ROW_ATTEMPTS} tries "
+            f"({self.rows_dropped} in total): {getattr(self.last_error, 'orig', self.last_error)}"
+        )
+        if retry:
+            self._requeue(retry)
+
+    def _requeue(self, rows: list) -> None:
+        # in front of the rows that came in meanwhile, so they keep their order
+        self.pending = rows + self.pending
+        if len(self.pending) > MAX_PENDING:
+            dropped = len(self.pending) - MAX_PENDING
+            for row in self.pending[:dropped]:
+                self.attempts.pop(row, None)
+            self.pending = self.pending[dropped:]
+            self.rows_dropped += dropped
+            self.log_message.emit(f"{dropped} oldest rows dropped, more than {MAX_PENDING} were waiting ({self.rows_dropped} in total)")
+        self.timer.start()
+
+    def close(self) -> None:
+        self.flush()
+        if self.pending:
+            self.log_message.emit(f"{len(self.pending)} rows could not be written")
+        if self.rows_dropped:
+            self.log_message.emit(f"{self.rows_dropped} rows were dropped this session")
@@ -0,0 +1,60 @@
+"""
+Routes the readings parsed by a com port to the monitor that owns them, so each
+line is looked up once instead of every monitor checking every line.
+"""
+from PySide6.QtCore import QObject, Signal, Slot
+from typing import Any, Callable, Hashable
+from com_port import ComPort, RawLine
+
+class MessageDispatcher(QObject):
+    """
+    Signals: unrouted \n
+    Handlers get the lines for their channels from one drain as a single list,
+    so they can commit them together.
+    """
+    unrouted = Signal(object) # RawLine that parsed but nobody subscribed to
+
+    def __init__(self, com_port: ComPort):
+        super(MessageDispatcher, self).__init__()
+        self.com_port = com_port
+        self.routes: dict[tuple[Any, str, Hashable], Callable[[list[RawLine]], None]] = {} # (position, kind, channel) -> handler
+        self.routed = 0
+        self.unrouted_count = 0
+
+        self.com_port.received[list].connect(self.dispatch)
+
+    def subscribe(self, handler: Callable[[list[RawLine]], None], kind: str, channels: list, position: Any = None) -> None:
+        """
+        kind and channels are the fields of the firmware's Reading, position is the
+        control board position for firmwares that report it and None otherwise.
+        """
+        for channel in channels:
+            key = (position, kind, channel)
+            if key in self.routes and self.routes[key] != handler:
+                raise ValueError(f"Two monitors are reading {kind} {channel} at position {position}")
+            self.routes[key] = handler
+
+    def unsubscribe(self, handler: Callable[[list[RawLine]], None]) -> None:
+        self.routes = {key: h for key, h in self.routes.items() if h != handler}
+
+    def clear(self) -> None:
+        """Drops every route, ex: the port is opened again for another run config"""
+        self.routes.clear()
+
+    @Slot(list)
+    def dispatch(self, lines: list[RawLine]) -> None:
+        batches: dict[Callable, list[RawLine]] = {}
+        for line in lines:
+            reading = line.parsed
+            if reading is None:
+                continue
+            handler = self.routes.get((reading.position, reading.kind, reading.channel))
+            if handler is None:
+                self.unrouted_count += 1
+                self.unrouted.emit(line)
+                continue
+            batches.setdefault(handler, []).append(line)
+
+        for handler, batch in batches.items():
+            self.routed += len(batch)
+            handler(batch)
@@ -4,10 +4,208 @@ based on different firmware versions
 """
 from abc import ABC, abstractmethod
 import re
-from typing import Any
+from typing import Any, NamedTuple
+from framing import BinaryFramer, Frame, FRAME_SENSOR, FRAME_PROBE, FRAME_BB
+
+# Every reply the bumpbonds_mockup firmware sends data in, in one pattern so a
+# line is classified and decoded in a single match. The named group that
+# closes each branch (adc, probe_raw, voltage, samples_n, samples, error) tells which one matched.
+THERMAL_MOCKUP_REPLY = re.compile(
+    r"measure (?P<channel>\d+) (?P<adc>[0-9a-fA-F]+)$"
+    r"|Probe (?P<probe>\d+): (?P<probe_raw>0x[0-9a-fA-F]+)$"
+    r"|TP(?P<path>\d+) (?P<voltage>-?\d+(?:\.\d+)?)$"
+    r"|TPavg(?P<avg_path>\d+) (?P<mean>-?\d+(?:\.\d+)?) (?P<std>\d+(?:\.\d+)?) (?P<samples_n>\d+)$"
+    r"|(?P<sweep_kind>sweep|stream) (?P<seq>\d+)(?P<samples>(?: P?\d+:[0-9a-fA-F]+)*)$"
+    r"|ERROR:? *(?P<error>.*)$"
+)
+
+# control-board/firmware replies. Probe readings come after a "Reading TM Board x" line.
+CONTROL_BOARD_REPLY = re.compile(
+    r"TM Board (?P<board>[a-d]) Channel (?P<channel>\d+): 0x(?P<adc>[0-9a-fA-F]+)$"
+    r"|Temp Probe (?P<probe>\d+): (?P<probe_raw>0x[0-9a-fA-F]+)(?: .*)?$"
+    r"|Reading TM Board (?P<probe_board>[a-d])$"
+    r"|ERROR:? *(?P<error>.*)$"
+)
+
+# Answer to the hello handshake, ex:
+# HELLO firmware=thermal_mockup version=2.3 adc=AD7718 adc_bits=24 max_args=10 binary=1 commands=reset,measure,probe
+HELLO_REPLY = re.compile(r"HELLO (?P<fields>.*)$")
+
+class Capabilities(NamedTuple):
+    """What the firmware on the other end of a port says it supports"""
+    firmware: str # firmware family, ex: thermal_mockup
+    version: str
+    commands: frozenset[str]
+    max_args: int # arguments one command can take, flags included
+    binary: bool  # can answer in binary frames
+    adc: str      # AD7718 or AD7708
+    adc_bits: int # 24 for an AD7718, 16 for an AD7708
+
+def parse_hello(raw_output: str) -> Capabilities | None:
+    match = HELLO_REPLY.match(raw_output)
+    if match is None:
+        return None
+    fields = dict(field.split("=", 1) for field in match["fields"].split() if "=" in field)
+    try:
+        return Capabilities(
+            firmware = fields["firmware"],
+            version = fields.get("version", ""),
+            commands = frozenset(filter(None, fields.get("commands", "").split(","))),
+            max_args = int(fields["max_args"]),
+            binary = fields.get("binary") == "1",
+            adc = fields.get("adc", "AD7718"),
+            adc_bits = int(fields.get("adc_bits", 24)),
+        )
+    except (KeyError, ValueError):
+        return None
+
+ADC_CLOCK = 32_768 # Hz, the AD7718's crystal
+FILTER_MIN_CHOP = 13 # smallest filter word the AD7718 takes with chopping on
+FILTER_MIN_NO_CHOP = 3
+FILTER_MAX = 0xFF
+
+class AdcSettings(NamedTuple):
+    """How the ADC converts a channel, sent with the adcconfig command"""
+    filter_word: int # SF in REG_FILTER, bigger is slower and less noisy
+    chop: bool # chopping removes offset drift but converts 3x slower
+
+    @property
+    def conversion_rate(self) -> float:
+        """Hz"""
+        return ADC_CLOCK / (8 * self.filter_word * (3 if self.chop else 1))
+
+    @classmethod
+    def for_rate(cls, rate: float, chop: bool = True) -> "AdcSettings":
+        """The settings closest to a conversion rate in Hz, within what the ADC can do"""
+        filter_word = round(ADC_CLOCK / (8 * rate * (3 if chop else 1)))
+        return cls(min(max(filter_word, FILTER_MIN_CHOP if chop else FILTER_MIN_NO_CHOP), FILTER_MAX), chop)
+
+# speed vs noise, picked with adc_profile in the run config
+ADC_PROFILES = {
+    "fast": AdcSettings(0x0D, False), # 315 Hz, for fast transients
+    "default": AdcSettings(0x45, True), # 19.8 Hz, what the ADC starts with
+    "low_noise": AdcSettings(0xFF, True), # 5.4 Hz, for steady state runs
+}
+
+def adc_profile_name(settings: AdcSettings) -> str | None:
+    return next((name for name, profile in ADC_PROFILES.items() if profile == settings), None)
+
+class Reading(NamedTuple):
+    """A parsed reply from the firmware"""
+    kind: str    # "sensor", "probe", "bb", "sweep", "stream" or "error"
+    channel: Any # sensor name, probe name or bump bond path id, None for errors
+    value: Any   # raw adc string for sensors/probes, voltage or BbStats for bump bonds, message for errors
+    position: Any = None # control board position, only for firmwares that report it
+
+class BbStats(NamedTuple):
+    """Value of a "bb" Reading averaged on the board, see ThermalMockupV2.write_bbs"""
+    mean: float # volts
+    std: float # volts, of the single reads
+    n: int # analog reads averaged
+
+class Sweep(NamedTuple):
+    """Value of a "sweep" or "stream" Reading, every sample of one sweep command or streamed sweep"""
+    seq: int # counts up every sweep, a gap means a sweep reply was lost
+    samples: tuple[Reading, ...] # sensor and probe Readings
 
 class ModuleFirmwareInterface(ABC):
     """Abstract base class to enforce the read and write methods of inherited classes"""
+
+    # True if replies say which control board position (A-D) they came from,
+    # only then can several modules share one port
+    supports_board_positions = False
+
+    # True if sensors and probes are read with one write_sweep command that
+    # is answered by a single "sweep" Reading
+    combined_sweep = False
+
+    # True if the firmware pushes sweeps on its own after write_stream_start,
+    # answered by "stream" Readings, instead of being asked for every sample
+    streaming = False
+
+    # False if the firmware cannot read the bump bond test paths
+    supports_bump_bonds = True
+
+    # True if the firmware drives the module heaters, see write_heater
+    supports_heaters = False
+
+    # Family the firmware reports in its hello reply, None if it has no handshake
+    firmware_family = None
+    # Commands the interface needs, the handshake only picks it if the firmware has all of them
+    required_commands = frozenset()
+    # Higher is faster, the handshake picks the fastest interface the firmware supports
+    protocol_rank = 0
+
+    # Set by configure() from the handshake
+    max_args = None # arguments per command, None if unknown
+    commands = None # commands the firmware has, None if unknown
+    adc_bits = 24
+
+    @classmethod
+    def supported_by(cls, capabilities: Capabilities) -> bool:
+        return capabilities.firmware == cls.firmware_family and cls.required_commands <= capabilities.commands
+
+    def configure(self, capabilities: Capabilities) -> None:
+        """Adapts to what the handshake reported"""
+        self.max_args = capabilities.max_args
+        self.commands = capabilities.commands
+        self.adc_bits = capabilities.adc_bits
+
+    def has_command(self, command: str) -> bool:
+        """False if the handshake said the firmware does not have it, assumed there without a handshake"""
+        return self.commands is None or command in self.commands
+
+    def batch_size(self) -> int | None:
+        """Channels that fit in one command, None if there is no known limit"""
+        return self.max_args
+
+    def adc_value(self, value: str) -> str:
+        """Raw adc hex as Data.raw_adc expects it, 6 digits of a 24 bit reading"""
+        if self.adc_bits == 16:
+            # same full scale as an AD7718, the missing low byte is zero
+            return value.zfill(4) + "00"
+        return value.zfill(6)
+
+    def parse(self, raw_output: str) -> Reading | None:
+        """Classify and parse a line once so every monitor does not have to"""
+        if (data := self.read_sensor(raw_output)):
+            return Reading("sensor", *data)
+        if (data := self.read_probe(raw_output)):
+            return Reading("probe", *data)
+        if (data := self.read_bb(raw_output)):
+            return Reading("bb", *data)
+
+    def parse_batch(self, raw_outputs: list[str]) -> list[Reading | None]:
+        return [self.parse(raw_output) for raw_output in raw_outputs]
+
+    def merge_commands(self, commands: list[str]) -> list[str]:
+        """Commands written in the same event loop turn, merged where the firmware allows it"""
+        return commands
+
+    def framer(self) -> Any:
+        """Framer used by the com port to split the byte stream, None reads plain lines"""
+        return None
+
+    def setup_commands(self) -> list[str]:
+        """Commands sent to the firmware once the port is connected"""
+        return []
+
+    def write_adc_config(self, settings: AdcSettings, sensor_names: list[str] | None = None) -> str:
+        """Sets the ADC filter and chopping of some sensors, None sets all of them"""
+        raise NotImplementedError(f"{self.__firmware_name__} cannot configure the ADC")
+
+    def write_heater(self, duty: float, position: str | None = None) -> str:
+        """Keeps the heater on for duty percent of the time, position picks the board on firmware that supports_board_positions"""
+        raise NotImplementedError(f"{self.__firmware_name__} cannot drive the heaters")
+
+    def _adc_config_args(self, settings: AdcSettings, sensor_names: list[str] | None) -> str:
+        # hex2char in the firmware only reads upper case
+        args = f"{settings.filter_word:02X} {'ON' if settings.chop else 'OFF'}"
+        for sensor_name in sensor_names or []:
+            if sensor_name not in self.sensor_map:
+                raise ValueError(f"Sensor {sensor_name} is not a valid sensor name")
+            args += f" {self.sensor_map[sensor_name]}"
+        return args
     
     @abstractmethod
     def read_sensor(self, raw_output: str) -> str:
@@ -30,8 +228,8 @@ class ModuleFirmwareInterface(ABC):
         ...
 
     @abstractmethod
-    def write_bbs(self, tp_n: list[int]):
-        """Command to read the bump bond values"""
+    def write_bbs(self, tp_n: list[int], samples: int = 1):
+        """Command to read the bump bond values, averaged over samples analog reads where the firmware can"""
         ...
     
     @abstractmethod
@@ -39,36 +237,156 @@ class ModuleFirmwareInterface(ABC):
         """Should return the bb path id and then the output"""
         ...
 
-# class ControlBoardV1(ModuleFirmwareInterface):
-#     __firmware_name__ = "Control Board V1"
-#     def __init__(self, control_board_pos: int):
-#         self.control_board_pos = control_board_pos
-#         self.sensor_map = {
-#             'E3': 1,
-#             'L1': 2,
-#             'E1': 3,
-#             'L2': 4,
-#             'E2': 5,
-#             'L3': 6,
-#             'L4': 7,
-#             'E4': 8
-#         }
-#         """
-#         TM -ab, TM -abcd, TM measure 1
-#         """
-#     def read_sensor(self, adc_value: str) -> str:
-#         """An example is "TM -a measure 1 72a4ff" """
-#         return adc_value.split()[-1]
-
-#     def write_sensors(self, sensor_names: list[str]) -> str:
-#         channels = [str(self.sensor_map[sensor_name]) for sensor_name in sensor_names]
-#         return f"TM -{self.control_board_pos} measure {' '.join(channels)}"
-    
-#     def write_bb(self, tp_n: list[int]) -> str:
-#         raise NotImplementedError("Needs to be implementented")
+class ControlBoardV1(ModuleFirmwareInterface):
+    """
+    control-board/firmware, reads up to four modules at positions A-D with one
+    command. The flag picks the boards, ex: measure -abcd 1 2 3 or probe -ab 1 2 3.
+    Replies say which board they came from so they can be routed by position.
+    """
+    __firmware_name__ = "Control Board V1"
+    supports_board_positions = True
+    supports_bump_bonds = False
+    supports_heaters = True
+    firmware_family = "control_board"
+    required_commands = frozenset({"measure", "probe"})
+
+    def __init__(self):
+        self.sensor_map = {
+            'E3': 1,
+            'L1': 2,
+            'E1': 3,
+            'L2': 4,
+            'E2': 5,
+            'L3': 6,
+            'L4': 7,
+            'E4': 8
+        }
+        self.swapped_sensor_map = dict(
+            zip(self.sensor_map.values(), self.sensor_map.keys()))
+
+        self.probe_map = {
+            'P1': 1,
+            'P2': 2,
+            'P3': 3
+        }
+        self.swapped_probe_map = dict(
+            zip(self.probe_map.values(), self.probe_map.keys()))
+
+        # probe replies only say which board they are from in the "Reading TM Board"
+        # line before them, so it is kept for the probe lines right after it
+        self.probe_board = None
+
+    def parse(self, raw_output: str) -> Reading | None:
+        """
+        Only call from the thread that reads the port (the worker in threaded mode),
+        in the order the lines came in, probe lines depend on the line before them.
+        """
+        # any other line ends the block, a probe line is never put on a stale board
+        board, self.probe_board = self.probe_board, None
+        match = CONTROL_BOARD_REPLY.match(raw_output)
+        if match is None:
+            return None
+        kind = match.lastgroup
+        if kind == "adc":
+            sensor = self.swapped_sensor_map.get(int(match["channel"]))
+            return Reading("sensor", sensor, self.adc_value(match["adc"]), match["board"].upper()) if sensor else None
+        if kind == "probe_raw":
+            self.probe_board = board
+            probe = self.swapped_probe_map.get(int(match["probe"]))
+            return Reading("probe", probe, match["probe_raw"], board) if probe and board else None
+        if kind == "probe_board":
+            self.probe_board = match["probe_board"].upper()
+            return None
+        return Reading("error", None, match["error"])
+
+    def read_sensor(self, raw_output: str) -> tuple[str, str]:
+        """An example is "TM Board a Channel 1: 0x72a4ff" """
+        reading = self.parse(raw_output)
+        if reading is not None and reading.kind == "sensor":
+            return reading.channel, reading.value
+
+    def read_probe(self, raw_output: str) -> tuple[str, str]:
+        """An example is "Temp Probe 1: 0xc80  25.00 °C" """
+        reading = self.parse(raw_output)
+        if reading is not None and reading.kind == "probe":
+            return reading.channel, reading.value
+
+    def read_bb(self, raw_output: str) -> None:
+        return None
+
+    def batch_size(self) -> int | None:
+        # the board flag takes one of the arguments
+        return self.max_args - 1 if self.max_args is not None else None
+
+    def _board_flag(self, position: str | None) -> str:
+        # no flag reads every board
+        return f"-{position.lower()} " if position else ""
+
+    def write_sensors(self, sensor_names: list[str], position: str | None = None) -> str:
+        if len(sensor_names) == 0:
+            raise ValueError("List length cannot be 0")
+        for sensor_name in sensor_names:
+            if sensor_name not in self.sensor_map:
+                raise ValueError(f"Sensor {sensor_name} is not a valid sensor name")
+        channels = [str(self.sensor_map[sensor_name]) for sensor_name in sensor_names]
+        return f"measure {self._board_flag(position)}{' '.join(channels)}"
+
+    def write_probes(self, probe_names: list[str], position: str | None = None) -> str:
+        if len(probe_names) == 0:
+            raise ValueError("List length cannot be 0")
+        for probe_name in probe_names:
+            if probe_name not in self.probe_map:
+                raise ValueError(f"Probe {probe_name} is not a valid probe name")
+        probes = [str(self.probe_map[probe_name]) for probe_name in probe_names]
+        return f"probe {self._board_flag(position)}{' '.join(probes)}"
+
+    def write_bbs(self, tp_n: list[int], samples: int = 1) -> str:
+        raise NotImplementedError("The control board firmware has no bump bond readout")
+
+    def write_adc_config(self, settings: AdcSettings, sensor_names: list[str] | None = None, position: str | None = None) -> str:
+        return f"adcconfig {self._board_flag(position)}{self._adc_config_args(settings, sensor_names)}"
+
+    def write_heater(self, duty: float, position: str | None = None) -> str:
+        """The firmware switches the heater over a 2 s window, so whole percents are plenty"""
+        if not 0 <= duty <= 100:
+            raise ValueError(f"Heater duty {duty} is not between 0 and 100 %")
+        return f"heater {self._board_flag(position)}{round(duty)}"
+
+    def merge_commands(self, commands: list[str]) -> list[str]:
+        """
+        measure and probe commands for different boards become one command for
+        all of them, ex: measure -a 1 2 and measure -b 2 3 -> measure -ab 1 2 3.
+        A board may read a channel it did not ask for, nobody is routed that reading.
+        """
+        merged: dict[str, tuple[list[str], list[str]]] = {} # command -> (boards, args)
+        order = []
+        for command in commands:
+            cmd, *rest = command.split()
+            if cmd not in ("measure", "probe"):
+                order.append(command)
+                continue
+            flag = rest[0][1:] if rest and rest[0].startswith("-") else "abcd"
+            args = rest[1:] if rest and rest[0].startswith("-") else rest
+            if cmd not in merged:
+                merged[cmd] = ([], [])
+                order.append(cmd)
+            boards, all_args = merged[cmd]
+            boards.extend(board for board in flag if board not in boards)
+            all_args.extend(arg for arg in args if arg not in all_args)
+
+        result = []
+        for entry in order:
+            if entry not in merged:
+                result.append(entry)
+                continue
+            boards, args = merged[entry]
+            result.append(f"{entry} -{''.join(sorted(boards))} {' '.join(sorted(args, key=int))}")
+        return result
     
 class ThermalMockupV2(ModuleFirmwareInterface):
     __firmware_name__ = "Thermal Mockup V2"
+    firmware_family = "thermal_mockup"
+    required_commands = frozenset({"measure", "probe", "TP"})
 
     def __init__(self):
         self.sensor_map = {
@@ -94,15 +412,48 @@ class ThermalMockupV2(ModuleFirmwareInterface):
         self.swapped_probe_map = dict(
             zip(self.probe_map.values(), self.probe_map.keys()))
 
-    def read_sensor(self, raw_output: str) -> tuple[int, str]:
-        if len(raw_output) != 16:
-            return
-        pattern = re.compile(r"^measure (\d+) (\S+)$")
-        match = re.match(pattern, raw_output)
-        if match:
-            channel, adc_value = match.groups()
-            sensor = self.swapped_sensor_map[int(channel)]
-            return sensor, adc_value 
+    def parse(self, raw_output: str) -> Reading | None:
+        """Classifies and decodes a reply in one match of THERMAL_MOCKUP_REPLY"""
+        match = THERMAL_MOCKUP_REPLY.match(raw_output)
+        if match is None:
+            return None
+        kind = match.lastgroup
+        if kind == "adc":
+            sensor = self.swapped_sensor_map.get(int(match["channel"]))
+            # the firmware drops leading zeros, Data.volts expects all 6 digits
+            return Reading("sensor", sensor, self.adc_value(match["adc"])) if sensor else None
+        if kind == "probe_raw":
+            probe = self.swapped_probe_map.get(int(match["probe"]))
+            return Reading("probe", probe, match["probe_raw"]) if probe else None
+        if kind == "voltage":
+            return Reading("bb", int(match["path"]), float(match["voltage"]))
+        if kind == "samples_n":
+            stats = BbStats(float(match["mean"]), float(match["std"]), int(match["samples_n"]))
+            return Reading("bb", int(match["avg_path"]), stats)
+        if kind == "samples":
+            return Reading(match["sweep_kind"], None, Sweep(int(match["seq"]), self._sweep_samples(match["samples"])))
+        return Reading("error", None, match["error"])
+
+    def _sweep_samples(self, samples: str) -> tuple[Reading, ...]:
+        readings = []
+        for sample in samples.split():
+            channel, value = sample.split(":")
+            if channel[0] == "P":
+                probe = self.swapped_probe_map.get(int(channel[1:]))
+                if probe:
+                    readings.append(Reading("probe", probe, "0x" + value))
+            elif (sensor := self.swapped_sensor_map.get(int(channel))):
+                readings.append(Reading("sensor", sensor, self.adc_value(value)))
+        return tuple(readings)
+
+    def parse_batch(self, raw_outputs: list[str]) -> list[Reading | None]:
+        parse = self.parse
+        return [parse(raw_output) for raw_output in raw_outputs]
+
+    def read_sensor(self, raw_output: str) -> tuple[str, str]:
+        reading = self.parse(raw_output)
+        if reading is not None and reading.kind == "sensor":
+            return reading.channel, reading.value
 
     def write_sensors(self, sensors: list[str]):
         if not isinstance(sensors, list):
@@ -117,15 +468,10 @@ class ThermalMockupV2(ModuleFirmwareInterface):
             sensor_ids.append(self.sensor_map[sensor])
         return f'measure ' + ' '.join(map(str,sensor_ids))
 
-    def read_probe(self, raw_output: str) -> tuple[int, str]:
-        if len(raw_output) not in [14,15]:
-            return
-        pattern = re.compile(r"^Probe (\d+): (\S+)$")
-        match = re.match(pattern, raw_output)
-        if match:
-            probe_id, adc_value = match.groups()
-            probe = self.swapped_probe_map[int(probe_id)]
-            return probe, adc_value   
+    def read_probe(self, raw_output: str) -> tuple[str, str]:
+        reading = self.parse(raw_output)
+        if reading is not None and reading.kind == "probe":
+            return reading.channel, reading.value
 
     def write_probes(self, probes: list[str]) -> str:
         if not isinstance(probes, list):
@@ -140,36 +486,182 @@ class ThermalMockupV2(ModuleFirmwareInterface):
             probe_ids.append(self.probe_map[probe])
         return f'probe ' + ' '.join(map(str,probe_ids))
         
-    def write_bbs(self, tp_n: list[int]) -> str:
+    def write_sweep(self, names: list[str]) -> str:
+        """Reads sensors and probes with one command, ex: sweep 1 2 P1"""
+        if not isinstance(names, list):
+            raise TypeError("Names needs to be a list of sensors and probes you want to read")
+        if len(names) == 0:
+            raise ValueError("List length cannot be 0")
+        return 'sweep ' + ' '.join(self._sweep_ids(names))
+
+    def _sweep_ids(self, names: list[str]) -> list[str]:
+        ids = []
+        for name in names:
+            if name in self.sensor_map:
+                ids.append(str(self.sensor_map[name]))
+            elif name in self.probe_map:
+                ids.append(f"P{self.probe_map[name]}")
+            else:
+                raise ValueError(f"{name} is not a valid sensor or probe name")
+        return ids
+
+    def write_adc_config(self, settings: AdcSettings, sensor_names: list[str] | None = None) -> str:
+        """Ex: adcconfig 45 ON 1 2, or adcconfig 0D OFF for every channel"""
+        return f"adcconfig {self._adc_config_args(settings, sensor_names)}"
+
+    def merge_commands(self, commands: list[str]) -> list[str]:
+        """
+        Bump bond commands written in the same tick become one, ex: TP 1 and TP 2 -> TP 1 2,
+        since every path is scheduled on its own
+        """
+        merged: dict[tuple, int] = {} # (command, sample count) -> index in result
+        result = []
+        for command in commands:
+            cmd, *args = command.split()
+            if cmd not in ("TP", "TPavg"):
+                result.append(command)
+                continue
+            key = (cmd, args[0]) if cmd == "TPavg" else (cmd,)
+            paths = args[len(key) - 1:]
+            if key in merged:
+                result[merged[key]] += " " + " ".join(paths)
+                continue
+            merged[key] = len(result)
+            result.append(command)
+        return result
+
+    def write_bbs(self, tp_n: list[int], samples: int = 1) -> str:
         """
         If the arduino has the automatic bump bond readout through the analog pins as defined:
         https://bu.nebraskadetectorlab.com/submission/shared/3724/ZRg7YayBwd3sNfJXLnzcIFojWbO2De
 
-        This command yields the string to send that command.
+        This command yields the string to send that command. With samples > 1 the
+        firmware averages that many analog reads per path and answers with the mean,
+        standard deviation and count, ex: TPavg 64 1 2 -> TPavg1 1.6512 0.0031 64
         """
         if not isinstance(tp_n, list):
             raise TypeError("Input is not a list type")
         if len(tp_n) == 0:
             raise ValueError("List length cannot be 0")
         
+        if samples > 1 and self.has_command("TPavg"):
+            return f"TPavg {samples} " + ' '.join(map(str,tp_n))
         return f"TP " + ' '.join(map(str,tp_n))
                 
-    def read_bb(self, raw_output: str) -> tuple[int, float]:
+    def read_bb(self, raw_output: str) -> tuple[int, float | BbStats]:
         """Returns the bump bond path id and the corresponding value if string matches"""
         if not isinstance(raw_output, str):
             return
-        if len(raw_output) != 8:
-            return
-        pattern = re.compile(r"^TP(\d+) (\S+)$")
-        match = re.match(pattern, raw_output)
-        if match:
-            bb_path_id, raw_value = match.groups()
-            return int(bb_path_id), float(raw_value)
+        reading = self.parse(raw_output)
+        if reading is not None and reading.kind == "bb":
+            return reading.channel, reading.value
            
+class ThermalMockupV2Binary(ThermalMockupV2):
+    """
+    Same commands as ThermalMockupV2, but the firmware answers measure, probe 
+    and TP with compact binary frames (see framing.py) after "binary on".
+    The frames are turned back into the usual text replies so parsing is unchanged.
+    """
+    __firmware_name__ = "Thermal Mockup V2 Binary"
+    required_commands = ThermalMockupV2.required_commands | {"binary"}
+    protocol_rank = 1
+
+    @classmethod
+    def supported_by(cls, capabilities: Capabilities) -> bool:
+        return capabilities.binary and super().supported_by(capabilities)
+
+    def framer(self) -> BinaryFramer:
+        return BinaryFramer(self.format_frame)
+
+    def setup_commands(self) -> list[str]:
+        return ["binary on"]
+
+    def format_frame(self, frame: Frame) -> str:
+        if frame.type == FRAME_SENSOR:
+            return f"measure {frame.channel} {frame.value:x}"
+        if frame.type == FRAME_PROBE:
+            return f"Probe {frame.channel}: 0x{frame.value:x}"
+        if frame.type == FRAME_BB:
+            # raw 10 bit analogRead code, same conversion the firmware does in text mode
+            return f"TP{frame.channel} {frame.value * 3.3 / 1023:.2f}"
+        return f"ERROR: Unknown frame type {frame.type}"
+
+class ThermalMockupV2Sweep(ThermalMockupV2):
+    """
+    Same firmware as ThermalMockupV2, but every sensor and probe of the module
+    is read with one sweep command that answers on a single line.
+    """
+    __firmware_name__ = "Thermal Mockup V2 Sweep"
+    combined_sweep = True
+    required_commands = ThermalMockupV2.required_commands | {"sweep"}
+    protocol_rank = 2 # one line per module instead of one per channel
+
+class ThermalMockupV2Stream(ThermalMockupV2Sweep):
+    """
+    Same firmware as ThermalMockupV2Sweep, but after one stream start command
+    the firmware sweeps on its own at a fixed rate and pushes every sweep as a
+    "stream" line, so no sample waits on a command round trip. It only sends a
+    sweep while it holds a credit, see stream.py for how they are handed back.
+    """
+    __firmware_name__ = "Thermal Mockup V2 Stream"
+    streaming = True
+    required_commands = ThermalMockupV2Sweep.required_commands | {"stream"}
+    protocol_rank = 3
+
+    def write_stream_start(self, names: list[str], rate: float, credits: int) -> str:
+        """
+        Ex: stream start 1,2,P1 2 8 sweeps sensors 1 and 2 and probe 1 twice a
+        second, the first 8 sweeps without waiting on a credit. A rate of 0 sweeps
+        as fast as the ADC converts.
+        """
+        if len(names) == 0:
+            raise ValueError("List length cannot be 0")
+        # one argument for all the channels, so a whole module fits in MAX_ARGS
+        return f"stream start {','.join(self._sweep_ids(names))} {rate:g} {credits}"
+
+    def write_stream_credit(self, credits: int) -> str:
+        """Lets the firmware send this many more sweeps"""
+        return f"stream credit {credits}"
+
+    def write_stream_stop(self) -> str:
+        return "stream stop"
+
+def _firmware_classes(cls=ModuleFirmwareInterface) -> list[type[ModuleFirmwareInterface]]:
+    """All firmware interfaces, including variants that subclass another interface"""
+    classes = []
+    for subclass in cls.__subclasses__():
+        classes.append(subclass)
+        classes.extend(_firmware_classes(subclass))
+    return classes
+
 def available_firmwares():
-    return [subclass.__firmware_name__ for subclass in ModuleFirmwareInterface.__subclasses__()]
+    return [subclass.__firmware_name__ for subclass in _firmware_classes()]
 
 def firmware_select(firmware_name: str) -> ModuleFirmwareInterface:
-    for subclass in ModuleFirmwareInterface.__subclasses__():
+    for subclass in _firmware_classes():
         if subclass.__firmware_name__ == firmware_name:
-            return subclass()
\ No newline at end of file
+            return subclass()
+
+def negotiate(capabilities: Capabilities, firmware_name: str) -> ModuleFirmwareInterface:
+    """
+    The fastest interface of the configured firmware's family that the firmware
+    supports, configured for it. Streaming interfaces are only picked if the
+    configured one streams. Falls back to the configured interface if the
+    firmware is of another family or supports none of them.
+    """
+    configured = firmware_select(firmware_name)
+    candidates = [
+        subclass for subclass in _firmware_classes()
+        if subclass.firmware_family == configured.firmware_family and subclass.supported_by(capabilities)
+    ]
+    # streaming changes how a run is read, so it is only used when it was configured,
+    # a firmware that cannot stream is polled instead
+    streaming = [subclass for subclass in candidates if subclass.streaming]
+    if configured.streaming and streaming:
+        candidates = streaming
+    else:
+        candidates = [subclass for subclass in candidates if not subclass.streaming]
+    firmware = max(candidates, key=lambda subclass: subclass.protocol_rank)() if candidates else configured
+    if capabilities.firmware == firmware.firmware_family:
+        firmware.configure(capabilities)
+    return firmware
@@ -0,0 +1,156 @@
+"""
+Framers turn the raw bytes read from a serial port into lines of text
+that the firmware interfaces know how to parse.
+"""
+import re
+import struct
+from typing import Callable, NamedTuple
+
+# Binary frame layout, must match send_frame() in bumpbonds_mockup/firmware/src/main.cpp
+#   SYNC | LEN | TYPE | SEQ (uint16) | CHANNEL | VALUE (uint32) | CHECKSUM
+# LEN counts the payload bytes (TYPE through VALUE), CHECKSUM is the xor of the payload.
+FRAME_SYNC = 0xA5
+FRAME_PAYLOAD = struct.Struct("<BHBI")
+FRAME_SENSOR = 0x01
+FRAME_PROBE = 0x02
+FRAME_BB = 0x03
+
+# Text lines, after "checksum on" the firmware ends each one with *XX,
+# the xor of the characters before the * in hex
+LINE_DELIMITERS = re.compile(rb"[\r\n]+")
+LINE_CHECKSUM = re.compile(rb"^(.*)\*([0-9A-Fa-f]{2})$")
+MAX_LINE_LENGTH = 1_024 # bytes without a newline before they are thrown away as noise
+
+class Frame(NamedTuple):
+    type: int
+    seq: int
+    channel: int
+    value: int
+
+def checksum(payload: bytes) -> int:
+    value = 0
+    for byte in payload:
+        value ^= byte
+    return value
+
+def encode_frame(frame: Frame) -> bytes:
+    """Builds the bytes the firmware would send for this frame"""
+    payload = FRAME_PAYLOAD.pack(*frame)
+    return bytes([FRAME_SYNC, len(payload)]) + payload + bytes([checksum(payload)])
+
+def check_line(line: bytes) -> tuple[bytes, bool | None]:
+    """Strips the checksum off a line, the bool says if it matched, None if there was none"""
+    match = LINE_CHECKSUM.match(line)
+    if match is None:
+        return line, None
+    text = match.group(1)
+    return text, checksum(text) == int(match.group(2), 16)
+
+class LineFramer:
+    """
+    Splits the byte stream into lines, keeping a partial line until the rest
+    arrives. With checksums on, lines whose checksum does not match are dropped
+    and counted, so a byte lost at a high baud rate cannot turn into a wrong
+    reading. Lines without a checksum are let through until the first checksummed
+    line arrives, since the firmware only starts adding them after "checksum on".
+    """
+    def __init__(self, checksums: bool = False):
+        self.checksums = checksums
+        self.checked = False # a checksummed line has arrived, lines without one are corrupt from now on
+        self.buffer = bytearray()
+
+        self.lines = 0
+        self.corrupt_frames = 0 # lines dropped for a bad or missing checksum
+        self.dropped_bytes = 0 # noise without a newline
+
+    def feed(self, data: bytes) -> list[str]:
+        self.buffer.extend(data)
+        *complete, rest = LINE_DELIMITERS.split(self.buffer)
+        if len(rest) > MAX_LINE_LENGTH:
+            self.dropped_bytes += len(rest)
+            rest = b""
+        self.buffer = bytearray(rest)
+
+        lines = []
+        for line in complete:
+            if not line:
+                continue
+            if self.checksums:
+                line, ok = check_line(line)
+                if ok:
+                    self.checked = True
+                elif ok is False or self.checked:
+                    self.corrupt_frames += 1
+                    continue
+            self.lines += 1
+            lines.append(line.decode(errors="replace").strip())
+        return [line for line in lines if line]
+
+class BinaryFramer:
+    """
+    Splits a stream of binary frames and plain text lines. The firmware still
+    prints text for things like "RESET COMPLETE", those lines are passed through.
+    format_frame turns each decoded Frame into the text line the parser expects.
+    """
+    def __init__(self, format_frame: Callable[[Frame], str]):
+        self.format_frame = format_frame
+        self.buffer = bytearray()
+        self.last_seq = None
+
+        self.frames = 0
+        self.lost_frames = 0 # gaps in the sequence number
+        self.corrupt_frames = 0 # bad length or checksum
+        self.dropped_bytes = 0 # garbage skipped while looking for the next frame
+
+    def feed(self, data: bytes) -> list[str]:
+        self.buffer.extend(data)
+        lines = []
+        while self.buffer:
+            if self.buffer[0] == FRAME_SYNC:
+                if len(self.buffer) < 2:
+                    break
+                length = self.buffer[1]
+                # a bad length is not waited on, it could hold up the buffer for up to 255 bytes
+                if length == FRAME_PAYLOAD.size and len(self.buffer) < length + 3:
+                    break
+                payload = bytes(self.buffer[2:2 + length])
+                if length != FRAME_PAYLOAD.size or checksum(payload) != self.buffer[2 + length]:
+                    # the payload can hold any byte, a newline in it would be read as a
+                    # line of text, so everything up to the next sync byte is thrown away
+                    self.corrupt_frames += 1
+                    sync = self.buffer.find(bytes([FRAME_SYNC]), 1)
+                    skipped = sync if sync != -1 else len(self.buffer)
+                    self.dropped_bytes += skipped
+                    del self.buffer[:skipped]
+                    continue
+                del self.buffer[:length + 3]
+                frame = Frame(*FRAME_PAYLOAD.unpack(payload))
+                self._check_seq(frame.seq)
+                lines.append(self.format_frame(frame))
+                continue
+
+            newline = self.buffer.find(b"\n")
+            sync = self.buffer.find(bytes([FRAME_SYNC]))
+            if sync != -1 and (newline == -1 or sync < newline):
+                # text never contains the sync byte, so this is the rest of a bad frame
+                self.dropped_bytes += sync
+                del self.buffer[:sync]
+                continue
+            if newline == -1:
+                break
+            # checked before stripping, like LineFramer, spaces can be part of the checksum
+            text, ok = check_line(bytes(self.buffer[:newline]).rstrip(b"\r"))
+            del self.buffer[:newline + 1]
+            if ok is False:
+                self.corrupt_frames += 1
+                continue
+            text = text.decode(errors="replace").strip()
+            if text:
+                lines.append(text)
+        return lines
+
+    def _check_seq(self, seq: int) -> None:
+        self.frames += 1
+        if self.last_seq is not None:
+            self.lost_frames += (seq - self.last_seq - 1) & 0xFFFF
+        self.last_seq = seq
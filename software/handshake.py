@@ -0,0 +1,82 @@
+"""
+Asks the firmware what it supports right after its port is opened, so the
+fastest protocol and largest command the board can take are used instead of
+whatever the run config names.
+"""
+from PySide6.QtCore import QObject, Signal, Slot, QTimer
+from com_port import ComPort, RawLine
+from firmware_interface import Capabilities, parse_hello
+
+HANDSHAKE_TIMEOUT = 1_000 # ms for the firmware to answer hello
+HANDSHAKE_ATTEMPTS = 2 # the first hello can be lost while the board finishes booting
+
+class Handshake(QObject):
+    """
+    Signals: finished(Capabilities or None) \n
+    None means the firmware did not answer, it is too old to know hello or
+    the port did not open.
+    """
+    finished = Signal(object)
+
+    def __init__(self, com_port: ComPort, boot_time: int = 0, timeout: int = HANDSHAKE_TIMEOUT):
+        super(Handshake, self).__init__()
+        self.com_port = com_port
+        self.boot_time = boot_time # ms to wait after opening before the board listens
+        self.capabilities: Capabilities | None = None
+        self.done = False
+        self.listening = False
+        self.attempts = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(timeout)
+        self.timer.timeout.connect(self.send)
+
+    def start(self, port_open: bool = True) -> None:
+        """Call right after connecting the port, port_open is what connecting returned"""
+        if not port_open:
+            self._finish(None)
+            return
+        self.com_port.received[list].connect(self.heard)
+        self.com_port.port_opened[bool].connect(self.opened)
+        self.listening = True
+        QTimer.singleShot(self.boot_time, self.send)
+
+    @Slot()
+    def send(self) -> None:
+        if self.done:
+            return
+        if self.attempts >= HANDSHAKE_ATTEMPTS:
+            self._finish(None)
+            return
+        self.attempts += 1
+        self.com_port._write("hello")
+        self.timer.start()
+
+    @Slot(bool)
+    def opened(self, ok: bool) -> None:
+        if not ok:
+            self._finish(None)
+
+    @Slot(list)
+    def heard(self, lines: list[RawLine]) -> None:
+        for line in lines:
+            if (capabilities := parse_hello(line.text)) is not None:
+                self._finish(capabilities)
+                return
+            if self.attempts and line.text.startswith("ERROR: Unknown command"):
+                # firmware from before the handshake
+                self._finish(None)
+                return
+
+    def _finish(self, capabilities: Capabilities | None) -> None:
+        if self.done:
+            return
+        self.done = True
+        self.capabilities = capabilities
+        self.timer.stop()
+        if self.listening:
+            self.com_port.received[list].disconnect(self.heard)
+            self.com_port.port_opened[bool].disconnect(self.opened)
+            self.listening = False
+        self.finished.emit(capabilities)
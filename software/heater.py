@@ -0,0 +1,148 @@
+"""
+Holds a sensor of a module at a setpoint with the module's heater, so a load
+step settles on its own instead of by toggling the heater by hand. The loop
+runs on the module's readings as they are saved, so it goes as fast as the
+sensor is read, and every output and setpoint is stored in the heater_log table,
+written in batches with the readings.
+"""
+from PySide6.QtCore import QObject, Signal, Slot, QTimer
+from datetime import datetime, timezone
+from typing import Callable
+from database import models as dm
+from run_config import ModuleConfig
+from db_writer import BufferedWriter
+import time
+
+HEATER_STALE_TIMEOUT = 30_000 # ms without a reading of the sensor before the heater is turned off
+STALE_READS = 3 # or this many read intervals of the sensor, whichever is longer
+CHECK_INTERVAL = 1_000 # ms
+
+class HeaterController(QObject):
+    """
+    Signals: log_message \n
+    PID on one sensor of a module. Connect the module's readings_saved to observe().
+    The derivative is of the temperature, not the error, so a setpoint step does
+    not kick the heater, and the integral stays within the duty range so it does
+    not wind up while the heater is saturated.
+    """
+    log_message = Signal(str)
+
+    def __init__(self, run: dm.Run, config: ModuleConfig, set_duty: Callable[[float], None], writer: BufferedWriter):
+        super(HeaterController, self).__init__()
+        self.run = run
+        self.config = config
+        self.name = config.module.name
+        self.heater = config.heater
+        self.sensor = self.heater.sensor
+        self.setpoint = self.heater.setpoint
+        self.set_duty = set_duty # sends the duty cycle in % to the firmware
+        self.writer = writer
+
+        self.running = False
+        self.duty = 0.0 # % the loop asked for
+        self.sent = None # whole % the firmware was last sent
+        self.integral = 0.0 # % duty
+        self.last_temperature = None
+        self.last_timestamp = None
+        self.last_heard = None # time.monotonic() of the last reading
+
+        interval = config.probe_interval if 'p' in self.sensor.lower() else config.sensor_interval
+        self.stale_timeout = max(HEATER_STALE_TIMEOUT / 1000, STALE_READS * interval) # s
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        self.integral = 0.0
+        self.last_temperature = self.last_timestamp = None
+        self.last_heard = time.monotonic()
+        self.timer.start(CHECK_INTERVAL)
+        self._log(None)
+        self.log_message.emit(f"{self.name}: heater holding {self.sensor} at {self.setpoint:g} C")
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        self.timer.stop()
+        self._apply(0, force=True)
+        self._log(None, stopped=True)
+        self.log_message.emit(f"{self.name}: heater off")
+
+    def set_setpoint(self, setpoint: float) -> None:
+        self.setpoint = setpoint
+        if self.running:
+            self._log(None)
+        self.log_message.emit(f"{self.name}: heater setpoint {setpoint:g} C")
+
+    @Slot(list)
+    def observe(self, readings: list[dm.Data]) -> None:
+        if not self.running:
+            return
+        for data in readings:
+            if data.sensor != self.sensor:
+                continue
+            if (temperature := self.temperature(data)) is not None:
+                self.update(data.timestamp, temperature)
+
+    def temperature(self, data: dm.Data) -> float | None:
+        """Calibrated where the module has a calibration for the sensor"""
+        calibration = self.config.module.calibration
+        if calibration is not None and getattr(calibration, self.sensor) is not None:
+            return data.celcius
+        return data.nominal_celcius
+
+    def update(self, timestamp: datetime, temperature: float) -> float:
+        """One step of the loop, returns the new duty in %"""
+        dt = (timestamp - self.last_timestamp).total_seconds() if self.last_timestamp else 0
+        error = self.setpoint - temperature
+        max_duty = self.heater.max_duty
+
+        proportional = self.heater.kp * error
+        if dt > 0:
+            self.integral = min(max(self.integral + self.heater.ki * error * dt, 0), max_duty)
+            derivative = -self.heater.kd * (temperature - self.last_temperature) / dt
+        else:
+            derivative = 0
+        duty = min(max(proportional + self.integral + derivative, 0), max_duty)
+
+        self.last_timestamp = timestamp
+        self.last_temperature = temperature
+        self.last_heard = time.monotonic()
+        self._apply(duty)
+        self._log(temperature, timestamp)
+        return duty
+
+    def _apply(self, duty: float, force: bool = False) -> None:
+        # the firmware takes whole percents, no need to resend the same one
+        if force or round(duty) != self.sent:
+            self.set_duty(duty)
+            self.sent = round(duty)
+        self.duty = duty
+
+    def _log(self, temperature: float | None, timestamp: datetime | None = None, stopped: bool = False) -> None:
+        self.writer.add(dm.HeaterLog(
+            run = self.run,
+            module = self.config.module,
+            timestamp = timestamp or datetime.now(timezone.utc),
+            sensor = self.sensor,
+            setpoint = None if stopped else self.setpoint,
+            temperature = temperature,
+            duty = self.duty
+        ))
+
+    @Slot()
+    def check(self) -> None:
+        # a heater left on without readings could run the module away
+        if not self.running or self.duty == 0:
+            return
+        quiet = time.monotonic() - self.last_heard
+        if quiet < self.stale_timeout:
+            return
+        self._apply(0)
+        # the next reading starts the loop over, not a derivative and integral across the gap
+        self.last_temperature = self.last_timestamp = None
+        self._log(None)
+        self.log_message.emit(f"{self.name}: no {self.sensor} reading for {quiet:.0f} s, heater off until there is one")
@@ -8,15 +8,22 @@ from database import models as dm
 import pyqtgraph as pg
 import sys
 from run_config import RunConfigModal, RunConfig, ModuleConfig
-from com_port import ComPort
+from com_port import ComPort, READ_MODE_READY_READ
+from port_manager import PortManager
+from serial_log import SerialLogView, PORT, READOUT, HEATERS, DATABASE
 from module import ModuleTemperatureMonitor
 from bump_bond_monitor import BumpBondMonitor
+from scheduler import AdaptiveScheduler
+from heater import HeaterController
+from sequence import SequenceRunner
+from db_writer import BufferedWriter
 import firmware_interface as fw
 from functools import partial
 from datetime import datetime, timezone
 
 COM_PORT_TIMER = 500
-UPDATE_TIMER = 10_000
+UPDATE_TIMER = 10_000 # ms between plot redraws, readings are scheduled per group by the AdaptiveScheduler
+SERIAL_LOG_FILE = 'serial_monitor.log'
 
 class MainWindow(qtw.QMainWindow):
     def __init__(self):
@@ -27,8 +34,12 @@ class MainWindow(qtw.QMainWindow):
         engine = create_engine(DATABASE_URI)
         Session = scoped_session(sessionmaker(bind=engine))
         self.session = Session()
+        self.writer = BufferedWriter(self.session)
         #--------------------------------------------------------#
         self.module_temperature_monitors: list[ModuleTemperatureMonitor] = []
+        self.bb_monitors: list[BumpBondMonitor] = []
+        self.heater_controllers: list[HeaterController] = []
+        self.sequence: SequenceRunner | None = None
         #--------------------------------MENU BAR-------------------------------#
         self.menu = self.menuBar()
 
@@ -36,9 +47,9 @@ class MainWindow(qtw.QMainWindow):
         self.run_menu = self.menu.addMenu('Run')
         
         # What an action is -> https://www.pythonguis.com/tutorials/pyside6-actions-toolbars-menus/
-        run_config_action = QAction('Choose Run Config', self)
-        run_config_action.triggered.connect(self.configure_from_run_config)
-        self.run_menu.addAction(run_config_action)
+        self.run_config_action = QAction('Choose Run Config', self)
+        self.run_config_action.triggered.connect(self.configure_from_run_config)
+        self.run_menu.addAction(self.run_config_action)
 
         exit_action = QAction('Exit', self)
         exit_action.triggered.connect(self._close)
@@ -47,16 +58,23 @@ class MainWindow(qtw.QMainWindow):
 
         #Port Menu
         self.port_menu = self.menu.addMenu('Port')
-        self.com_port= ComPort(readout_interval=COM_PORT_TIMER)
+        self.port_manager = PortManager(readout_interval=COM_PORT_TIMER, read_mode=READ_MODE_READY_READ, threaded=True)
+        self.port_manager.port_added[ComPort].connect(self.add_port_widget)
+        self.port_manager.adc_configured.connect(self.save_adc_setting)
+        self.port_manager.run_opened.connect(self.build_monitors)
 
-        # What QWidgetAction is -> https://doc.qt.io/qt-6/qwidgetaction.html
-        port_widget_action = qtw.QWidgetAction(self)
-        port_widget_action.setDefaultWidget(self.com_port)
-        self.port_menu.addAction(port_widget_action)
+        port_add_action = QAction('Add Port', self)
+        port_add_action.triggered.connect(self.port_manager.add_port)
+        self.port_menu.addAction(port_add_action)
 
-        port_disconnect_action = QAction('Disconnect', self)
-        port_disconnect_action.triggered.connect(self.com_port.disconnect_port)
+        port_disconnect_action = QAction('Disconnect All', self)
+        port_disconnect_action.triggered.connect(self.port_manager.disconnect_all)
         self.port_menu.addAction(port_disconnect_action)
+
+        replay_action = QAction('Replay Capture', self)
+        replay_action.triggered.connect(self.replay_capture)
+        self.port_menu.addAction(replay_action)
+        self.port_menu.addSeparator()
         #----------------------------End of Menu Bar----------------------------#
 
         #------------------------------- Tool Bar ------------------------------#
@@ -68,6 +86,14 @@ class MainWindow(qtw.QMainWindow):
         self.calibrate_adc = self.write_adc_action('Calibrate', 'calibrate')
         toolbar.addAction(self.calibrate_adc)
 
+        # speed vs noise of every ADC, recalibrate after changing it
+        self.adc_profile_dropdown = qtw.QComboBox()
+        self.adc_profile_dropdown.addItem('ADC Profile')
+        for profile, settings in fw.ADC_PROFILES.items():
+            self.adc_profile_dropdown.addItem(f"{profile} ({settings.conversion_rate:.1f} Hz)", profile)
+        self.adc_profile_dropdown.activated.connect(self.set_adc_profile)
+        toolbar.addWidget(self.adc_profile_dropdown)
+
         #---------------------------End of Tool Bar-----------------------------#
 
         central_widget = qtw.QWidget()
@@ -83,6 +109,7 @@ class MainWindow(qtw.QMainWindow):
         readout_btn_layout = qtw.QHBoxLayout(readout_btns)
 
         self.update_timer = QTimer()
+        self.scheduler = AdaptiveScheduler()
         self.live_readout_btn = qtw.QPushButton('Start', self)
         self.live_readout_btn.setCheckable(True)
         self.live_readout_btn.toggled.connect(
@@ -91,19 +118,38 @@ class MainWindow(qtw.QMainWindow):
         self.live_readout_btn.toggled.connect(
             lambda checked: self.update_timer.start(UPDATE_TIMER) if checked else self.update_timer.stop()
         )
+        self.live_readout_btn.toggled.connect(
+            lambda checked: self.scheduler.start() if checked else self.scheduler.stop()
+        )
+        self.live_readout_btn.toggled.connect(self.toggle_streams)
+        self.live_readout_btn.toggled.connect(self.toggle_heaters)
+        self.live_readout_btn.toggled.connect(self.toggle_sequence)
+        # everything read is in the database once the readout stops
+        self.live_readout_btn.toggled.connect(lambda checked: None if checked else self.writer.flush())
 
         readout_btn_layout.addWidget(self.live_readout_btn, stretch=1)  
 
         self.main_layout.addWidget(readout_btns)
 
-        self.serial_display = qtw.QPlainTextEdit()
-        self.serial_display.setReadOnly(True)
+        self.serial_display = SerialLogView(SERIAL_LOG_FILE)
         self.main_layout.addWidget(self.serial_display, stretch=0)
 
         self.setCentralWidget(central_widget)
 
-        self.com_port.log_message[str].connect(self.log) 
-        self.com_port.read[str].connect(self.log)
+        self.port_manager.log_message[str].connect(self.log) 
+        self.scheduler.log_message[str].connect(partial(self.log, message_type=READOUT))
+        self.writer.log_message[str].connect(partial(self.log, message_type=DATABASE))
+        self.port_manager.read[str].connect(self.serial_display.log_line)
+
+        # shows how many bytes are left in the serial buffers after each drain
+        self.buffer_depth_label = qtw.QLabel("Serial buffer: 0 B")
+        self.statusBar().addPermanentWidget(self.buffer_depth_label)
+        self.port_manager.buffer_depth_changed[int].connect(self.update_buffer_depth)
+        self.port_manager.transaction_stats_changed.connect(self.update_transaction_stats)
+
+        # reply latency and lost replies for every port
+        self.transaction_stats_label = qtw.QLabel("No replies yet")
+        self.statusBar().addWidget(self.transaction_stats_label)
 
         self.run_note = qtw.QWidget()
         run_note_layout = qtw.QHBoxLayout()
@@ -142,12 +188,75 @@ class MainWindow(qtw.QMainWindow):
         self.run_note_text_box.clear()
 
 
+    @Slot(bool)
+    def toggle_streams(self, checked: bool) -> None:
+        """Streaming firmwares read continuously while the readout is on, the rest are polled on the update timer"""
+        for module in self.module_temperature_monitors:
+            stream = self.port_manager.stream_for(module.config)
+            if stream is None:
+                continue
+            if checked:
+                sensor_names, probe_names = module.channel_names()
+                stream.start(sensor_names + probe_names)
+            else:
+                stream.stop()
+
+    @Slot(bool)
+    def toggle_heaters(self, checked: bool) -> None:
+        """The heater loops only run while the readout is on, they need its readings"""
+        for heater in self.heater_controllers:
+            heater.start() if checked else heater.stop()
+
+    @Slot(bool)
+    def toggle_sequence(self, checked: bool) -> None:
+        if self.sequence is None:
+            return
+        self.sequence.start() if checked else self.sequence.stop()
+
+    @Slot()
+    def sequence_finished(self) -> None:
+        if self.run_config.Sequence.stop_readout:
+            self.live_readout_btn.setChecked(False)
+
+    def set_module_heater(self, module_name: str, duty: float) -> None:
+        """Fixed heater load of a module without a heater loop, used by the sequence"""
+        mod_config = next(m for m in self.run_config.Modules if m.module.name == module_name)
+        port_name = self.port_manager.module_ports[module_name]
+        self.port_manager.set_heater(port_name, duty, position=mod_config.control_board_position)
+
+    @Slot(int)
+    def set_adc_profile(self, index: int) -> None:
+        profile = self.adc_profile_dropdown.itemData(index)
+        if profile is not None:
+            self.port_manager.set_adc_profile(profile)
+
+    def save_adc_setting(self, port_name: str, settings: fw.AdcSettings, sensor_names: list[str], position: str | None) -> None:
+        """Stores the ADC settings with the run, one row per sensor or one for all of them"""
+        if not hasattr(self, 'run_config'):
+            return
+        mc_config = next((mc for mc in self.run_config.Microcontrollers if mc.port == port_name), None)
+        timestamp = datetime.now(timezone.utc)
+        for sensor in sensor_names or [None]:
+            self.session.add(dm.AdcSetting(
+                run = self.run_config.Run.run,
+                control_board = mc_config.control_board if mc_config else None,
+                control_board_position = position,
+                sensor = sensor,
+                timestamp = timestamp,
+                profile = fw.adc_profile_name(settings),
+                filter_word = settings.filter_word,
+                chop = settings.chop,
+                conversion_rate = settings.conversion_rate
+            ))
+        self.session.commit()
+        self.log(f"{port_name}: ADC at {settings.conversion_rate:.1f} Hz, chopping {'on' if settings.chop else 'off'}")
+
     def write_adc_action(self, name: str, adc_command: str) -> QAction:
         """
         Used for generalizing the adding of toolbar buttons
         """
         write_action = QAction(name, self)
-        write_action.triggered.connect(partial(self.com_port._write, adc_command))
+        write_action.triggered.connect(partial(self.port_manager.write_all, adc_command))
         return write_action
 
     @Slot()
@@ -161,63 +270,172 @@ class MainWindow(qtw.QMainWindow):
         if run_config_modal.exec():
             
             self.run_config: RunConfig = run_config_modal.run_config
-            self.com_port.connect_by_name(self.run_config.Microcontroller.port)
-            
-            if len(self.run_config.Modules) != 1:
-                raise NotImplementedError("multi modules is not implemented yet")
-            
-            for mod_config in self.run_config.Modules:
-                firmware_name = self.run_config.Microcontroller.firmware_version
+            # the monitors of the previous run config stop being read
+            self.scheduler.remove_groups()
+            if self.sequence is not None:
+                self.sequence.stop()
+                self.sequence.deleteLater()
+                self.sequence = None
+            for heater in self.heater_controllers:
+                heater.stop()
+                heater.deleteLater()
+            self.heater_controllers = []
+            self.remove_monitors()
+            self.writer.flush()
+
+            # the monitors are made in build_monitors once every handshake is done,
+            # nothing can be configured or started until then
+            self.run_config_action.setEnabled(False)
+            self.live_readout_btn.setEnabled(False)
+            self.run_banner.setText(f"Connecting to the boards of run {self.run_config.Run.run}...")
+            self.port_manager.open_run(self.run_config)
 
-                firmware = fw.firmware_select(firmware_name)
+        else:
+            # remove all data and reset the page if there is any
+            # if theres not do nothing!
+            print("Cancel!")
+    
+    def remove_monitors(self) -> None:
+        """Takes the monitors of the previous run config off their dispatchers and the window"""
+        for monitor in [*self.module_temperature_monitors, *self.bb_monitors]:
+            monitor.dispatcher.unsubscribe(monitor.save)
+            self.module_layout.removeWidget(monitor)
+            monitor.deleteLater()
+        self.module_temperature_monitors = []
+        self.bb_monitors = []
 
-                module = ModuleTemperatureMonitor(
+    @Slot()
+    def build_monitors(self) -> None:
+        """Makes the monitors of the run config once its ports have finished their handshakes"""
+        self.run_config_action.setEnabled(True)
+        self.live_readout_btn.setEnabled(True)
+        for mod_config in self.run_config.Modules:
+            dispatcher = self.port_manager.dispatcher_for(mod_config)
+            firmware = self.port_manager.firmware_for(mod_config)
+            transactions = self.port_manager.transactions_for(mod_config)
+
+            module = ModuleTemperatureMonitor(
+                self.run_config.Run.run,
+                mod_config,
+                firmware,
+                dispatcher,
+                transactions,
+                self.scheduler,
+                self.update_timer,
+                self.session,
+                self.writer
+            )
+
+            self.module_temperature_monitors.append(module)
+            self.module_layout.addWidget(module)
+
+            if mod_config.heater is not None:
+                port_name = self.port_manager.module_ports[mod_config.module.name]
+                heater = HeaterController(
                     self.run_config.Run.run,
                     mod_config,
-                    firmware,
-                    self.com_port,
-                    self.update_timer,
-                    self.session
+                    partial(self.port_manager.set_heater, port_name, position=mod_config.control_board_position),
+                    self.writer
                 )
+                heater.log_message[str].connect(partial(self.log, message_type=HEATERS))
+                module.readings_saved.connect(heater.observe)
+                self.heater_controllers.append(heater)
+
+            if not firmware.supports_bump_bonds:
+                continue
+            BB_monitor = BumpBondMonitor(
+                mod_config.module.name + "_BB", 
+                self.run_config.Run.run,
+                mod_config,
+                [1,2,3,4], 
+                firmware, 
+                dispatcher,
+                transactions,
+                self.scheduler,
+                self.update_timer,
+                self.session,
+                self.writer)
+
+            self.bb_monitors.append(BB_monitor)
+            self.module_layout.addWidget(BB_monitor)
+
+        if self.run_config.Sequence is not None:
+            self.sequence = SequenceRunner(
+                self.run_config.Run.run,
+                self.run_config.Sequence,
+                {heater.name: heater for heater in self.heater_controllers},
+                self.set_module_heater,
+                self.session
+            )
+            self.sequence.log_message[str].connect(partial(self.log, message_type=HEATERS))
+            self.sequence.finished.connect(self.sequence_finished)
+            for module in self.module_temperature_monitors:
+                module.readings_saved.connect(self.sequence.observe)
+
+        self.session.commit() # this is for any new runs that have been added to the session
+        self.run_banner.setText(f"Selected Run: {self.run_config.Run.run}")
 
-                self.module_temperature_monitors.append(module)
-                self.module_layout.addWidget(module)
+    @Slot()
+    def replay_capture(self) -> None:
+        """Feeds a capture file to the monitors of one port in place of its board"""
+        port_names = list(self.port_manager.ports)
+        if not port_names:
+            self.log("Choose a run config before replaying a capture")
+            return
+        path, _ = qtw.QFileDialog.getOpenFileName(self, "Select Capture File")
+        if not path:
+            return
+        port_name, ok = qtw.QInputDialog.getItem(self, "Replay Capture", "Replay into port:", port_names, 0, False)
+        if not ok:
+            return
+        speed, ok = qtw.QInputDialog.getDouble(self, "Replay Capture", "Speed (1 = real time, 0 = as fast as possible):", 1.0, 0, 1000, 1)
+        if not ok:
+            return
+        self.port_manager.replay(path, port_name, speed)
 
-                BB_monitor = BumpBondMonitor(
-                    mod_config.module.name + "_BB", 
-                    self.run_config.Run.run,
-                    mod_config,
-                    [1,2,3,4], 
-                    firmware, 
-                    self.com_port,
-                    self.update_timer,
-                    self.session)
-                
-                self.module_layout.addWidget(BB_monitor)
+    @Slot(ComPort)
+    def add_port_widget(self, com_port: ComPort) -> None:
+        # What QWidgetAction is -> https://doc.qt.io/qt-6/qwidgetaction.html
+        port_widget_action = qtw.QWidgetAction(self)
+        port_widget_action.setDefaultWidget(com_port)
+        self.port_menu.addAction(port_widget_action)
 
-            self.session.commit() # this is for any new runs that have been added to the session
-            self.run_banner.setText(f"Selected Run: {self.run_config.Run.run}")
+    @Slot(int)
+    def update_buffer_depth(self, depth: int) -> None:
+        ports = self.port_manager.ports.items()
+        self.buffer_depth_label.setText(" | ".join(
+            f"{name}: {p.buffer_depth} B (max {p.max_buffer_depth} B, {p.lines_read} lines read, {p.corrupt_frames} corrupt)" for name, p in ports
+        ))
+
+    @Slot()
+    def update_transaction_stats(self) -> None:
+        self.transaction_stats_label.setText(" | ".join(
+            f"{name}: {t.stats.summary()}" for name, t in self.port_manager.transactions.items()
+        ))
 
-        else:
-            # remove all data and reset the page if there is any
-            # if theres not do nothing!
-            print("Cancel!")
-    
     @Slot(str)
-    def log(self, text: str) -> None:
-        self.serial_display.appendPlainText(text)
+    def log(self, text: str, message_type: str = PORT) -> None:
+        self.serial_display.log_event(text, message_type)
 
     @Slot()
     def _close(self) -> None:
         print("disconnected")
+        if self.sequence is not None:
+            self.sequence.stop()
+        for heater in self.heater_controllers:
+            heater.stop()
+        self.writer.close()
         self.session.close_all()
-        self.com_port.disconnect_port()
+        self.port_manager.disconnect_all()
+        self.serial_display.close_log_file()
         self.close()
 
 if __name__ == "__main__":
     app = qtw.QApplication()
 
     window = MainWindow()
+    # closing the window does not go through _close, the last readings still have to be written
+    app.aboutToQuit.connect(window.writer.close)
     window.resize(800, 800)
     window.show()
 
@@ -4,7 +4,11 @@ import pyqtgraph as pg
 from PySide6.QtCore import Signal, Slot, QTimer
 #from run_config import ModuleConfig
 from firmware_interface import ModuleFirmwareInterface
-from com_port import ComPort
+from com_port import RawLine
+from dispatcher import MessageDispatcher
+from transactions import TransactionManager
+from scheduler import AdaptiveScheduler
+from db_writer import BufferedWriter
 from sqlalchemy.orm import scoped_session
 from database import models as dm
 from datetime import datetime, timezone
@@ -13,13 +17,18 @@ from sqlalchemy import select
 from functools import partial
 
 SENSOR_NAMES = ["E1", "E2", "E3", "E4", "L1", "L2", "L3", "L4", "P1", "P2", "P3"]
+# ms the firmware can take per reply before it is asked again
+SENSOR_REPLY_TIMEOUT = 1_000
+PROBE_REPLY_TIMEOUT = 2_000 # the firmware waits over a second per probe
 
 class ModuleTemperatureMonitor(qtw.QFrame):
     """
+    Signals: readings_saved(list of Data) \n
     Used for reading out the temperatures on the thermal mockup module
     """
+    readings_saved = Signal(list)
 
-    def __init__(self, run:dm.Run, config: ModuleConfig, firmware: ModuleFirmwareInterface, com_port: ComPort, timer: QTimer, db_session: scoped_session):
+    def __init__(self, run:dm.Run, config: ModuleConfig, firmware: ModuleFirmwareInterface, dispatcher: MessageDispatcher, transactions: TransactionManager, scheduler: AdaptiveScheduler, timer: QTimer, db_session: scoped_session, writer: BufferedWriter):
         super(ModuleTemperatureMonitor, self).__init__()
 
         self.setFrameShape(qtw.QFrame.Shape.Box)
@@ -41,11 +50,13 @@ class ModuleTemperatureMonitor(qtw.QFrame):
 
         self.enabled_sensors = list(set(SENSOR_NAMES) - set(self.disabled_sensors))
         self.firmware = firmware
-        self.com_port = com_port
-        self.timer = timer
+        self.dispatcher = dispatcher
+        self.transactions = transactions
+        self.scheduler = scheduler
+        self.timer = timer # redraws the plot
         self.session = db_session
-
-        self.measurement_pendings = {s: False for s in self.enabled_sensors}
+        self.writer = writer # readings and frames are written in batches
+        self.frames: dict[str, dm.SweepFrame] = {} # sensor -> frame of the command its reading was asked for
 
         self.color_map = {
             "E3": "#9e0202", #dark red
@@ -113,58 +124,121 @@ class ModuleTemperatureMonitor(qtw.QFrame):
         self.button.clicked.connect(self.toggle_show)
         self.main_layout.addWidget(self.temperature_plot, stretch=1)
 
-        self.com_port.read[str].connect(self.save)
-        self.timer.timeout.connect(self.write_sensors)
+        # only readings for this module's enabled sensors are routed here
+        position = self.config.control_board_position if self.firmware.supports_board_positions else None
+        if self.firmware.streaming:
+            self.dispatcher.subscribe(self.save, "stream", [None], position)
+        elif self.firmware.combined_sweep:
+            self.dispatcher.subscribe(self.save, "sweep", [None], position)
+        else:
+            self.dispatcher.subscribe(self.save, "sensor", [s for s in self.enabled_sensors if 'p' not in s.lower()], position)
+            self.dispatcher.subscribe(self.save, "probe", [p for p in self.enabled_sensors if 'p' in p.lower()], position)
+        # the sensors and the probes are read at their own rates, faster while
+        # they are changing. A streaming firmware sends readings without being asked, see stream.py
+        sensor_names, probe_names = self.channel_names()
+        self.sensor_group, self.probe_group = f"{self.name} sensors", f"{self.name} probes"
+        if not self.firmware.streaming:
+            for group, names, interval in ((self.sensor_group, sensor_names, config.sensor_interval), (self.probe_group, probe_names, config.probe_interval)):
+                if names:
+                    self.scheduler.add_group(group, partial(self.write_sensors, names), int(interval * 1000), config.transient_threshold, int(config.fast_interval * 1000))
         self.timer.timeout.connect(self.update_plot)
 
     def toggle_show(self):
         self.temperature_plot.setVisible(not self.temperature_plot.isVisible())
         self.plot_settings.setVisible(not self.plot_settings.isVisible())
 
-    def save(self, raw_output:str):
-        # i love python
-        data = self.firmware.read_sensor(raw_output) or self.firmware.read_probe(raw_output)
-        if not data:
-            return
-
-        sensor, raw_value = data
-        if sensor not in self.enabled_sensors:
-            return
-        
-        self.measurement_pendings[sensor] = False
-
-        # print("in save data")
-        data = dm.Data(
-            run = self.run,
-            control_board = self.config.control_board,
-            control_board_position = self.config.control_board_position,
-            module = self.config.module,
-            module_orientation = self.config.orientation,
-            plate_position = self.config.cold_plate_position,
-            sensor = sensor,
-            timestamp = datetime.now(timezone.utc),
-            raw_adc = raw_value
-        )
+    @Slot(list)
+    def save(self, lines: list[RawLine]):
+        """Saves the sensor and probe readings the dispatcher routed to this module"""
+        saved = []
+        for line in lines:
+            reading = line.parsed
+            # a sweep carries every sensor and probe of the module in one line
+            readings = reading.value.samples if reading.kind in ("sweep", "stream") else [reading]
+            # streamed sweeps were never requested, each line is its own frame
+            stream_frame = self.new_frame("stream", line.timestamp, reading.value.seq) if reading.kind == "stream" else None
+            for sample in readings:
+                sensor, raw_value = sample.channel, sample.value
+                if sensor not in self.enabled_sensors:
+                    continue
+                frame = stream_frame or self.frames.pop(sensor, None)
+                if reading.kind != "stream":
+                    self.transactions.reply(self.name, sensor)
+                if frame is not None:
+                    if frame.end_time is None:
+                        # first reading of the frame, a frame nothing came back for is never stored
+                        frame.run = self.run
+                        frame.module = self.config.module
+                        self.writer.add(frame)
+                    frame.end_time = max(frame.end_time or line.timestamp, line.timestamp)
+                    if reading.kind == "sweep" and frame.seq is None:
+                        frame.seq = reading.value.seq
+
+                data = dm.Data(
+                    run = self.run,
+                    control_board = self.config.control_board,
+                    control_board_position = self.config.control_board_position,
+                    module = self.config.module,
+                    module_orientation = self.config.orientation,
+                    plate_position = self.config.cold_plate_position,
+                    sensor = sensor,
+                    timestamp = line.timestamp,
+                    raw_adc = raw_value,
+                    frame = frame
+                )
+                self.writer.add(data)
+                saved.append(data)
+                group = self.probe_group if 'p' in sensor.lower() else self.sensor_group
+                self.scheduler.observe(group, sensor, line.timestamp, data.nominal_celcius)
+        if saved:
+            self.readings_saved.emit(saved)
 
-        self.session.add(data)
-        self.session.commit()
+    def new_frame(self, kind: str, start_time: datetime, seq: int | None = None) -> dm.SweepFrame:
+        """Not linked to the run or stored until its first reading is saved"""
+        return dm.SweepFrame(kind=kind, seq=seq, start_time=start_time)
 
-    def write_sensors(self) -> str:
-        if all(self.measurement_pendings.values()):
-            # Make sure you have read all values before trying to read bumps again
-            return
-        
+    def channel_names(self) -> tuple[list[str], list[str]]:
+        """Enabled sensors and probes"""
         # have to do it like this because I was dumb before and combined probes and silicon sensors...
         sensor_names = [s for s in self.enabled_sensors if 'p' not in s.lower()]
         probe_names = [p for p in self.enabled_sensors if 'p' in p.lower()]
-        command = self.firmware.write_sensors(sensor_names) + "\n"  + self.firmware.write_probes(probe_names)
-        self.com_port._write(command)
+        return sensor_names, probe_names
+
+    def write_sensors(self, names: list[str] | None = None) -> str:
+        """Asks for the readings of names, every enabled sensor and probe by default"""
+        sensor_names, probe_names = self.channel_names()
+        if names is not None:
+            sensor_names = [s for s in sensor_names if s in names]
+            probe_names = [p for p in probe_names if p in names]
+
+        write_sensors, write_probes = self.firmware.write_sensors, self.firmware.write_probes
+        if self.firmware.supports_board_positions:
+            write_sensors = partial(write_sensors, position=self.config.control_board_position)
+            write_probes = partial(write_probes, position=self.config.control_board_position)
+
+        # sensors still waiting on a reply are left out, the transaction manager retries them
+        # and their readings stay in the frame they were first asked for in
+        now = datetime.now(timezone.utc)
+        kinds = [("sweep", sensor_names + probe_names)] if self.firmware.combined_sweep else [("sensors", sensor_names), ("probes", probe_names)]
+        for kind, kind_names in kinds:
+            asked = [n for n in kind_names if (self.name, n) not in self.transactions.pending]
+            if asked:
+                frame = self.new_frame(kind, now)
+                self.frames.update((name, frame) for name in asked)
 
-        # measurements are now pending!
-        for s in self.enabled_sensors:
-            self.measurement_pendings[s] = True
+        if self.firmware.combined_sweep:
+            timeout = (len(sensor_names) * SENSOR_REPLY_TIMEOUT + len(probe_names) * PROBE_REPLY_TIMEOUT) // len(sensor_names + probe_names)
+            requests = [(names, self.firmware.write_sweep, timeout) for names in self.batches(sensor_names + probe_names)]
+        else:
+            requests = [(names, write_sensors, SENSOR_REPLY_TIMEOUT) for names in self.batches(sensor_names)]
+            requests += [(names, write_probes, PROBE_REPLY_TIMEOUT) for names in self.batches(probe_names)]
+        commands = [self.transactions.request(self.name, names, write, timeout) for names, write, timeout in requests]
+        return "\n".join(command for command in commands if command)
 
-        return command
+    def batches(self, names: list[str]) -> list[list[str]]:
+        """Splits the names into commands the firmware can take, its handshake says how many fit"""
+        size = self.firmware.batch_size() or len(names)
+        return [names[i:i + size] for i in range(0, len(names), size)] if names else []
     
     def update_plot(self):
         for sensor in self.enabled_sensors:
@@ -0,0 +1,59 @@
+"""
+Times the firmware reply parser, it runs on every line read from every port.
+
+    python parse_benchmark.py
+    python parse_benchmark.py --capture run_42.cap --firmware "Thermal Mockup V2"
+"""
+import argparse
+import random
+import sys
+import timeit
+import firmware_interface as fw
+from capture import read_capture
+
+def synthetic_lines(n: int, seed: int = 0) -> list[str]:
+    """A sweep worth of every reply type, plus the odd line that is not a reading"""
+    rng = random.Random(seed)
+    lines = []
+    while len(lines) < n:
+        lines.extend(f"measure {ch} {rng.randrange(0x800000, 0x880000):x}" for ch in range(1, 9))
+        lines.extend(f"Probe {p}: 0x{rng.randrange(0x900, 0xd00):x}" for p in range(1, 4))
+        lines.extend(f"TP{tp} {rng.uniform(1.5, 1.8):.2f}" for tp in range(1, 5))
+        lines.append("ERROR: Channel ID Invalid")
+        lines.append("RESET COMPLETE")
+    return lines[:n]
+
+def main():
+    argParser = argparse.ArgumentParser(description = "Firmware reply parser benchmark")
+    argParser.add_argument('-f', '--firmware', action='store', default="Thermal Mockup V2", help='Firmware interface to benchmark')
+    argParser.add_argument('-c', '--capture', action='store', help='Benchmark on the lines of a capture file instead of synthetic ones')
+    argParser.add_argument('-n', '--lines', action='store', type=int, default=100_000, help='Number of synthetic lines')
+    argParser.add_argument('-r', '--repeat', action='store', type=int, default=5, help='Best of this many runs is reported')
+    args = argParser.parse_args()
+
+    firmware = fw.firmware_select(args.firmware)
+    if args.capture:
+        lines = [line.text for line in read_capture(args.capture)]
+    else:
+        lines = synthetic_lines(args.lines)
+    if not lines:
+        print("No lines to parse")
+        return 1
+
+    parsed = firmware.parse_batch(lines)
+    kinds = {}
+    for reading in parsed:
+        kind = reading.kind if reading is not None else "unparsed"
+        kinds[kind] = kinds.get(kind, 0) + 1
+    print(f"{len(lines)} lines: " + ", ".join(f"{n} {kind}" for kind, n in sorted(kinds.items())))
+
+    timings = {
+        "parse": lambda: [firmware.parse(line) for line in lines],
+        "parse_batch": lambda: firmware.parse_batch(lines),
+    }
+    for name, run in timings.items():
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print(f"{name:12s} {1e9 * best / len(lines):8.0f} ns/line {len(lines) / best:12,.0f} lines/s")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Opens one serial port per microcontroller in the run and routes each module
+to the port (and firmware interface) that reads it.
+"""
+from PySide6.QtCore import QObject, Signal, QTimer
+from functools import partial
+from com_port import ComPort, READ_MODE_READY_READ
+from transactions import TransactionManager
+from dispatcher import MessageDispatcher
+from capture import CaptureWriter, CaptureReplay
+from supervisor import PortSupervisor
+from framing import LineFramer
+from handshake import Handshake
+from stream import StreamController
+from run_config import RunConfig, ModuleConfig, MicroControllerConfig
+import firmware_interface as fw
+
+# the arduino resets when its port opens, wait for it to boot before configuring it
+ARDUINO_BOOT_TIME = 2_000
+
+class PortManager(QObject):
+    """
+    Signals: port_added, run_opened, log_message, read, buffer_depth_changed, transaction_stats_changed, adc_configured \n
+    Every port runs its own threaded ComPort so the boards are read in parallel.
+    """
+    port_added = Signal(ComPort)
+    run_opened = Signal() # every port of the run has finished its handshake
+    log_message = Signal(str)
+    read = Signal(str)
+    buffer_depth_changed = Signal(int)
+    transaction_stats_changed = Signal() # of any port
+    adc_configured = Signal(str, object, list, object) # port name, AdcSettings, sensor names (empty for all), control board position
+
+    def __init__(self, readout_interval: int = 1000, read_mode: str = READ_MODE_READY_READ, threaded: bool = True):
+        super(PortManager, self).__init__()
+        self.readout_interval = readout_interval
+        self.read_mode = read_mode
+        self.threaded = threaded
+
+        self.ports: dict[str, ComPort] = {} # port name -> com port
+        self.firmwares: dict[str, fw.ModuleFirmwareInterface] = {} # port name -> firmware interface
+        self.transactions: dict[str, TransactionManager] = {} # port name -> commands waiting on replies
+        self.dispatchers: dict[str, MessageDispatcher] = {} # port name -> routes readings to monitors
+        self.supervisors: dict[str, PortSupervisor] = {} # port name -> reconnects the port if it drops
+        self.handshakes: dict[str, Handshake] = {} # port name -> handshake still waiting on the firmware
+        self.streams: dict[str, StreamController] = {} # port name -> flow control, only for streaming firmware
+        self.module_ports: dict[str, str] = {} # module name -> port name
+        self.manual_ports: list[ComPort] = [] # added by hand, not in the run config
+        self.replays: list[CaptureReplay] = []
+        self.opening_run = False # run_opened not emitted yet
+
+    def open_run(self, run_config: RunConfig) -> None:
+        """
+        Opens every port in the run config and remembers which module is on which port.
+        Returns right away, run_opened is emitted once the handshakes are done, since
+        the monitors are made with the firmware interface the handshake picks.
+        """
+        for mc_config in run_config.Microcontrollers:
+            self.open(mc_config)
+        for mod_config in run_config.Modules:
+            self.module_ports[mod_config.module.name] = run_config.microcontroller_for(mod_config).port
+        # set after opening, a handshake that fails right away must not open the run early
+        self.opening_run = True
+        self._check_opened()
+
+    def open(self, mc_config: MicroControllerConfig) -> ComPort:
+        com_port = self.ports.get(mc_config.port)
+        if com_port is None:
+            com_port = self._new_port()
+            self.ports[mc_config.port] = com_port
+            self.transactions[mc_config.port] = TransactionManager(com_port)
+            self.transactions[mc_config.port].stats_changed.connect(self.transaction_stats_changed)
+            self.dispatchers[mc_config.port] = MessageDispatcher(com_port)
+            supervisor = PortSupervisor(com_port, self.transactions[mc_config.port], boot_time=ARDUINO_BOOT_TIME)
+            supervisor.log_message[str].connect(self.log_message)
+            self.supervisors[mc_config.port] = supervisor
+        else:
+            self.supervisors[mc_config.port].stop()
+            if (stream := self.streams.pop(mc_config.port, None)) is not None:
+                stream.stop()
+                stream.deleteLater()
+            if (handshake := self.handshakes.pop(mc_config.port, None)) is not None:
+                handshake.finished.disconnect()
+            com_port.disconnect_port()
+            # the monitors of the previous run config are gone, their routes and
+            # replies they were waiting on would block the new ones
+            self.dispatchers[mc_config.port].clear()
+            self.transactions[mc_config.port].clear()
+        self.transactions[mc_config.port].max_in_flight = mc_config.max_in_flight
+
+        # the configured interface until the handshake says what the firmware supports
+        self._use_firmware(mc_config, fw.firmware_select(mc_config.firmware_version))
+
+        # has to be set before connecting, the worker opens the port with them
+        com_port.set_baud_rate(mc_config.baud_rate)
+        com_port.set_capture(CaptureWriter(mc_config.capture) if mc_config.capture else None)
+        connected = com_port.connect_by_name(mc_config.port)
+        if not mc_config.handshake:
+            self._start(mc_config, delay=ARDUINO_BOOT_TIME)
+            return com_port
+
+        handshake = Handshake(com_port, boot_time=ARDUINO_BOOT_TIME)
+        handshake.finished.connect(partial(self.negotiated, mc_config))
+        self.handshakes[mc_config.port] = handshake
+        handshake.start(connected)
+        return com_port
+
+    def _use_firmware(self, mc_config: MicroControllerConfig, firmware: fw.ModuleFirmwareInterface) -> None:
+        # one firmware instance per port, modules on the same board share it
+        self.firmwares[mc_config.port] = firmware
+        self.transactions[mc_config.port].merge_commands = firmware.merge_commands
+        com_port = self.ports[mc_config.port]
+        com_port.set_framer(firmware.framer() or LineFramer(checksums=mc_config.checksums))
+        # lines are parsed once on the serial thread before reaching the monitors
+        com_port.set_parser(firmware.parse)
+
+    def negotiated(self, mc_config: MicroControllerConfig, capabilities: fw.Capabilities | None) -> None:
+        """Switches the port to the fastest interface the firmware supports, then configures it"""
+        self.handshakes.pop(mc_config.port, None)
+        if capabilities is None:
+            self.log_message.emit(f"{mc_config.port}: no handshake, using {mc_config.firmware_version}")
+        else:
+            firmware = fw.negotiate(capabilities, mc_config.firmware_version)
+            self._use_firmware(mc_config, firmware)
+            self.log_message.emit(
+                f"{mc_config.port}: {capabilities.firmware} {capabilities.version} with an {capabilities.adc}, "
+                f"using {firmware.__firmware_name__} with up to {firmware.batch_size()} channels per command"
+            )
+            if mc_config.adc_profile and "adcconfig" not in capabilities.commands:
+                self.log_message.emit(f"{mc_config.port}: the firmware cannot configure the ADC, adc_profile is ignored")
+            if mc_config.checksums and "checksum" not in capabilities.commands:
+                self.log_message.emit(f"{mc_config.port}: the firmware cannot add checksums, lines are read unchecked")
+        # the board has booted by the time it answered
+        self._start(mc_config, delay=0)
+        self._check_opened()
+
+    def _start(self, mc_config: MicroControllerConfig, delay: int) -> None:
+        com_port = self.ports[mc_config.port]
+        setup_commands = self.firmwares[mc_config.port].setup_commands()
+        if mc_config.device_timestamps:
+            setup_commands.append("timestamps on")
+        if mc_config.checksums:
+            setup_commands.append("checksum on")
+        if mc_config.adc_profile:
+            setup_commands.append(self.firmwares[mc_config.port].write_adc_config(fw.ADC_PROFILES[mc_config.adc_profile]))
+        for command in setup_commands:
+            QTimer.singleShot(delay, partial(com_port._write, command))
+        # the supervisor sends the setup commands again after a reconnect
+        self.supervisors[mc_config.port].watch(mc_config.port, setup_commands)
+        if self.firmwares[mc_config.port].streaming:
+            # made after the dispatcher so it hands credits back once the sweeps are saved
+            stream = StreamController(com_port, self.firmwares[mc_config.port], mc_config.port, mc_config.stream_rate, boot_time=ARDUINO_BOOT_TIME)
+            stream.log_message[str].connect(self.log_message)
+            self.streams[mc_config.port] = stream
+        if mc_config.adc_profile:
+            self.adc_configured.emit(mc_config.port, fw.ADC_PROFILES[mc_config.adc_profile], [], None)
+
+    def _check_opened(self) -> None:
+        if self.opening_run and not self.handshakes:
+            self.opening_run = False
+            self.run_opened.emit()
+
+    def add_port(self) -> ComPort:
+        """
+        Adds an unconnected port to be picked by hand from its dropdown. No module is
+        read from it, so it has no firmware, transactions or supervisor, but
+        write_all and disconnect_all still reach it.
+        """
+        com_port = self._new_port()
+        self.manual_ports.append(com_port)
+        return com_port
+
+    def _new_port(self) -> ComPort:
+        com_port = ComPort(readout_interval=self.readout_interval, read_mode=self.read_mode, threaded=self.threaded)
+        com_port.log_message[str].connect(self.log_message)
+        com_port.read[str].connect(self.read)
+        com_port.buffer_depth_changed[int].connect(self.buffer_depth_changed)
+        self.port_added.emit(com_port)
+        return com_port
+
+    def port_for(self, mod_config: ModuleConfig) -> ComPort:
+        return self.ports[self.module_ports[mod_config.module.name]]
+
+    def firmware_for(self, mod_config: ModuleConfig) -> fw.ModuleFirmwareInterface:
+        return self.firmwares[self.module_ports[mod_config.module.name]]
+
+    def transactions_for(self, mod_config: ModuleConfig) -> TransactionManager:
+        return self.transactions[self.module_ports[mod_config.module.name]]
+
+    def dispatcher_for(self, mod_config: ModuleConfig) -> MessageDispatcher:
+        return self.dispatchers[self.module_ports[mod_config.module.name]]
+
+    def stream_for(self, mod_config: ModuleConfig) -> StreamController | None:
+        """None if the module's firmware is polled instead of streaming"""
+        return self.streams.get(self.module_ports[mod_config.module.name])
+
+    def modules_on_port(self, port_name: str) -> list[str]:
+        return [module for module, port in self.module_ports.items() if port == port_name]
+
+    def write_all(self, message: str) -> None:
+        """Sends the same command to every board, used for reset and calibrate"""
+        for com_port in [*self.ports.values(), *self.manual_ports]:
+            com_port._write(message)
+
+    def set_adc(self, port_name: str, settings: fw.AdcSettings, sensor_names: list[str] | None = None, position: str | None = None) -> None:
+        """
+        Changes the ADC filter and chopping of some sensors on a port, all of them
+        by default. Also used after a reconnect, since the board forgets them.
+        """
+        firmware = self.firmwares[port_name]
+        if firmware.supports_board_positions:
+            command = firmware.write_adc_config(settings, sensor_names, position=position)
+        else:
+            command = firmware.write_adc_config(settings, sensor_names)
+        self.ports[port_name]._write(command)
+
+        supervisor = self.supervisors[port_name]
+        if not sensor_names and position is None:
+            # replaces every earlier setting
+            supervisor.setup_commands = [c for c in supervisor.setup_commands if not c.startswith("adcconfig")]
+        supervisor.setup_commands.append(command)
+        self.adc_configured.emit(port_name, settings, sensor_names or [], position)
+
+    def set_heater(self, port_name: str, duty: float, position: str | None = None) -> None:
+        """Keeps the heater of the module at position on for duty percent of the time"""
+        command = self.firmwares[port_name].write_heater(duty, position=position)
+        self.ports[port_name]._write(command)
+        # the board turns every heater off when it reboots
+        supervisor = self.supervisors[port_name]
+        prefix = command.rsplit(" ", 1)[0] + " "
+        supervisor.setup_commands = [c for c in supervisor.setup_commands if not c.startswith(prefix)]
+        if duty > 0:
+            supervisor.setup_commands.append(command)
+
+    def set_adc_profile(self, profile: str) -> None:
+        """Puts every port on one of the ADC_PROFILES"""
+        for port_name in self.firmwares:
+            self.set_adc(port_name, fw.ADC_PROFILES[profile])
+
+    def replay(self, path: str, port_name: str, speed: float = 1.0) -> CaptureReplay:
+        """
+        Plays a capture file into the port instead of the board, so the monitors
+        parse, save and plot it exactly as they would live traffic.
+        """
+        com_port = self.ports[port_name]
+        self.supervisors[port_name].stop()
+        com_port.disconnect_port()
+        replay = CaptureReplay(path, com_port, speed)
+        replay.log_message[str].connect(self.log_message)
+        replay.finished.connect(partial(self.replays.remove, replay))
+        self.replays.append(replay)
+        replay.start()
+        return replay
+
+    def disconnect_all(self) -> None:
+        for handshake in self.handshakes.values():
+            handshake.finished.disconnect()
+        self.handshakes.clear()
+        # the monitors are still made, with the configured firmware interfaces
+        self._check_opened()
+        for stream in self.streams.values():
+            stream.stop()
+        for replay in self.replays:
+            replay.stop()
+        self.replays.clear()
+        for supervisor in self.supervisors.values():
+            supervisor.stop()
+        for com_port in [*self.ports.values(), *self.manual_ports]:
+            com_port.disconnect_port()
+            com_port.set_capture(None)
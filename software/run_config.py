@@ -11,10 +11,11 @@ import database.models as dm
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 from itertools import zip_longest
-from firmware_interface import available_firmwares
+from firmware_interface import available_firmwares, firmware_select, ADC_PROFILES
 from functools import partial
 
 AVAILABLE_FIRMWARES:list[str] = available_firmwares()
+BAUD_RATES: list[int] = [1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200]
 
 def gridded_list(array: list, n_cols: int) -> list[tuple]:
     """
@@ -59,6 +60,17 @@ class CaseInsensitiveModel(BaseModel, DBBase):
             return value
         return __lower__(values)
 
+class HeaterConfig(CaseInsensitiveModel):
+    """Holds one sensor of the module at a temperature with its heater, see heater.py"""
+    sensor: Literal['E1', 'E2', 'E3', 'E4', 'L1', 'L2', 'L3', 'L4', 'P1', "P2", "P3"]
+    setpoint: float # C
+    kp: float = Field(10, ge=0) # % duty per C below the setpoint
+    ki: float = Field(0.2, ge=0) # % duty per C per s below the setpoint
+    kd: float = Field(0, ge=0) # % duty per C/s the temperature is falling
+    max_duty: float = Field(100, gt=0, le=100) # %
+
+    _uppercase_sensor = field_validator('sensor', mode='before')(upper_validator)
+
 class ModuleConfig(CaseInsensitiveModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
     module: dm.Module
@@ -68,6 +80,15 @@ class ModuleConfig(CaseInsensitiveModel):
     control_board_position: Optional[Literal['A', 'B', 'C', 'D']] = None
     disabled_sensors: list[Literal['E1', 'E2', 'E3', 'E4', 'L1', 'L2', 'L3', 'L4', 'P1', "P2", "P3"]] = []
     reference_resistors: dict[int, float]
+    bb_samples: int = Field(1, ge=1, le=1024) # analog reads the firmware averages per bump bond reading, see write_bbs
+    # s between reads while steady, each is its own readout group, see scheduler.py
+    sensor_interval: float = Field(10, gt=0)
+    probe_interval: float = Field(10, gt=0)
+    bb_interval: float = Field(10, gt=0) # per bump bond path
+    fast_interval: float = Field(2, gt=0) # s between reads of a group while it is changing
+    transient_threshold: float = Field(0.5, gt=0) # C per minute above which the sensors and probes are read fast
+    bb_transient_threshold: float = Field(5, gt=0) # ohms per minute above which a bump bond path is read fast
+    heater: Optional[HeaterConfig] = None # closed loop heater control, needs a firmware that drives the heaters
 
     _lowercase_orientation = field_validator('orientation', mode='before')(lower_validator)
     _module_exists_validator = field_validator('module', mode='before')(
@@ -77,9 +98,45 @@ class ModuleConfig(CaseInsensitiveModel):
         partial(DBBase.exists_validator, db_model=dm.ControlBoard, column=dm.ControlBoard.name)
     )
 
+    @model_validator(mode='after')
+    def heater_sensor_enabled(self) -> Self:
+        if self.heater is not None:
+            assert self.heater.sensor not in self.disabled_sensors, f"The heater of module {self.module.name} is controlled by {self.heater.sensor}, which is disabled"
+        return self
+
 class MicroControllerConfig(CaseInsensitiveModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
     firmware_version: Literal[*AVAILABLE_FIRMWARES]
     port: str
+    baud_rate: Literal[*BAUD_RATES] = 9600 # must match BAUD_RATE in the firmware
+    control_board: Optional[dm.ControlBoard] = None # which modules this port reads, needed with several ports
+    capture: Optional[str] = None # file every line read is appended to, see capture.py
+    device_timestamps: bool = False # have the firmware stamp readings with its millis()
+    adc_profile: Optional[Literal[*ADC_PROFILES]] = None # ADC speed vs noise, see ADC_PROFILES in firmware_interface.py
+    checksums: bool = False # have the firmware end lines with a checksum and drop the ones that do not match
+    handshake: bool = True # ask the firmware what it supports and use its fastest protocol, see handshake.py
+    stream_rate: float = Field(1.0, ge=0) # sweeps per second with a streaming firmware_version, 0 is as fast as the ADC converts
+    max_in_flight: int = Field(2, ge=1) # commands sent before their replies are in, the rest wait their turn, see transactions.py
+
+    _control_board_validator = field_validator('control_board', mode='before')(
+        partial(DBBase.exists_validator, db_model=dm.ControlBoard, column=dm.ControlBoard.name)
+    )
+
+class SequenceStepConfig(CaseInsensitiveModel):
+    """One load level of a sequence, see sequence.py"""
+    name: Optional[str] = None
+    setpoint: dict[str, float] = {} # module name -> C, for modules with a heater section
+    duty: dict[str, float] = {} # module name -> % the heater is on, a fixed load for modules without a heater section
+    hold: float = Field(0, ge=0) # s to keep reading once steady before the next step
+    timeout: Optional[float] = Field(None, gt=0) # s, instead of the sequence's timeout
+
+class SequenceConfig(CaseInsensitiveModel):
+    """Steps through load levels on its own once the readout is started, see sequence.py"""
+    steps: list[SequenceStepConfig] = Field(min_length=1)
+    steady_window: float = Field(300, gt=0) # s every sensor has to be flat over
+    steady_rate: float = Field(0.05, gt=0) # C per minute, fitted over steady_window
+    timeout: float = Field(3600, gt=0) # s a step waits for steady state before moving on anyway
+    stop_readout: bool = True # stop the readout, and so the heaters, after the last step
 
 class Runfig(CaseInsensitiveModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -123,25 +180,90 @@ class Runfig(CaseInsensitiveModel):
     
 class RunConfig(CaseInsensitiveModel):
     Run: Runfig = Field(validation_alias='run') #gotta do this alias becuase of the case insensitivity change...
-    Microcontroller: MicroControllerConfig = Field(validation_alias='microcontroller')
+    # [MICROCONTROLLER] for one port or [[MICROCONTROLLER]] for several
+    Microcontrollers: list[MicroControllerConfig] = Field(validation_alias='microcontroller')
     Modules: list[ModuleConfig] = Field(validation_alias="modules")
+    Sequence: Optional[SequenceConfig] = Field(None, validation_alias="sequence")
+
+    @field_validator('Microcontrollers', mode='before')
+    @classmethod
+    def single_microcontroller_to_list(cls, value: Any) -> Any:
+        return [value] if isinstance(value, dict) else value
+
+    @field_validator('Microcontrollers', mode='after')
+    @classmethod
+    def unique_ports(cls, mc_configs: list[MicroControllerConfig]):
+        assert len(mc_configs) > 0, "At least one microcontroller must be provided."
+        ports = [mc_config.port for mc_config in mc_configs]
+        assert len(ports) == len(set(ports)), "Not all microcontroller ports are unique!"
+        if len(mc_configs) > 1:
+            for mc_config in mc_configs:
+                assert mc_config.control_board is not None, f"Please provide the control board read by port {mc_config.port} in this multi port setup"
+            control_boards = [mc_config.control_board.name for mc_config in mc_configs]
+            assert len(control_boards) == len(set(control_boards)), "Two ports are reading the same control board!"
+        return mc_configs
 
     @field_validator('Modules',mode='after')
     @classmethod
     def multi_module_need_control_board(cls, module_configs: list[ModuleConfig]):
         assert len(module_configs) > 0, "At least one module must be provided."
         if len(module_configs) > 1:
-            control_boards = []
-            control_board_positions = []
+            board_positions = []
             for mod_config in module_configs:
                 assert mod_config.control_board is not None, f"Please provide the control board used for this module ({mod_config.module.name}) in this multi module setup"
                 assert mod_config.control_board_position is not None, f"Please provide the position on the control board for this module ({mod_config.module.name}) in this multi module setup"
-                control_boards.append(mod_config.control_board)
-                control_board_positions.append(mod_config.control_board_position)
-            assert len(control_boards) == 1, f"You have selected multiple control boards when the software only supports one"
-            assert len(control_board_positions) == len(set(control_board_positions)), "Not all control board positions are unique!"
+                board_positions.append((mod_config.control_board.name, mod_config.control_board_position))
+            assert len(board_positions) == len(set(board_positions)), "Not all control board positions are unique!"
         return module_configs
 
+    @model_validator(mode='after')
+    def modules_have_microcontroller(self) -> Self:
+        for mod_config in self.Modules:
+            mc_config = self.microcontroller_for(mod_config)
+            if firmware_select(mc_config.firmware_version).supports_board_positions:
+                # replies are routed to modules by the position they came from
+                assert mod_config.control_board_position is not None, f"Please provide the control board position of module {mod_config.module.name}, {mc_config.firmware_version} reads several boards"
+            if mod_config.heater is not None:
+                assert firmware_select(mc_config.firmware_version).supports_heaters, f"{mc_config.firmware_version} cannot drive the heater of module {mod_config.module.name}"
+        return self
+
+    @model_validator(mode='after')
+    def one_module_per_port_without_positions(self) -> Self:
+        # the replies of firmware without board positions cannot be told apart by module
+        modules_on_port: dict[str, list[str]] = {}
+        for mod_config in self.Modules:
+            modules_on_port.setdefault(self.microcontroller_for(mod_config).port, []).append(mod_config.module.name)
+        for mc_config in self.Microcontrollers:
+            modules = modules_on_port.get(mc_config.port, [])
+            if len(modules) > 1:
+                assert firmware_select(mc_config.firmware_version).supports_board_positions, f"{mc_config.firmware_version} cannot tell modules {', '.join(modules)} apart, use one port per module"
+        return self
+
+    @model_validator(mode='after')
+    def sequence_modules(self) -> Self:
+        if self.Sequence is None:
+            return self
+        mod_configs = {mod_config.module.name: mod_config for mod_config in self.Modules}
+        for i, step in enumerate(self.Sequence.steps, start=1):
+            for name in step.setpoint:
+                assert name in mod_configs, f"Sequence step {i} sets module {name}, which is not in the run config"
+                assert mod_configs[name].heater is not None, f"Sequence step {i} sets a setpoint for module {name}, which has no heater section"
+            for name, duty in step.duty.items():
+                assert name in mod_configs, f"Sequence step {i} sets module {name}, which is not in the run config"
+                assert mod_configs[name].heater is None, f"Sequence step {i} sets a duty for module {name}, its heater loop sets that, give a setpoint instead"
+                assert firmware_select(self.microcontroller_for(mod_configs[name]).firmware_version).supports_heaters, f"Sequence step {i} sets a duty for module {name}, its firmware cannot drive the heaters"
+                assert 0 <= duty <= 100, f"Sequence step {i} duty {duty} for module {name} is not between 0 and 100 %"
+        return self
+
+    def microcontroller_for(self, mod_config: ModuleConfig) -> MicroControllerConfig:
+        """The microcontroller (and so the port) that reads this module"""
+        if len(self.Microcontrollers) == 1:
+            return self.Microcontrollers[0]
+        for mc_config in self.Microcontrollers:
+            if mod_config.control_board is not None and mc_config.control_board.name == mod_config.control_board.name:
+                return mc_config
+        raise ValueError(f"No microcontroller reads the control board of module {mod_config.module.name}")
+
 #=============== Widgets ===============#
 
 class RunConfigModal(qtw.QDialog):
@@ -202,8 +324,11 @@ class RunConfigModal(qtw.QDialog):
             with open(file_path, 'rb') as f:
                 self.run_config = RunConfig.model_validate(tomllib.load(f))
             self.add_run_visual(self.run_config.Run.run)
-            self.add_microcontroller_visual(self.run_config.Microcontroller)
+            for mc_config in self.run_config.Microcontrollers:
+                self.add_microcontroller_visual(mc_config)
             self.add_modules_visual(self.run_config.Modules)
+            if self.run_config.Sequence is not None:
+                self.add_sequence_visual(self.run_config.Sequence)
             self.add_image_visual(self.run_config.Run.run)
         except ValidationError as error:
             print(error)
@@ -226,6 +351,17 @@ class RunConfigModal(qtw.QDialog):
         run_info_layout.setAlignment(Qt.AlignCenter)
         run_info_layout.addWidget(qtw.QLabel(f"Firmware: {microcontroller_config.firmware_version}"))
         run_info_layout.addWidget(qtw.QLabel(f"Port: {microcontroller_config.port}"))
+        run_info_layout.addWidget(qtw.QLabel(f"Baud Rate: {microcontroller_config.baud_rate}"))
+        run_info_layout.addWidget(qtw.QLabel(f"Control Board: {microcontroller_config.control_board}"))
+        run_info_layout.addWidget(qtw.QLabel(f"Device Timestamps: {microcontroller_config.device_timestamps}"))
+        run_info_layout.addWidget(qtw.QLabel(f"ADC Profile: {microcontroller_config.adc_profile or 'firmware default'}"))
+        run_info_layout.addWidget(qtw.QLabel(f"Checksums: {microcontroller_config.checksums}"))
+        run_info_layout.addWidget(qtw.QLabel(f"Handshake: {microcontroller_config.handshake}"))
+        run_info_layout.addWidget(qtw.QLabel(f"Max In Flight: {microcontroller_config.max_in_flight}"))
+        if firmware_select(microcontroller_config.firmware_version).streaming:
+            run_info_layout.addWidget(qtw.QLabel(f"Stream Rate: {microcontroller_config.stream_rate:g} Hz"))
+        if microcontroller_config.capture:
+            run_info_layout.addWidget(qtw.QLabel(f"Capture: {microcontroller_config.capture}"))
 
         self.config_preview_layout.addWidget(run_info)
     
@@ -253,12 +389,36 @@ class RunConfigModal(qtw.QDialog):
                 module_info_layout.addWidget(qtw.QLabel(f"Control Board: {module_config.control_board}"))
                 module_info_layout.addWidget(qtw.QLabel(f"Control Board Position: {module_config.control_board_position}"))
                 module_info_layout.addWidget(qtw.QLabel(f"Reference Resistors: {module_config.reference_resistors}"))
+                module_info_layout.addWidget(qtw.QLabel(f"Bump Bond Samples: {module_config.bb_samples}"))
+                module_info_layout.addWidget(qtw.QLabel(
+                    f"Read Every: sensors {module_config.sensor_interval:g} s, probes {module_config.probe_interval:g} s, "
+                    f"bump bonds {module_config.bb_interval:g} s, {module_config.fast_interval:g} s while changing"
+                ))
+                if (heater := module_config.heater) is not None:
+                    module_info_layout.addWidget(qtw.QLabel(
+                        f"Heater: {heater.sensor} at {heater.setpoint:g} C (kp {heater.kp:g}, ki {heater.ki:g}, kd {heater.kd:g}, max {heater.max_duty:g} %)"
+                    ))
 
                 modules_layout.addWidget(module_info, i, j)
 
         modules_widget.setLayout(modules_layout)
         self.config_preview_layout.addWidget(modules_widget)
 
+    def add_sequence_visual(self, sequence: SequenceConfig) -> None:
+        sequence_info = qtw.QGroupBox("Sequence")
+        sequence_layout = qtw.QVBoxLayout(sequence_info)
+        sequence_layout.addWidget(qtw.QLabel(
+            f"Steady: under {sequence.steady_rate:g} C/min over {sequence.steady_window:g} s, "
+            f"at most {sequence.timeout:g} s per step"
+        ))
+        for i, step in enumerate(sequence.steps, start=1):
+            levels = [f"{name} at {setpoint:g} C" for name, setpoint in step.setpoint.items()]
+            levels += [f"{name} at {duty:g} %" for name, duty in step.duty.items()]
+            sequence_layout.addWidget(qtw.QLabel(
+                f"{i}. {step.name or ''} {', '.join(levels) or 'no change'}, hold {step.hold:g} s"
+            ))
+        self.config_preview_layout.addWidget(sequence_info)
+
     def add_image_visual(self, run) -> None:
         pixmap = QPixmap()
         pixmap.loadFromData(run.cold_plate.plate_image)
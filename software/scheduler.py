@@ -0,0 +1,121 @@
+"""
+Decides when each group of channels is read, instead of every sensor on one
+shared timer. A group (a module's sensors, its probes, a bump bond path) is
+read at its own base interval while it is steady, and at its fast interval as
+soon as one of its readings changes faster than its threshold, so a power
+step is followed closely without filling the data table with flat readings
+for the rest of the run.
+"""
+from PySide6.QtCore import QObject, Signal, Slot, QTimer
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Hashable
+import time
+
+TICK = 250 # ms, how often due groups are checked
+FAST_INTERVAL = 2_000 # ms, default interval while a group is changing
+RELAX_FACTOR = 1.5 # the interval grows by this every steady read until it is back at the base interval
+RATE_WINDOW = 60 # s of readings the rate of change is fitted over, so noise between two close readings is not taken for a transient
+
+@dataclass
+class ReadoutGroup:
+    """Channels read together by one call to read"""
+    name: str
+    read: Callable[[], object] # sends the commands for the group
+    base_interval: float # s, while steady
+    fast_interval: float # s, while changing
+    threshold: float # change per minute of a reading above which the group is read fast
+    interval: float # s, current
+    next_read: float = 0 # time.monotonic()
+    observed: bool = False # a reading arrived since the last read
+    max_rate: float = 0 # largest change per minute seen since the last read
+    history: dict[Hashable, deque[tuple[float, float]]] = field(default_factory=dict) # channel -> (s, value) within RATE_WINDOW
+
+def fitted_rate(history: deque[tuple[float, float]]) -> float | None:
+    """Absolute least squares slope of the readings per minute, None with less than two times"""
+    n = len(history)
+    if n < 2:
+        return None
+    mean_t = sum(t for t, _ in history) / n
+    mean_v = sum(v for _, v in history) / n
+    spread = sum((t - mean_t)**2 for t, _ in history)
+    if spread == 0:
+        return None
+    return abs(sum((t - mean_t) * (v - mean_v) for t, v in history) / spread) * 60
+
+class AdaptiveScheduler(QObject):
+    """
+    Signals: log_message \n
+    Monitors add their groups and report every reading with observe().
+    """
+    log_message = Signal(str)
+
+    def __init__(self, tick: int = TICK):
+        super(AdaptiveScheduler, self).__init__()
+        self.groups: dict[str, ReadoutGroup] = {}
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.run_due)
+        self.tick = tick
+
+    def add_group(self, name: str, read: Callable[[], object], base_interval: int, threshold: float, fast_interval: int = FAST_INTERVAL) -> None:
+        """Intervals in ms, threshold in units of the observed values per minute"""
+        if name in self.groups:
+            raise ValueError(f"Two readout groups are named {name}")
+        fast_interval = min(fast_interval, base_interval)
+        self.groups[name] = ReadoutGroup(name, read, base_interval / 1000, fast_interval / 1000, threshold, base_interval / 1000)
+
+    def remove_groups(self) -> None:
+        self.groups.clear()
+
+    def start(self) -> None:
+        now = time.monotonic()
+        for group in self.groups.values():
+            group.next_read = now # everything is read right away, like the first timer tick used to
+        self.timer.start(self.tick)
+
+    def stop(self) -> None:
+        self.timer.stop()
+
+    @Slot()
+    def run_due(self) -> None:
+        now = time.monotonic()
+        for group in self.groups.values():
+            if now < group.next_read:
+                continue
+            self._relax(group)
+            group.read()
+            group.next_read = now + group.interval
+
+    def _relax(self, group: ReadoutGroup) -> None:
+        # only steady readings relax it, a read that got no replies says nothing
+        steady = group.observed and group.max_rate <= group.threshold
+        group.observed = False
+        group.max_rate = 0
+        if not steady or group.interval >= group.base_interval:
+            return
+        group.interval = min(group.interval * RELAX_FACTOR, group.base_interval)
+        if group.interval == group.base_interval:
+            self.log_message.emit(f"{group.name}: steady, reading every {group.interval:g} s")
+
+    def observe(self, name: str, channel: Hashable, timestamp: datetime, value: float | None) -> None:
+        """A reading of one channel of a group, value in the units its threshold is in"""
+        group = self.groups.get(name)
+        if group is None or value is None:
+            return
+        t = timestamp.timestamp()
+        history = group.history.setdefault(channel, deque())
+        history.append((t, value))
+        while t - history[0][0] > RATE_WINDOW:
+            history.popleft()
+        group.observed = True
+        if (rate := fitted_rate(history)) is None:
+            return
+        group.max_rate = max(group.max_rate, rate)
+        if rate <= group.threshold or group.interval == group.fast_interval:
+            return
+        group.interval = group.fast_interval
+        # read again soon instead of after what is left of the slow interval
+        group.next_read = min(group.next_read, time.monotonic() + group.interval)
+        self.log_message.emit(f"{group.name}: {channel} changing {rate:.2g}/min, reading every {group.interval:g} s")
@@ -0,0 +1,154 @@
+"""
+Runs a thermal campaign without anyone at the station. Once the readout is
+started it goes through the steps of the run config's [SEQUENCE], sets each
+step's heater setpoints and fixed loads, waits until every sensor is steady
+instead of for a fixed time, holds there, and writes a RunNote at every step
+so the run can be cut up by step afterwards.
+"""
+from PySide6.QtCore import QObject, Signal, Slot, QTimer
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Hashable
+from sqlalchemy.orm import scoped_session
+from database import models as dm
+from run_config import SequenceConfig, SequenceStepConfig
+from heater import HeaterController
+from scheduler import fitted_rate
+import time
+
+CHECK_INTERVAL = 5_000 # ms
+STEADY_COVERAGE = 0.9 # part of the steady window a sensor's readings have to span before it counts as steady
+
+class SequenceRunner(QObject):
+    """
+    Signals: log_message, finished \n
+    Connect every module's readings_saved to observe(). Steady means every
+    sensor that has reported since the step started changes less than
+    steady_rate, fitted over the last steady_window of its readings.
+    """
+    log_message = Signal(str)
+    finished = Signal()
+
+    def __init__(self, run: dm.Run, config: SequenceConfig, heaters: dict[str, HeaterController], set_duty: Callable[[str, float], None], db_session: scoped_session):
+        super(SequenceRunner, self).__init__()
+        self.run = run
+        self.config = config
+        self.heaters = heaters # module name -> its heater loop
+        self.set_duty = set_duty # (module name, %) for the fixed loads
+        self.session = db_session
+
+        self.running = False
+        self.step_index = -1
+        self.step_started = None # time.monotonic()
+        self.steady_at = None # time.monotonic() the step became steady, None while settling
+        self.duty_modules: set[str] = set() # modules given a fixed load, turned off at the end
+        self.history: dict[Hashable, deque[tuple[float, float]]] = {} # (module, sensor) -> (s, C) within steady_window
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+
+    @property
+    def step(self) -> SequenceStepConfig:
+        return self.config.steps[self.step_index]
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        self.note(f"Sequence started, {len(self.config.steps)} steps")
+        self._begin(0)
+        self.timer.start(CHECK_INTERVAL)
+
+    def stop(self) -> None:
+        """Stops before the last step, ex: the readout was stopped by hand"""
+        if not self.running:
+            return
+        self._end()
+        self.note(f"Sequence stopped during step {self.step_index + 1}")
+
+    def _end(self) -> None:
+        self.running = False
+        self.timer.stop()
+        for name in self.duty_modules:
+            self.set_duty(name, 0)
+        self.duty_modules.clear()
+
+    def _begin(self, index: int) -> None:
+        self.step_index = index
+        self.step_started = time.monotonic()
+        self.steady_at = None
+        # only readings from this step count towards it being steady
+        self.history.clear()
+
+        levels = []
+        for name, setpoint in self.step.setpoint.items():
+            self.heaters[name].set_setpoint(setpoint)
+            levels.append(f"{name} setpoint {setpoint:g} C")
+        for name, duty in self.step.duty.items():
+            self.set_duty(name, duty)
+            self.duty_modules.add(name)
+            levels.append(f"{name} heater {duty:g} %")
+        self.note(f"Step {index + 1}/{len(self.config.steps)}{' ' + self.step.name if self.step.name else ''}: {', '.join(levels) or 'no change'}")
+
+    @Slot(list)
+    def observe(self, readings: list[dm.Data]) -> None:
+        if not self.running:
+            return
+        for data in readings:
+            # the nominal curve is fine for a rate and works without a calibration
+            if (value := data.nominal_celcius) is None:
+                continue
+            t = data.timestamp.timestamp()
+            history = self.history.setdefault((data.module.name, data.sensor), deque())
+            history.append((t, value))
+            while t - history[0][0] > self.config.steady_window:
+                history.popleft()
+
+    def max_rate(self) -> float | None:
+        """Fastest change in C per minute of any sensor, None until every sensor has a full window"""
+        if not self.history:
+            return None
+        rates = []
+        for history in self.history.values():
+            if history[-1][0] - history[0][0] < STEADY_COVERAGE * self.config.steady_window:
+                return None
+            if (rate := fitted_rate(history)) is None:
+                return None
+            rates.append(rate)
+        return max(rates)
+
+    @Slot()
+    def check(self) -> None:
+        if not self.running:
+            return
+        now = time.monotonic()
+        elapsed = now - self.step_started
+        if self.steady_at is None:
+            rate = self.max_rate()
+            if rate is not None and rate <= self.config.steady_rate:
+                self.steady_at = now
+                self.note(f"Step {self.step_index + 1} steady after {elapsed:.0f} s, fastest sensor {rate:.3f} C/min, holding {self.step.hold:g} s")
+            elif elapsed > (self.step.timeout or self.config.timeout):
+                rate_text = f"fastest sensor {rate:.3f} C/min" if rate is not None else "not enough readings"
+                self.note(f"Step {self.step_index + 1} not steady after {elapsed:.0f} s ({rate_text}), moving on")
+                self._next()
+            return
+        if now - self.steady_at >= self.step.hold:
+            self._next()
+
+    def _next(self) -> None:
+        if self.step_index + 1 < len(self.config.steps):
+            self._begin(self.step_index + 1)
+            return
+        self._end()
+        self.note("Sequence finished")
+        self.finished.emit()
+
+    def note(self, text: str) -> None:
+        self.session.add(dm.RunNote(
+            run = self.run,
+            note = text,
+            timestamp = datetime.now(timezone.utc)
+        ))
+        self.session.commit()
+        self.log_message.emit(text)
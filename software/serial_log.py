@@ -0,0 +1,125 @@
+"""
+Serial monitor widget that costs the same after a week as after an hour.
+Lines are kept in a ring buffer, drawn in batches a few times a second,
+can be filtered by type, and are all written to a rotating log file.
+"""
+import PySide6.QtWidgets as qtw
+from PySide6.QtCore import Slot, QTimer
+from collections import deque
+from datetime import datetime
+from typing import Optional
+import logging
+from logging.handlers import RotatingFileHandler, MemoryHandler
+import re
+
+MAX_LINES = 5_000 # lines kept in the view
+FLUSH_INTERVAL = 100 # ms, the view redraws at most 10 times a second
+LOG_FILE_BYTES = 10_000_000
+LOG_FILE_BACKUPS = 5
+LOG_FILE_BUFFER = 500 # lines held before they are written to the log file
+
+# message types, in the order the filter boxes are shown
+READING = "Readings"
+ERROR = "Errors"
+PORT = "Port"
+READOUT = "Readout" # the scheduler
+HEATERS = "Heaters" # heater loops and the sequence
+DATABASE = "Database" # the buffered writer
+OTHER = "Other"
+MESSAGE_TYPES = [READING, ERROR, PORT, READOUT, HEATERS, DATABASE, OTHER]
+
+READING_PATTERN = re.compile(r"^(measure |Probe |Temp Probe |TP\d|TPavg\d|TM Board |sweep \d|stream \d)")
+
+def classify(text: str) -> str:
+    """Message type of a line read from a port"""
+    if text.startswith("ERROR"):
+        return ERROR
+    if READING_PATTERN.match(text):
+        return READING
+    return OTHER
+
+class SerialLogView(qtw.QWidget):
+    """
+    Slots: log_line for lines read from a port, log_event for messages of the
+    program, about the port itself (connected, failed to open, ...) unless
+    another message type is given
+    """
+    def __init__(self, log_file: Optional[str] = None, max_lines: int = MAX_LINES):
+        super(SerialLogView, self).__init__()
+        self.lines: deque[tuple[str, str]] = deque(maxlen=max_lines) # (message type, text)
+        self.pending: deque[tuple[str, str]] = deque(maxlen=max_lines) # not drawn yet
+        self.shown_types = set(MESSAGE_TYPES)
+
+        layout = qtw.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        filters = qtw.QHBoxLayout()
+        self.filter_boxes: dict[str, qtw.QCheckBox] = {}
+        for message_type in MESSAGE_TYPES:
+            box = qtw.QCheckBox(message_type)
+            box.setChecked(True)
+            box.toggled.connect(self.update_filter)
+            filters.addWidget(box)
+            self.filter_boxes[message_type] = box
+        filters.addStretch()
+        layout.addLayout(filters)
+
+        self.display = qtw.QPlainTextEdit()
+        self.display.setReadOnly(True)
+        self.display.setMaximumBlockCount(max_lines) # Qt drops the oldest blocks for us
+        layout.addWidget(self.display)
+
+        self.file_log = None
+        if log_file:
+            self.file_log = logging.getLogger(f"serial_log.{log_file}")
+            self.file_log.setLevel(logging.INFO)
+            self.file_log.propagate = False
+            file_handler = RotatingFileHandler(log_file, maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_BACKUPS)
+            file_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            # written in blocks instead of a disk write per line
+            self.file_log.addHandler(MemoryHandler(LOG_FILE_BUFFER, flushLevel=logging.ERROR, target=file_handler))
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(FLUSH_INTERVAL)
+
+    @Slot(str)
+    def log_line(self, text: str) -> None:
+        self._add(classify(text), text)
+
+    @Slot(str)
+    def log_event(self, text: str, message_type: str = PORT) -> None:
+        self._add(message_type, text)
+
+    def _add(self, message_type: str, text: str) -> None:
+        self.lines.append((message_type, text))
+        if message_type in self.shown_types:
+            self.pending.append((message_type, text))
+        if self.file_log is not None:
+            self.file_log.log(logging.ERROR if message_type == ERROR else logging.INFO, f"[{message_type}] {text}")
+
+    @Slot()
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        self.display.appendPlainText("\n".join(text for _, text in self.pending))
+        self.pending.clear()
+
+    @Slot()
+    def update_filter(self) -> None:
+        """Redraws the buffered lines of the types that are ticked"""
+        self.shown_types = {t for t, box in self.filter_boxes.items() if box.isChecked()}
+        self.pending.clear()
+        self.display.setPlainText("\n".join(text for t, text in self.lines if t in self.shown_types))
+        self.display.moveCursor(self.display.textCursor().MoveOperation.End)
+
+    def close_log_file(self) -> None:
+        if self.file_log is not None:
+            for handler in self.file_log.handlers:
+                # a MemoryHandler writes what it holds to its file on close, but leaves the file open
+                target = getattr(handler, "target", None)
+                handler.close()
+                if target is not None:
+                    target.close()
+            self.file_log.handlers.clear()
+            self.file_log = None
@@ -0,0 +1,649 @@
+"""
+Pretends to be an arduino on a pseudo terminal so the acquisition stack can be
+run and load tested without hardware. It speaks the same text protocol as
+bumpbonds_mockup/firmware/src/main.cpp ("Thermal Mockup V2") or
+control-board/firmware/src/main.cpp.
+
+    python simulator.py --link /tmp/ttySIM0
+    python simulator.py --bench --seconds 30 --latency 0.01
+
+Point the run config (or ComPort.connect_by_name) at the printed device or link.
+"""
+import argparse
+import math
+import os
+import random
+import select
+import sys
+import threading
+import time
+import tty
+from dataclasses import dataclass
+from typing import Optional
+from framing import Frame, encode_frame, checksum, LineFramer, FRAME_SENSOR, FRAME_PROBE, FRAME_BB
+
+THERMAL_MOCKUP = "thermal_mockup" # bumpbonds_mockup firmware
+CONTROL_BOARD = "control_board"   # control-board firmware
+PROTOCOLS = [THERMAL_MOCKUP, CONTROL_BOARD]
+
+BOARDS = "abcd"
+N_CHANNELS = 8
+N_PROBES = 3
+N_BB_PATHS = 4
+MAX_ARGS = 10 # include/command.h, the firmware ignores arguments past this
+TP_MAX_SAMPLES = 1024
+STREAM_MAX_CHANNELS = 11
+STREAM_MAX_CREDITS = 64
+FIRMWARE_VERSION = "2.3"
+
+# Sensor model, inverse of the conversions in database/models.py
+PT_R0 = 1000 # ohms at 0 C
+PT_ALPHA = 0.00385 # per C
+BB_PATH_OHMS = 1000
+BB_REF_OHMS = 984
+
+@dataclass
+class SimulatorConfig:
+    protocol: str = THERMAL_MOCKUP
+    reply_latency: float = 0.05 # s the firmware takes per reply
+    noise: float = 0.02 # C, standard deviation added to every reading
+    coolant: float = 20.0 # C, where the modules settle with the heaters off
+    heater_rise: float = 15.0 # C above the coolant with a heater fully on
+    tau: float = 60.0 # s, thermal time constant of a module
+    split_probability: float = 0.0 # a reply is written in two pieces
+    split_gap: float = 0.05 # s between the two pieces
+    drop_byte_probability: float = 0.0 # one byte of a reply goes missing
+    drop_line_probability: float = 0.0 # a whole reply goes missing
+    clock_drift: float = 0.0 # fractional error of the board's millis(), ex: 0.001 runs 0.1 % fast
+    adc_bits: int = 24 # 24 for an AD7718, 16 for an AD7708
+    seed: Optional[int] = None
+
+class ThermalModel:
+    """First order thermal response of each board to its heater"""
+    def __init__(self, config: SimulatorConfig, rng: random.Random):
+        self.config = config
+        self.rng = rng
+        self.temperatures = {board: config.coolant for board in BOARDS}
+        self.heaters = {board: 0.0 for board in BOARDS} # duty cycle 0 to 1
+        # fixed gradient across each module so the channels are not identical
+        self.offsets = {(board, ch): rng.uniform(-0.5, 0.5) for board in BOARDS for ch in range(1, N_CHANNELS + 1)}
+        self.last_update = time.monotonic()
+
+    def step(self) -> None:
+        now = time.monotonic()
+        dt = now - self.last_update
+        self.last_update = now
+        decay = math.exp(-dt / self.config.tau)
+        for board in BOARDS:
+            target = self.config.coolant + self.config.heater_rise * self.heaters[board]
+            self.temperatures[board] = target + (self.temperatures[board] - target) * decay
+
+    def channel(self, board: str, channel: int) -> float:
+        self.step()
+        return self.temperatures[board] + self.offsets[(board, channel)] + self.rng.gauss(0, self.config.noise)
+
+    def probe(self, board: str, probe: int) -> float:
+        self.step()
+        return self.temperatures[board] + self.rng.gauss(0, self.config.noise)
+
+def celcius_to_adc(celcius: float, rng: random.Random, bits: int = 24) -> int:
+    """24 bit AD7718 code, the host only uses the top 16 bits. An AD7708 only has those"""
+    ohms = PT_R0 * (1 + PT_ALPHA * celcius)
+    volts = 5 / (1 + 1E3 / ohms)
+    code = int(((volts - 2.5) / (1.024 * 2.5) + 1) * 2**15)
+    code = min(max(code, 0), 0xFFFF)
+    if bits == 16:
+        return code
+    return (code << 8) | rng.randrange(256)
+
+def celcius_to_probe(celcius: float) -> int:
+    """TMP121 reading, 13 bit two's complement shifted up by 3"""
+    return (round(celcius / 0.0625) & 0x1FFF) << 3
+
+def bb_voltage(rng: random.Random, noise: float) -> float:
+    return 3.3 * BB_PATH_OHMS / (BB_PATH_OHMS + BB_REF_OHMS) + rng.gauss(0, noise / 100)
+
+class FirmwareSimulator:
+    """
+    Owns a pty and answers commands on a background thread one at a time,
+    the same way the firmware works through its loop().
+    """
+    def __init__(self, config: SimulatorConfig = SimulatorConfig(), link: Optional[str] = None):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.model = ThermalModel(config, self.rng)
+        self.link = link
+
+        self.master = None
+        self.slave = None
+        self.device = None
+        self.binary_mode = False
+        self.frame_seq = 0
+        self.sweep_seq = 0
+        self.timestamp_mode = False
+        self.checksum_mode = False
+        self.adc_settings: dict[tuple[str, int], tuple[int, bool]] = {} # (board, channel) -> (filter word, chop)
+        self.stream_mode = False
+        self.stream_channels: list[str] = []
+        self.stream_interval = 0.0 # s between the starts of two sweeps
+        self.stream_last = 0.0
+        self.stream_credits = 0
+        self.stream_seq = 0
+        self.booted_at = time.monotonic()
+        self.commands_handled = 0
+        self.replies_sent = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.command_table = {
+            THERMAL_MOCKUP: {
+                "reset": self.tm_reset,
+                "calibrate": self.tm_calibrate,
+                "measure": self.tm_measure,
+                "probe": self.tm_probe,
+                "TP": self.tm_bb_path,
+                "TPavg": self.tm_bb_path_avg,
+                "binary": self.tm_binary,
+                "timestamps": self.tm_timestamps,
+                "sweep": self.tm_sweep,
+                "checksum": self.tm_checksum,
+                "adcconfig": self.tm_adcconfig,
+                "stream": self.tm_stream,
+                "hello": self.tm_hello,
+            },
+            CONTROL_BOARD: {
+                "reset": self.cb_reset,
+                "calibrate": self.cb_calibrate,
+                "measure": self.cb_measure,
+                "probe": self.cb_probe,
+                "heater": self.cb_heater,
+                "adcconfig": self.cb_adcconfig,
+            },
+        }[config.protocol]
+
+    def start(self) -> str:
+        """Opens the pty and starts answering, returns the device path to connect to"""
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.device = os.ttyname(self.slave)
+        if self.link:
+            if os.path.islink(self.link):
+                os.remove(self.link)
+            os.symlink(self.device, self.link)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self.link or self.device
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def _run(self) -> None:
+        buffer = b""
+        while not self._stop.is_set():
+            # like loop() in the firmware, a due streamed sweep goes out between commands
+            self.stream_step()
+            timeout = 0.1
+            if self.stream_mode and self.stream_credits:
+                timeout = min(timeout, max(0.0, self.stream_last + self.stream_interval - time.monotonic()))
+            ready, _, _ = select.select([self.master], [], [], timeout)
+            if not ready:
+                continue
+            try:
+                buffer += os.read(self.master, 1024)
+            except OSError:
+                continue
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                self.handle(line.decode(errors="replace"))
+
+    def handle(self, line: str) -> None:
+        tokens = line.split()
+        if not tokens:
+            return
+        self.commands_handled += 1
+        if self.config.protocol == CONTROL_BOARD:
+            self.println(f"Received command: {line}")
+        cmd, args = tokens[0], tokens[1:MAX_ARGS + 1]
+        flag = ""
+        if args and args[0].startswith("-"):
+            flag, args = args[0][1:], args[1:]
+
+        func = self.command_table.get(cmd)
+        if func is None:
+            self.println("ERROR: Unknown command")
+            return
+        func(flag, args)
+
+    #------------------------- Output -------------------------#
+    def println(self, text: str) -> None:
+        if self.checksum_mode:
+            # like ChecksumPrint in the firmware, every non empty line gets one
+            text = "\r\n".join(f"{line}*{checksum(line.encode()):02X}" if line else line for line in text.split("\n"))
+        self.send((text + "\r\n").encode())
+
+    def send(self, data: bytes) -> None:
+        """Writes a reply, with any faults the config asks for"""
+        time.sleep(self.config.reply_latency)
+        self.replies_sent += 1
+        if self.rng.random() < self.config.drop_line_probability:
+            return
+        if data and self.rng.random() < self.config.drop_byte_probability:
+            i = self.rng.randrange(len(data))
+            data = data[:i] + data[i + 1:]
+        if len(data) > 1 and self.rng.random() < self.config.split_probability:
+            i = self.rng.randrange(1, len(data))
+            os.write(self.master, data[:i])
+            time.sleep(self.config.split_gap)
+            data = data[i:]
+        os.write(self.master, data)
+
+    def millis(self) -> int:
+        return int((time.monotonic() - self.booted_at) * 1000 * (1 + self.config.clock_drift)) & 0xFFFFFFFF
+
+    def send_reading(self, text: str) -> None:
+        """Text reading, followed by " @<millis>" when timestamps are on"""
+        if self.timestamp_mode:
+            text += f" @{self.millis()}"
+        self.println(text)
+
+    def send_frame(self, type: int, channel: int, value: int) -> None:
+        self.send(encode_frame(Frame(type, self.frame_seq, channel, value)))
+        self.frame_seq = (self.frame_seq + 1) & 0xFFFF
+
+    #---------------- bumpbonds_mockup firmware ----------------#
+    def tm_reset(self, flag: str, args: list[str]) -> None:
+        self.println("RESET COMPLETE\n")
+
+    def tm_calibrate(self, flag: str, args: list[str]) -> None:
+        for channel in args or [str(ch) for ch in range(1, N_CHANNELS + 1)]:
+            self.println(f"Beginning calibration of channel {channel}")
+            self.println("Zero Scale Calibration succeeded!")
+            self.println("Calibration succeeded!")
+        self.println("CALIBRATION COMPLETE\n")
+
+    def tm_measure(self, flag: str, args: list[str]) -> None:
+        if not args:
+            self.println("ERROR: No channel selected for measurement\n")
+            return
+        for arg in args:
+            channel = int(arg) if arg.isdigit() else 0
+            if not 1 <= channel <= N_CHANNELS:
+                self.println("ERROR: Channel ID Invalid")
+                continue
+            adc = celcius_to_adc(self.model.channel("a", channel), self.rng, self.config.adc_bits)
+            if self.binary_mode:
+                self.send_frame(FRAME_SENSOR, channel, adc)
+            else:
+                self.send_reading(f"measure {channel} {adc:x}")
+
+    def tm_probe(self, flag: str, args: list[str]) -> None:
+        if not args:
+            self.println("ERROR: No probe selected for measurement\n")
+            return
+        for arg in args:
+            probe = int(arg) if arg.isdigit() else 0
+            if not 1 <= probe <= N_PROBES:
+                self.println("ERROR: Probe Invalid")
+                continue
+            raw = celcius_to_probe(self.model.probe("a", probe))
+            if self.binary_mode:
+                self.send_frame(FRAME_PROBE, probe, raw)
+            else:
+                self.send_reading(f"Probe {probe}: 0x{raw:x}")
+
+    def tm_bb_path(self, flag: str, args: list[str]) -> None:
+        if not args:
+            self.println("ERROR: No TP number selected for measurement")
+            return
+        for arg in args:
+            path = int(arg) if arg.isdigit() else 0
+            if not 1 <= path <= N_BB_PATHS:
+                self.println("ERROR: Invalid bb path id. Choices: 1, 2, 3, and 4")
+                return
+            voltage = bb_voltage(self.rng, self.config.noise)
+            if self.binary_mode:
+                self.send_frame(FRAME_BB, path, round(voltage / 3.3 * 1023))
+            else:
+                self.send_reading(f"TP{path} {voltage:.2f}")
+
+    def tm_bb_path_avg(self, flag: str, args: list[str]) -> None:
+        if len(args) < 2:
+            self.println("ERROR: No sample count or TP number selected. Ex: TPavg 64 1 2")
+            return
+        n = int(args[0]) if args[0].isdigit() else 0
+        if not 1 <= n <= TP_MAX_SAMPLES:
+            self.println("ERROR: Invalid sample count. Choices: 1 to 1024")
+            return
+        for arg in args[1:]:
+            path = int(arg) if arg.isdigit() else 0
+            if not 1 <= path <= N_BB_PATHS:
+                self.println("ERROR: Invalid bb path id. Choices: 1, 2, 3, and 4")
+                return
+            # 10 bit analogRead codes, like the firmware
+            codes = [min(max(round(bb_voltage(self.rng, self.config.noise) / 3.3 * 1023), 0), 1023) for _ in range(n)]
+            mean = sum(codes) / n
+            std = math.sqrt(max(sum(code * code for code in codes) / n - mean * mean, 0))
+            self.send_reading(f"TPavg{path} {mean * 3.3 / 1023:.4f} {std * 3.3 / 1023:.4f} {n}")
+
+    def tm_sweep(self, flag: str, args: list[str]) -> None:
+        if not args:
+            self.println("ERROR: No channel selected for sweep")
+            return
+        reply = f"sweep {self.sweep_seq}"
+        self.sweep_seq = (self.sweep_seq + 1) & 0xFFFF
+        self.send_reading(reply + self.read_sweep(args))
+
+    def read_sweep(self, args: list[str]) -> str:
+        reply = ""
+        for arg in args:
+            if arg.startswith("P"):
+                probe = int(arg[1:]) if arg[1:].isdigit() else 0
+                if not 1 <= probe <= N_PROBES:
+                    self.println("ERROR: Probe Invalid")
+                    continue
+                reply += f" P{probe}:{celcius_to_probe(self.model.probe('a', probe)):x}"
+                continue
+            channel = int(arg) if arg.isdigit() else 0
+            if not 1 <= channel <= N_CHANNELS:
+                self.println("ERROR: Channel ID Invalid")
+                continue
+            reply += f" {channel}:{celcius_to_adc(self.model.channel('a', channel), self.rng, self.config.adc_bits):x}"
+        return reply
+
+    def tm_stream(self, flag: str, args: list[str]) -> None:
+        action = args[0] if args else ""
+        if action == "credit" and len(args) > 1:
+            self.stream_credits = min(self.stream_credits + (int(args[1]) if args[1].isdigit() else 0), STREAM_MAX_CREDITS)
+            return
+        if action == "stop":
+            self.stream_mode = False
+            self.println(f"STREAM STOP {self.stream_seq}")
+            return
+        if action != "start" or len(args) < 4:
+            self.println("ERROR: Invalid stream command. Ex: stream start 1,2,P1 2 8")
+            return
+        self.stream_channels = [channel for channel in args[1].split(",") if channel][:STREAM_MAX_CHANNELS]
+        try:
+            rate = float(args[2])
+        except ValueError:
+            rate = 0.0
+        self.stream_interval = 1 / rate if rate > 0 else 0.0
+        self.stream_credits = min(int(args[3]) if args[3].isdigit() else 0, STREAM_MAX_CREDITS)
+        self.stream_seq = 0
+        self.stream_last = time.monotonic() - self.stream_interval
+        self.stream_mode = True
+        self.println(f"STREAM START {len(self.stream_channels)} {args[2]}")
+
+    def stream_step(self) -> None:
+        if not self.stream_mode or not self.stream_credits:
+            return
+        if time.monotonic() - self.stream_last < self.stream_interval:
+            return
+        self.stream_last = time.monotonic()
+        self.stream_credits -= 1
+        reply = f"stream {self.stream_seq}"
+        self.stream_seq = (self.stream_seq + 1) & 0xFFFF
+        self.send_reading(reply + self.read_sweep(self.stream_channels))
+
+    def tm_binary(self, flag: str, args: list[str]) -> None:
+        state = args[0].upper() if args else ""
+        if state not in ("ON", "OFF"):
+            self.println("ERROR: Invalid binary state selected. Choices: on, off")
+            return
+        self.binary_mode = state == "ON"
+        self.frame_seq = 0
+        self.println(f"BINARY {state}")
+
+    def tm_timestamps(self, flag: str, args: list[str]) -> None:
+        state = args[0].upper() if args else ""
+        if state not in ("ON", "OFF"):
+            self.println("ERROR: Invalid timestamp state selected. Choices: on, off")
+            return
+        self.timestamp_mode = state == "ON"
+        self.println(f"TIMESTAMPS {state}")
+
+    def adc_config(self, boards: str, args: list[str]) -> bool:
+        """Stores the settings like adc_config() in the firmware, False if they are invalid"""
+        if len(args) < 2:
+            self.println("ERROR: No ADC config selected. Ex: adcconfig 45 ON 1 2")
+            return False
+        filter_word = int(args[0], 16) if all(c in "0123456789ABCDEF" for c in args[0]) else 0
+        chop = args[1].upper()
+        if chop not in ("ON", "OFF"):
+            self.println("ERROR: Invalid chop state selected. Choices: on, off")
+            return False
+        if filter_word < (13 if chop == "ON" else 3):
+            self.println("ERROR: Filter word too small for this chop state")
+            return False
+        channels = [int(arg) for arg in args[2:] if arg.isdigit()] or range(1, N_CHANNELS + 1)
+        for board in boards:
+            for channel in channels:
+                self.adc_settings[(board, channel)] = (filter_word, chop == "ON")
+        return True
+
+    def tm_adcconfig(self, flag: str, args: list[str]) -> None:
+        if self.adc_config("a", args):
+            self.println("ADCCONFIG " + " ".join(args))
+
+    def tm_checksum(self, flag: str, args: list[str]) -> None:
+        state = args[0].upper() if args else ""
+        if state not in ("ON", "OFF"):
+            self.println("ERROR: Invalid checksum state selected. Choices: on, off")
+            return
+        self.checksum_mode = state == "ON"
+        self.println(f"CHECKSUM {state}")
+
+    def tm_hello(self, flag: str, args: list[str]) -> None:
+        adc = "AD7708" if self.config.adc_bits == 16 else "AD7718"
+        commands = ",".join(self.command_table)
+        self.println(f"HELLO firmware=thermal_mockup version={FIRMWARE_VERSION} adc={adc} "
+                     f"adc_bits={self.config.adc_bits} max_args={MAX_ARGS} binary=1 commands={commands}")
+
+    #------------------ control-board firmware ------------------#
+    def cb_reset(self, flag: str, args: list[str]) -> None:
+        self.println("Resetting...")
+        for board in flag or BOARDS:
+            self.println(f"Resetting TM Board {board}")
+        self.println("RESET COMPLETE\n")
+
+    def cb_calibrate(self, flag: str, args: list[str]) -> None:
+        self.println("Calibrating...")
+        for board in flag or BOARDS:
+            self.println(f"Calibrating TM Board {board}")
+            for channel in args or [str(ch) for ch in range(1, N_CHANNELS + 1)]:
+                self.println(f"Beginning calibration of channel {channel}")
+                self.println("Zero Scale Calibration succeeded!")
+                self.println("Calibration succeeded!")
+            self.println("\n")
+        self.println("CALIBRATION COMPLETE\n")
+
+    def cb_measure(self, flag: str, args: list[str]) -> None:
+        self.println("Measuring...")
+        if not args:
+            self.println("ERROR: No channel selected for measurement.")
+            return
+        for board in flag or BOARDS:
+            self.println(f"Measuring TM Board {board}")
+            if board not in BOARDS:
+                self.println("ERROR: Invalid board selected")
+                continue
+            for arg in args:
+                channel = int(arg) if arg.isdigit() else 0
+                if not 1 <= channel <= N_CHANNELS:
+                    self.println("ERROR: Invalid channel selected to measure.")
+                    continue
+                adc = celcius_to_adc(self.model.channel(board, channel), self.rng)
+                self.println(f"TM Board {board} Channel {arg}: 0x{adc:x}")
+            self.println("\n")
+        self.println("MEASURE COMPLETE\n")
+
+    def cb_probe(self, flag: str, args: list[str]) -> None:
+        for board in flag or BOARDS:
+            self.println(f"Reading TM Board {board}")
+            if board not in BOARDS:
+                self.println("ERROR: Invalid board selected")
+                continue
+            for arg in args or ["1", "2", "3"]:
+                probe = int(arg) if arg.isdigit() else 0
+                if not 1 <= probe <= N_PROBES:
+                    self.println("ERROR: Invalid probe selected")
+                    continue
+                celcius = self.model.probe(board, probe)
+                self.println(f"Temp Probe {probe}: 0x{celcius_to_probe(celcius):x}  {celcius:.2f} °C")
+            self.println("\n")
+        self.println("TEMP PROBE READ COMPLETE\n")
+
+    def cb_heater(self, flag: str, args: list[str]) -> None:
+        if not args:
+            self.println("ERROR: No heater state selected.")
+            return
+        state = args[0].upper()
+        duty = {"ON": 100, "OFF": 0}.get(state)
+        if duty is None and state.isdigit() and int(state) <= 100:
+            duty = int(state)
+        if duty is None:
+            self.println("ERROR: Invalid heater state selected. Choices: on, off, 0-100")
+            return
+        for board in flag or BOARDS:
+            if board not in BOARDS:
+                self.println("ERROR: Invalid board selected")
+                continue
+            self.model.step()
+            # the model is much slower than the firmware's 2 s window, so only the average counts
+            self.model.heaters[board] = duty / 100
+            self.println(f"Heater {board} {state}")
+        self.println("HEATER TOGGLE COMPLETE\n")
+
+    def cb_adcconfig(self, flag: str, args: list[str]) -> None:
+        if self.adc_config(flag or BOARDS, args):
+            self.println("ADC CONFIG COMPLETE\n")
+
+def benchmark(sim: FirmwareSimulator, firmware_name: str, seconds: float, checksums: bool = False) -> None:
+    """
+    Reads sweeps through a threaded ComPort as fast as the simulator answers
+    and prints the sustained sample rate and reply latency. A streaming
+    firmware is started once and read with flow control instead.
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QTimer
+    from com_port import ComPort
+    from transactions import TransactionManager
+    from stream import StreamController
+    import firmware_interface as fw
+
+    app = QApplication.instance() or QApplication([])
+    firmware = fw.firmware_select(firmware_name)
+    com_port = ComPort(threaded=True)
+    com_port.set_framer(firmware.framer() or LineFramer(checksums=checksums))
+    com_port.set_parser(firmware.parse)
+    transactions = TransactionManager(com_port)
+    sensors = list(firmware.sensor_map)
+    write = firmware.write_sweep if firmware.combined_sweep else firmware.write_sensors
+    timeout = max(50, int(sim.config.reply_latency * 4_000)) # ms per reply, short so dropped replies are retried quickly
+    samples = 0
+
+    def sweep():
+        if firmware.streaming:
+            return
+        if not transactions.transactions:
+            transactions.request("bench", sensors, write, timeout=timeout)
+
+    def save(lines):
+        nonlocal samples
+        for line in lines:
+            reading = line.parsed
+            if reading is None:
+                continue
+            for sample in (reading.value.samples if reading.kind in ("sweep", "stream") else [reading]):
+                if sample.kind == "sensor":
+                    samples += 1
+                    if reading.kind != "stream":
+                        transactions.reply("bench", sample.channel)
+        sweep()
+
+    com_port.received.connect(save)
+    com_port.connect_by_name(sim.device)
+    for command in firmware.setup_commands() + (["checksum on"] if checksums else []):
+        com_port._write(command)
+    stream = None
+    if firmware.streaming:
+        stream = StreamController(com_port, firmware, sim.device, rate=0) # back to back, only held back by the credits
+        stream.start(sensors)
+    # also asks again once a lost reply is given up on, when no line arrives to trigger it
+    poll = QTimer()
+    poll.timeout.connect(sweep)
+    poll.start(100)
+    QTimer.singleShot(int(seconds * 1000), app.quit)
+    start = time.monotonic()
+    app.exec()
+    elapsed = time.monotonic() - start
+    if stream is not None:
+        stream.stop()
+    com_port.disconnect_port()
+
+    latencies = sorted(transactions.stats.latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else float("nan")
+    print(f"{samples} samples in {elapsed:.1f} s = {samples / elapsed:.1f} samples/s")
+    print(f"latency mean {1000 * (transactions.stats.mean_latency or float('nan')):.1f} ms, "
+          f"p95 {1000 * p95:.1f} ms, max {1000 * (transactions.stats.max_latency or float('nan')):.1f} ms")
+    print(f"retried {transactions.stats.retried}, lost {transactions.stats.lost}, "
+          f"lines read {com_port.lines_read}, corrupt {com_port.corrupt_frames}, max buffer depth {com_port.max_buffer_depth} B")
+    if stream is not None:
+        print(f"streamed sweeps {stream.sweeps}, missed {stream.missed}, restarts {stream.restarts}")
+
+def main():
+    argParser = argparse.ArgumentParser(description = "Serial firmware simulator")
+    argParser.add_argument('-p', '--protocol', action='store', choices=PROTOCOLS, default=THERMAL_MOCKUP, help='Which firmware to pretend to be')
+    argParser.add_argument('-l', '--link', action='store', help='Also make a symlink to the pty here, ex: /tmp/ttySIM0')
+    argParser.add_argument('--latency', action='store', type=float, default=0.05, help='Seconds per reply')
+    argParser.add_argument('--noise', action='store', type=float, default=0.02, help='Temperature noise in C')
+    argParser.add_argument('--split', action='store', type=float, default=0.0, help='Probability a reply is split in two writes')
+    argParser.add_argument('--drop-byte', action='store', type=float, default=0.0, help='Probability a reply loses a byte')
+    argParser.add_argument('--drop-line', action='store', type=float, default=0.0, help='Probability a reply is lost')
+    argParser.add_argument('--drift', action='store', type=float, default=0.0, help="Fractional error of the board's millis()")
+    argParser.add_argument('--adc-bits', action='store', type=int, choices=[24, 16], default=24, help='24 for an AD7718, 16 for an AD7708')
+    argParser.add_argument('--seed', action='store', type=int, help='Random seed')
+    argParser.add_argument('--bench', action='store_true', help='Run the acquisition benchmark against the simulator')
+    argParser.add_argument('--firmware', action='store', default="Thermal Mockup V2", help='Firmware interface used by --bench')
+    argParser.add_argument('--checksums', action='store_true', help='Have --bench turn on line checksums')
+    argParser.add_argument('--seconds', action='store', type=float, default=10, help='Length of the --bench run')
+    args = argParser.parse_args()
+
+    config = SimulatorConfig(
+        protocol = args.protocol,
+        reply_latency = args.latency,
+        noise = args.noise,
+        split_probability = args.split,
+        drop_byte_probability = args.drop_byte,
+        drop_line_probability = args.drop_line,
+        clock_drift = args.drift,
+        adc_bits = args.adc_bits,
+        seed = args.seed
+    )
+    sim = FirmwareSimulator(config, link=args.link)
+    device = sim.start()
+    print(f"Simulating {args.protocol} firmware on {device}")
+    try:
+        if args.bench:
+            benchmark(sim, args.firmware, args.seconds, args.checksums)
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+
+if __name__ == "__main__":
+    sys.exit(main())
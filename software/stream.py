@@ -0,0 +1,118 @@
+"""
+Reads a port whose firmware streams, see ThermalMockupV2Stream. After one
+stream start command the board sweeps on its own and pushes every sweep, so
+the sample rate is no longer set by the command round trip. The board only
+sends a sweep while it holds a credit and credits are handed back once the
+monitors have saved the sweeps, so a busy host slows the board down instead
+of losing lines in a full serial buffer.
+"""
+from PySide6.QtCore import QObject, Signal, Slot, QTimer
+import time
+from com_port import ComPort, RawLine
+from firmware_interface import ModuleFirmwareInterface
+
+STREAM_WINDOW = 8 # sweeps the firmware can send before the host has saved any
+STREAM_STALL_TIMEOUT = 10_000 # ms past a sweep period without a sweep before the stream is restarted
+CHECK_INTERVAL = 1_000 # ms
+SEQ_MODULUS = 0x10000 # the firmware counts sweeps in a uint16
+
+class StreamController(QObject):
+    """
+    Signals: log_message \n
+    Make it after the port's dispatcher, slots run in the order they were
+    connected, so credits are only handed back after the sweeps are saved.
+    A restart resyncs the credits if a credit command was lost, and starts
+    the stream again after the board rebooted.
+    """
+    log_message = Signal(str)
+
+    def __init__(self, com_port: ComPort, firmware: ModuleFirmwareInterface, port_name: str, rate: float = 1.0, window: int = STREAM_WINDOW, boot_time: int = 0):
+        super(StreamController, self).__init__()
+        self.com_port = com_port
+        self.firmware = firmware
+        self.port_name = port_name
+        self.rate = rate # sweeps per second, 0 is as fast as the ADC converts
+        self.window = window
+        self.boot_time = boot_time # ms to wait after the port reopens before the board listens
+
+        self.names: list[str] = []
+        self.running = False
+        self.credits = 0 # sweeps the firmware can still send
+        self.last_seq = None
+        self.last_heard = None
+
+        self.sweeps = 0
+        self.missed = 0 # sweeps the sequence numbers skipped, ex: a line dropped for a bad checksum
+        self.restarts = 0
+
+        self.com_port.received[list].connect(self.heard)
+        self.com_port.port_opened[bool].connect(self.opened)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+
+    def start(self, names: list[str]) -> None:
+        """Starts streaming the sensors and probes in names"""
+        self.names = names
+        self.running = True
+        self._send_start()
+        self.timer.start(CHECK_INTERVAL)
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        self.timer.stop()
+        self.com_port._write(self.firmware.write_stream_stop())
+        self.log_message.emit(f"{self.port_name}: stream stopped after {self.sweeps} sweeps, {self.missed} missed, {self.restarts} restarts")
+
+    def _send_start(self) -> None:
+        # starting again resets the firmware's credits and sequence numbers
+        self.credits = self.window
+        self.last_seq = None
+        self.last_heard = time.monotonic()
+        self.com_port._write(self.firmware.write_stream_start(self.names, self.rate, self.window))
+
+    @Slot(list)
+    def heard(self, lines: list[RawLine]) -> None:
+        if not self.running:
+            return
+        used = 0
+        for line in lines:
+            reading = line.parsed
+            if reading is None or reading.kind != "stream":
+                continue
+            seq = reading.value.seq
+            # every sweep the firmware sent took a credit, even the ones that never made it here
+            step = 1 if self.last_seq is None else (seq - self.last_seq) % SEQ_MODULUS
+            if step > self.window:
+                step = 1 # more than it had credits for, a sweep from before a restart
+            self.missed += max(step - 1, 0)
+            self.last_seq = seq
+            self.sweeps += 1
+            used += step
+        if not used:
+            return
+        self.last_heard = time.monotonic()
+        self.credits = max(self.credits - used, 0)
+        # handed back in blocks so there is not a command for every sweep
+        if self.credits <= self.window // 2:
+            self.com_port._write(self.firmware.write_stream_credit(self.window - self.credits))
+            self.credits = self.window
+
+    @Slot()
+    def check(self) -> None:
+        if not self.running or not self.com_port.is_connected():
+            return # opened() starts it again once the port is back
+        period = 1000 / self.rate if self.rate else 0
+        if (time.monotonic() - self.last_heard) * 1000 < STREAM_STALL_TIMEOUT + period:
+            return
+        self.restarts += 1
+        self.log_message.emit(f"{self.port_name}: no streamed sweep for {time.monotonic() - self.last_heard:.0f} s, restarting the stream")
+        self._send_start()
+
+    @Slot(bool)
+    def opened(self, ok: bool) -> None:
+        # the arduino reboots when its port opens and forgets the stream
+        if ok and self.running:
+            QTimer.singleShot(self.boot_time, self._send_start)
@@ -0,0 +1,180 @@
+"""
+Watches a serial link during a run. When the port goes away or the firmware
+stops answering it resets or reconnects the board and resends whatever the
+monitors were still waiting on, so one hiccup does not cost a night of data.
+"""
+from PySide6.QtCore import QObject, Signal, Slot, QTimer
+from PySide6.QtSerialPort import QSerialPortInfo
+import os
+import time
+from com_port import ComPort, RawLine
+from transactions import TransactionManager
+
+SUPERVISE_INTERVAL = 1_000 # ms between checks
+SILENCE_TIMEOUT = 30_000 # ms without a reply while one is expected
+BACKOFF_START = 1_000 # ms before the first reconnect attempt
+BACKOFF_MAX = 60_000 # ms
+
+# states
+IDLE = "idle" # not supervising, ex: the port was disconnected by hand
+CONNECTED = "connected"
+RECONNECTING = "reconnecting"
+
+def find_port_info(port_name: str) -> QSerialPortInfo | None:
+    for port_info in QSerialPortInfo.availablePorts():
+        if port_name in (port_info.portName(), port_info.systemLocation()):
+            return port_info
+    return None
+
+class PortSupervisor(QObject):
+    """
+    Signals: log_message, state_changed \n
+    A stalled board is sent reset first, if that does not wake it the port is
+    reopened, which also reboots an arduino.
+    """
+    log_message = Signal(str)
+    state_changed = Signal(str)
+
+    def __init__(self, com_port: ComPort, transactions: TransactionManager, boot_time: int = 0, silence_timeout: int = SILENCE_TIMEOUT):
+        super(PortSupervisor, self).__init__()
+        self.com_port = com_port
+        self.transactions = transactions
+        self.boot_time = boot_time # ms to wait after opening before the board listens
+        self.silence_timeout = silence_timeout / 1000
+
+        self.state = IDLE
+        self.port_name = None
+        self.serial_number = None # survives the board coming back under another name
+        self.setup_commands: list[str] = []
+        self.reset_sent_at = None
+        self.sent_when_heard = 0 # transactions.stats.sent at the last reply
+        self.unanswered_since = None
+        self.backoff = BACKOFF_START
+
+        self.resets = 0
+        self.reconnects = 0
+
+        self.com_port.received[list].connect(self.heard)
+        self.com_port.port_opened[bool].connect(self.opened)
+        self.com_port.connection_lost[str].connect(self.lost)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.reconnect)
+
+    def watch(self, port_name: str, setup_commands: list[str]) -> None:
+        """Starts supervising, call after connecting the port"""
+        self.port_name = port_name
+        self.setup_commands = setup_commands
+        port_info = find_port_info(port_name)
+        self.serial_number = port_info.serialNumber() if port_info is not None else None
+        self._heard_now()
+        self._set_state(CONNECTED)
+        self.timer.start(SUPERVISE_INTERVAL)
+
+    def stop(self) -> None:
+        self.timer.stop()
+        self.retry_timer.stop()
+        self._set_state(IDLE)
+        if self.transactions.paused:
+            self.transactions.resume()
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            self.state_changed.emit(state)
+
+    def _port_present(self) -> bool:
+        # ports Qt does not list, like a pty, are checked by path
+        return find_port_info(self.port_name) is not None or os.path.exists(self.port_name)
+
+    def _heard_now(self) -> None:
+        self.sent_when_heard = self.transactions.stats.sent
+        self.unanswered_since = None
+        self.reset_sent_at = None
+
+    @Slot(list)
+    def heard(self, lines: list[RawLine]) -> None:
+        self._heard_now()
+
+    @Slot()
+    def check(self) -> None:
+        if self.state != CONNECTED:
+            return
+        if not self._port_present():
+            self.lost("port disappeared")
+            return
+        if self.transactions.stats.sent == self.sent_when_heard and not self.transactions.transactions:
+            self.unanswered_since = None
+            return # nothing expected, so silence is fine
+
+        # silence only counts from when a command first went unanswered, lost
+        # replies make new transactions so their send times cannot be used
+        now = time.monotonic()
+        if self.unanswered_since is None:
+            self.unanswered_since = now
+        if now - self.unanswered_since < self.silence_timeout:
+            return
+        if self.reset_sent_at is None:
+            self.resets += 1
+            self.reset_sent_at = now
+            self.log_message.emit(f"{self.port_name}: no reply for {self.silence_timeout:g} s, sending reset")
+            self.com_port._write("reset")
+        elif now - self.reset_sent_at >= self.silence_timeout:
+            self.lost("firmware stopped answering")
+
+    @Slot(str)
+    def lost(self, reason: str) -> None:
+        if self.state != CONNECTED:
+            return
+        self.log_message.emit(f"{self.port_name}: lost connection ({reason}), reconnecting")
+        self._set_state(RECONNECTING)
+        self.transactions.pause()
+        self.com_port.disconnect_port()
+        self.backoff = BACKOFF_START
+        self.retry_timer.start(self.backoff)
+
+    @Slot()
+    def reconnect(self) -> None:
+        if self.state != RECONNECTING:
+            return
+        self.com_port.refresh_ports()
+        port_name = self.port_name
+        if self.serial_number:
+            # usb can bring the board back as ttyACM1 instead of ttyACM0
+            for port_info in QSerialPortInfo.availablePorts():
+                if port_info.serialNumber() == self.serial_number:
+                    port_name = port_info.portName()
+        self.port_name = port_name
+        if not self.com_port.connect_by_name(port_name):
+            self._retry_later()
+        # otherwise opened() says if it worked
+
+    def _retry_later(self) -> None:
+        self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+        self.log_message.emit(f"{self.port_name}: not back yet, next try in {self.backoff / 1000:.0f} s")
+        self.retry_timer.start(self.backoff)
+
+    @Slot(bool)
+    def opened(self, ok: bool) -> None:
+        if self.state != RECONNECTING:
+            return
+        if not ok:
+            self.com_port.disconnect_port()
+            self._retry_later()
+            return
+        self.reconnects += 1
+        self.log_message.emit(f"{self.port_name}: reconnected")
+        self._heard_now()
+        self._set_state(CONNECTED)
+        # the arduino reboots when the port opens, give it time before talking to it
+        QTimer.singleShot(self.boot_time, self._restart)
+
+    def _restart(self) -> None:
+        if self.state != CONNECTED:
+            return
+        for command in self.setup_commands:
+            self.com_port._write(command)
+        self.transactions.resume()
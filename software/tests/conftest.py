@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+import pytest
+
+# the modules import each other by name, like when they are run from software/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+@pytest.fixture(scope="session")
+def qapp():
+    """Timers and signals need an application, nothing is shown"""
+    from PySide6.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication([])
+
+class FakeClock:
+    """Stands in for time.monotonic(), moved by hand"""
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr("time.monotonic", fake)
+    return fake
@@ -0,0 +1,63 @@
+from datetime import timedelta
+import pytest
+from clock import DeviceClock, monotonic_to_utc, MILLIS_WRAP, REBOOT_JUMP, MAX_DRIFT, MIN_FIT_SPAN
+
+def test_monotonic_to_utc_keeps_differences():
+    assert monotonic_to_utc(10.5) - monotonic_to_utc(10) == timedelta(seconds=0.5)
+
+def test_first_sample_maps_onto_its_arrival():
+    clock = DeviceClock()
+    assert clock.to_host(5_000, 100.0) == pytest.approx(100.0)
+
+def test_stays_under_the_earliest_arrivals():
+    clock = DeviceClock()
+    # the same latency plus some jitter, the fastest reply sets the offset
+    latencies = [0.03, 0.01, 0.05, 0.02]
+    for i, latency in enumerate(latencies):
+        clock.to_host(i * 1000, 100.0 + i + latency)
+    assert clock.to_host(4000, 104.2) == pytest.approx(104.01)
+
+def test_fits_the_drift():
+    clock = DeviceClock()
+    rate = 1.003 # the host sees 1.003 s per device second
+    host = None
+    for i in range(200):
+        host = clock.to_host(i * 500, 50.0 + rate * i * 0.5 + 0.02)
+    assert clock.rate == pytest.approx(rate, abs=1e-6)
+    assert host == pytest.approx(50.0 + rate * 199 * 0.5 + 0.02)
+
+def test_no_drift_before_min_fit_span():
+    clock = DeviceClock()
+    for i in range(40):
+        clock.to_host(i * 100, 1.003 * i * 0.1)
+    assert i * 0.1 < MIN_FIT_SPAN
+    assert clock.rate == 1.0
+
+def test_drift_is_clamped():
+    clock = DeviceClock()
+    for i in range(200):
+        clock.to_host(i * 500, 2 * i * 0.5)
+    assert clock.rate == pytest.approx(1 + MAX_DRIFT)
+
+def test_millis_wrap():
+    clock = DeviceClock()
+    before = clock.to_host(MILLIS_WRAP - 500, 100.0)
+    after = clock.to_host(500, 101.0)
+    assert clock.wraps == 1
+    assert after - before == pytest.approx(1.0)
+
+def test_reboot_starts_over():
+    clock = DeviceClock()
+    for i in range(20):
+        clock.to_host(100_000 + i * 1000, 200.0 + i)
+    after = clock.to_host(1_000, 300.0)
+    assert clock.resets == 1
+    assert len(clock.pairs) == 1
+    assert after == pytest.approx(300.0)
+
+def test_small_step_back_is_not_a_reboot():
+    clock = DeviceClock()
+    clock.to_host(100_000, 10.0)
+    clock.to_host(100_000 - REBOOT_JUMP // 2, 11.0)
+    assert clock.resets == 0 and clock.wraps == 0
+    assert len(clock.pairs) == 2
@@ -0,0 +1,83 @@
+from framing import (LineFramer, BinaryFramer, Frame, encode_frame, check_line, checksum,
+                     FRAME_SYNC, FRAME_SENSOR, MAX_LINE_LENGTH)
+
+def with_checksum(text: bytes) -> bytes:
+    return text + b"*" + f"{checksum(text):02X}".encode()
+
+def format_frame(frame: Frame) -> str:
+    return f"frame {frame.type} {frame.seq} {frame.channel} {frame.value:x}"
+
+def test_check_line():
+    assert check_line(with_checksum(b"TM Board a Channel 1: 0x7f")) == (b"TM Board a Channel 1: 0x7f", True)
+    assert check_line(b"TM Board a Channel 1: 0x7f*00") == (b"TM Board a Channel 1: 0x7f", False)
+    assert check_line(b"RESET COMPLETE") == (b"RESET COMPLETE", None)
+
+def test_line_framer_keeps_partial_lines():
+    framer = LineFramer()
+    assert framer.feed(b"measure 1\r\nmeas") == ["measure 1"]
+    assert framer.feed(b"ure 2\r\n\r\n") == ["measure 2"]
+    assert framer.lines == 2
+
+def test_line_framer_drops_long_noise():
+    framer = LineFramer()
+    assert framer.feed(b"x" * (MAX_LINE_LENGTH + 1)) == []
+    assert framer.dropped_bytes == MAX_LINE_LENGTH + 1
+    assert framer.feed(b"ok\n") == ["ok"]
+
+def test_line_framer_checksums():
+    framer = LineFramer(checksums=True)
+    # lines from before "checksum on" are let through
+    assert framer.feed(b"checksum on\n") == ["checksum on"]
+    assert framer.feed(with_checksum(b"Probe 1: 0x190") + b"\n") == ["Probe 1: 0x190"]
+    # from the first checksummed line on, a line without one is corrupt
+    assert framer.feed(b"Probe 1: 0x190\n") == []
+    assert framer.feed(b"Probe 1: 0x191*00\n") == []
+    assert framer.corrupt_frames == 2
+
+def test_line_framer_checksum_covers_trailing_spaces():
+    framer = LineFramer(checksums=True)
+    assert framer.feed(with_checksum(b"done ") + b"\r\n") == ["done"]
+    assert framer.corrupt_frames == 0
+
+def test_binary_framer_round_trip_byte_by_byte():
+    framer = BinaryFramer(format_frame)
+    data = encode_frame(Frame(FRAME_SENSOR, 7, 3, 0x123456)) + b"RESET COMPLETE\r\n"
+    lines = []
+    for byte in data:
+        lines += framer.feed(bytes([byte]))
+    assert lines == ["frame 1 7 3 123456", "RESET COMPLETE"]
+    assert framer.frames == 1 and framer.corrupt_frames == 0
+
+def test_binary_framer_resyncs_past_newlines_in_a_bad_payload():
+    framer = BinaryFramer(format_frame)
+    bad = bytearray(encode_frame(Frame(FRAME_SENSOR, 1, 2, 0x0A0A0A0A)))
+    bad[-1] ^= 0xFF
+    good = encode_frame(Frame(FRAME_SENSOR, 2, 2, 0x0A0A0A0A))
+    assert framer.feed(bytes(bad) + good) == ["frame 1 2 2 a0a0a0a"]
+    assert framer.corrupt_frames == 1
+    assert framer.dropped_bytes == len(bad)
+
+def test_binary_framer_does_not_wait_on_a_bad_length():
+    framer = BinaryFramer(format_frame)
+    good = encode_frame(Frame(FRAME_SENSOR, 1, 1, 1))
+    bad = bytes([FRAME_SYNC, 200]) + good[2:]
+    # a length of 200 would otherwise hold up the next frame until 203 bytes came in
+    assert framer.feed(bad + good) == ["frame 1 1 1 1"]
+    assert framer.corrupt_frames == 1
+
+def test_binary_framer_drops_garbage_before_a_frame():
+    framer = BinaryFramer(format_frame)
+    assert framer.feed(b"\x00\x01" + encode_frame(Frame(FRAME_SENSOR, 1, 1, 1))) == ["frame 1 1 1 1"]
+
+def test_binary_framer_text_checksums():
+    framer = BinaryFramer(format_frame)
+    assert framer.feed(with_checksum(b"MEASURE COMPLETE ") + b"\r\n") == ["MEASURE COMPLETE"]
+    assert framer.feed(b"MEASURE COMPLETE*00\r\n") == []
+    assert framer.corrupt_frames == 1
+
+def test_binary_framer_counts_lost_frames_across_the_wrap():
+    framer = BinaryFramer(format_frame)
+    framer.feed(encode_frame(Frame(FRAME_SENSOR, 0xFFFE, 1, 1)))
+    framer.feed(encode_frame(Frame(FRAME_SENSOR, 1, 1, 1)))
+    # 0xFFFF and 0 were lost
+    assert framer.lost_frames == 2
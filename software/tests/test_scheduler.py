@@ -0,0 +1,102 @@
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import pytest
+from scheduler import AdaptiveScheduler, fitted_rate, RELAX_FACTOR, RATE_WINDOW
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def test_fitted_rate():
+    assert fitted_rate(deque()) is None
+    assert fitted_rate(deque([(0, 1.0)])) is None
+    assert fitted_rate(deque([(5, 1.0), (5, 2.0)])) is None
+    assert fitted_rate(deque((t, 20 + 0.5 * t) for t in range(10))) == pytest.approx(30)
+    # falling as fast counts the same
+    assert fitted_rate(deque((t, 20 - 0.5 * t) for t in range(10))) == pytest.approx(30)
+
+def test_fitted_rate_ignores_noise_around_a_flat_line():
+    history = deque((t, 20 + (0.1 if t % 2 else -0.1)) for t in range(60))
+    assert fitted_rate(history) < 0.2
+
+@pytest.fixture
+def scheduler(qapp, clock):
+    return AdaptiveScheduler()
+
+@pytest.fixture
+def reads():
+    return []
+
+def add(scheduler, reads, name="M1 sensors", base=10_000, threshold=0.5, fast=2_000):
+    scheduler.add_group(name, lambda: reads.append(name), base, threshold, fast)
+    return scheduler.groups[name]
+
+def test_group_names_are_unique(scheduler, reads):
+    add(scheduler, reads)
+    with pytest.raises(ValueError):
+        add(scheduler, reads)
+
+def test_fast_interval_is_never_slower_than_base(scheduler, reads):
+    group = add(scheduler, reads, base=1_000, fast=2_000)
+    assert group.fast_interval == 1.0
+
+def test_reads_on_start_then_at_the_interval(scheduler, reads, clock):
+    add(scheduler, reads)
+    scheduler.start()
+    scheduler.run_due()
+    assert reads == ["M1 sensors"]
+    clock.advance(9)
+    scheduler.run_due()
+    assert len(reads) == 1
+    clock.advance(1)
+    scheduler.run_due()
+    assert len(reads) == 2
+    scheduler.stop()
+
+def test_a_change_reads_fast_right_away(scheduler, reads, clock):
+    group = add(scheduler, reads)
+    messages = []
+    scheduler.log_message.connect(messages.append)
+    scheduler.start()
+    scheduler.run_due()
+    scheduler.observe("M1 sensors", "E1", T0, 20.0)
+    scheduler.observe("M1 sensors", "E1", T0 + timedelta(seconds=10), 22.0) # 12 C/min
+    assert group.interval == 2.0
+    assert group.next_read == pytest.approx(clock.now + 2)
+    assert "changing" in messages[-1]
+    scheduler.stop()
+
+def test_steady_reads_relax_back_to_base(scheduler, reads, clock):
+    group = add(scheduler, reads)
+    group.interval = group.fast_interval
+    scheduler.start()
+    intervals = []
+    t = T0
+    while group.interval < group.base_interval:
+        scheduler.observe("M1 sensors", "E1", t, 20.0)
+        t += timedelta(seconds=group.interval)
+        scheduler.run_due()
+        intervals.append(group.interval)
+        clock.advance(group.interval)
+    assert intervals[:2] == pytest.approx([2.0 * RELAX_FACTOR, 2.0 * RELAX_FACTOR**2])
+    assert intervals[-1] == group.base_interval
+    scheduler.stop()
+
+def test_a_read_without_replies_does_not_relax(scheduler, reads, clock):
+    group = add(scheduler, reads)
+    group.interval = group.fast_interval
+    scheduler.start()
+    scheduler.run_due()
+    assert group.interval == group.fast_interval
+    scheduler.stop()
+
+def test_history_is_kept_for_the_rate_window(scheduler, reads):
+    group = add(scheduler, reads, threshold=1e9)
+    for s in range(0, 3 * RATE_WINDOW, 5):
+        scheduler.observe("M1 sensors", "E1", T0 + timedelta(seconds=s), 20.0)
+    history = group.history["E1"]
+    assert history[-1][0] - history[0][0] <= RATE_WINDOW
+
+def test_missing_values_and_unknown_groups_are_ignored(scheduler, reads):
+    group = add(scheduler, reads)
+    scheduler.observe("M1 sensors", "E1", T0, None)
+    scheduler.observe("M2 sensors", "E1", T0, 20.0)
+    assert not group.observed and not group.history
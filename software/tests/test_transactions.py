@@ -0,0 +1,130 @@
+import pytest
+from transactions import TransactionManager
+from firmware_interface import ControlBoardV1
+
+class FakePort:
+    def __init__(self):
+        self.written: list[str] = []
+
+    def _write(self, command: str) -> None:
+        self.written.append(command)
+
+def measure(position: str):
+    return lambda keys: f"measure -{position} " + " ".join(keys)
+
+@pytest.fixture
+def port():
+    return FakePort()
+
+@pytest.fixture
+def manager(qapp, clock, port):
+    return TransactionManager(port, max_retries=1, max_in_flight=2)
+
+def answer(manager: TransactionManager, owner: str, keys: list) -> None:
+    for key in keys:
+        manager.reply(owner, key)
+
+def test_request_returns_the_command_sent(manager, port):
+    assert manager.request("a", ["1", "2"], measure("a")) == "measure -a 1 2"
+    manager.flush()
+    assert port.written == ["measure -a 1 2"]
+
+def test_keys_already_waiting_are_left_out(manager):
+    manager.request("a", ["1", "2"], measure("a"))
+    assert manager.request("a", ["1", "2"], measure("a")) is None
+    assert manager.request("a", ["2", "3"], measure("a")) == "measure -a 3"
+
+def test_cap_in_flight(manager, port):
+    sent = [manager.request(owner, ["1"], measure(owner)) for owner in "abc"]
+    assert sent == ["measure -a 1", "measure -b 1", None]
+    manager.flush()
+    answer(manager, "a", ["1"])
+    manager.flush()
+    assert port.written == ["measure -a 1", "measure -b 1", "measure -c 1"]
+
+def test_merged_commands_count_once(qapp, clock, port):
+    manager = TransactionManager(port, merge_commands=ControlBoardV1().merge_commands, max_in_flight=2)
+    for position in "abcd":
+        manager.request(position, ["1", "2"], measure(position))
+    for position in "abcd":
+        manager.request(position, ["P1"], lambda keys, position=position: f"probe -{position} 1")
+    assert manager.in_flight() == 2
+    manager.flush()
+    assert port.written == ["measure -abcd 1 2", "probe -abcd 1"]
+
+def test_least_bus_time_goes_first(qapp, clock, port):
+    manager = TransactionManager(port, max_in_flight=1)
+    manager.request("big", ["1", "2", "3", "4"], measure("a"))
+    for i in range(3):
+        manager.request("big", [f"x{i}"], measure("a"))
+    manager.request("small", ["1"], measure("b"))
+    manager.flush()
+    order = []
+    while manager.transactions:
+        transaction = next(t for t in manager.transactions.values() if not t.queued)
+        order.append(transaction.owner)
+        answer(manager, transaction.owner, list(transaction.keys))
+    # small starts level with the bus time big has had, not at 0, and then
+    # does not wait behind all of big's commands
+    assert order == ["big", "big", "small", "big", "big"]
+    assert manager.bus_time["small"] == pytest.approx(8 + 2)
+
+def test_retries_only_missing_replies_then_gives_up(manager, port, clock):
+    lost = []
+    manager.reply_lost.connect(lambda owner, key: lost.append((owner, key)))
+    manager.request("a", ["1", "2"], measure("a"), timeout=1000)
+    manager.flush()
+    manager.reply("a", "1")
+    clock.advance(3)
+    manager.check_deadlines()
+    manager.flush()
+    assert port.written[-1] == "measure -a 2"
+    assert manager.stats.retried == 1
+    clock.advance(3)
+    manager.check_deadlines()
+    assert lost == [("a", "2")]
+    assert manager.stats.lost == 1
+    assert not manager.pending and not manager.transactions
+
+def test_deadline_waits_for_commands_sent_before(manager, clock):
+    manager.request("a", ["1"], measure("a"), timeout=1000)
+    manager.request("b", ["1"], measure("b"), timeout=1000)
+    clock.advance(1.5)
+    manager.check_deadlines()
+    # a is late, b was only due to start once a had been answered
+    assert manager.stats.retried == 1
+    assert manager.transactions[1].retries == 0
+
+def test_latency_and_unexpected_replies(manager, clock):
+    manager.request("a", ["1"], measure("a"))
+    clock.advance(0.25)
+    assert manager.reply("a", "1") == pytest.approx(0.25)
+    assert manager.reply("a", "1") is None
+    assert manager.stats.unexpected == 1
+
+def test_reply_to_a_queued_transaction_has_no_latency(qapp, clock, port):
+    manager = TransactionManager(port, max_in_flight=1)
+    manager.request("a", ["1"], measure("a"))
+    manager.request("b", ["1"], measure("b"))
+    assert manager.reply("b", "1") is None
+    assert manager.stats.replies == 0
+
+def test_pause_holds_and_resume_resends_in_order(manager, port, clock):
+    manager.pause()
+    manager.request("a", ["1"], measure("a"))
+    manager.request("b", ["1"], measure("b"))
+    manager.flush()
+    assert port.written == []
+    clock.advance(60)
+    manager.check_deadlines()
+    assert manager.stats.lost == 0
+    manager.resume()
+    manager.flush()
+    assert port.written == ["measure -a 1", "measure -b 1"]
+
+def test_clear_forgets_everything(manager):
+    for owner in "abc":
+        manager.request(owner, ["1"], measure(owner))
+    manager.clear()
+    assert not manager.transactions and not manager.pending and manager.in_flight() == 0
+    assert manager.request("a", ["1"], measure("a")) == "measure -a 1"
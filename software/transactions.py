@@ -0,0 +1,261 @@
+"""
+Keeps track of the commands sent to a port and the replies each one is still
+waiting on, so a lost reply is retried or given up on instead of blocking the sweep.
+Only a few commands are in flight at once, the rest wait here and are sent in
+turn across the monitors on the port, so one tick does not flood the link.
+"""
+from PySide6.QtCore import QObject, Signal, Slot, QTimer
+from dataclasses import dataclass, field
+from collections import deque
+from itertools import count
+from typing import Callable, Hashable
+import time
+from com_port import ComPort
+
+CHECK_INTERVAL = 250 # ms, how often deadlines are checked
+DEFAULT_TIMEOUT = 2_000 # ms, per expected reply
+DEFAULT_MAX_RETRIES = 1
+# one command being answered and one waiting in the firmware's serial buffer,
+# so the board never idles and the rest can still be reordered and merged here.
+# Commands merged into one count once, see in_flight()
+DEFAULT_MAX_IN_FLIGHT = 2
+LATENCY_HISTORY = 1000 # replies kept for the latency stats
+
+@dataclass
+class Transaction:
+    """One command and the replies it is still waiting on"""
+    id: int
+    owner: str
+    keys: set[Hashable]
+    build_command: Callable[[list], str] # rebuilds the command for just the missing keys
+    timeout: float # seconds per expected reply
+    sent_at: float # time.monotonic()
+    deadline: float
+    retries: int = 0
+    queued: bool = True # not sent yet, waiting for room in flight
+    command: str = "" # last sent
+    batch: int = 0 # event loop turn it was last sent in, commands of the same turn can be merged
+
+@dataclass
+class TransactionStats:
+    sent: int = 0 # commands written, retries included
+    replies: int = 0
+    retried: int = 0 # replies asked for again
+    lost: int = 0 # replies given up on after all retries
+    unexpected: int = 0 # replies nothing was waiting on, late ones included
+    latencies: deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_HISTORY)) # seconds
+
+    def add_latency(self, latency: float) -> None:
+        self.replies += 1
+        self.latencies.append(latency)
+
+    @property
+    def mean_latency(self) -> float | None:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else None
+
+    @property
+    def max_latency(self) -> float | None:
+        return max(self.latencies) if self.latencies else None
+
+    def summary(self) -> str:
+        mean = f"{self.mean_latency * 1000:.0f} ms" if self.latencies else "-"
+        return f"replies {self.replies}, mean latency {mean}, retried {self.retried}, lost {self.lost}"
+
+class TransactionManager(QObject):
+    """
+    Signals: reply_lost, stats_changed \n
+    Shared by every monitor on a port, owners keep their keys apart.
+    """
+    reply_lost = Signal(str, object) # owner, key
+    stats_changed = Signal()
+
+    def __init__(self, com_port: ComPort, max_retries: int = DEFAULT_MAX_RETRIES, merge_commands: Callable[[list[str]], list[str]] | None = None, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        super(TransactionManager, self).__init__()
+        self.com_port = com_port
+        self.max_retries = max_retries
+        self.max_in_flight = max_in_flight
+        # commands sent in the same event loop turn are written together and can
+        # be merged, ex: every monitor on a control board asking at the same tick
+        self.merge_commands = merge_commands
+        self.outbox: list[str] = []
+        self.batch = 0 # the turn the outbox is written in
+        self.stats = TransactionStats()
+
+        self.paused = False # while the port is down, nothing is sent or given up on
+        self.transactions: dict[int, Transaction] = {}
+        self.pending: dict[tuple[str, Hashable], int] = {} # (owner, key) -> transaction id
+        self._ids = count()
+
+        # transactions waiting to be sent, per owner. The owner that has had the
+        # least bus time goes next, so a monitor with many channels does not
+        # starve the others on the port
+        self.queues: dict[str, deque[Transaction]] = {}
+        self.bus_time: dict[str, float] = {} # owner -> s of expected replies sent
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check_deadlines)
+        self.timer.start(CHECK_INTERVAL)
+
+    def request(self, owner: str, keys: list, build_command: Callable[[list], str], timeout: int = DEFAULT_TIMEOUT) -> str | None:
+        """
+        Sends the command for the keys that are not already waiting on a reply, once
+        there is room in flight. timeout is in ms per expected reply.
+        Returns the command as it was sent (before merging), None if nothing was
+        asked for or it is waiting for room in flight.
+        """
+        keys = [key for key in keys if (owner, key) not in self.pending]
+        if not keys:
+            return None
+
+        transaction = Transaction(
+            id = next(self._ids),
+            owner = owner,
+            keys = set(keys),
+            build_command = build_command,
+            timeout = timeout / 1000,
+            sent_at = 0,
+            deadline = 0
+        )
+        self.transactions[transaction.id] = transaction
+        for key in keys:
+            self.pending[(owner, key)] = transaction.id
+
+        queue = self.queues.setdefault(owner, deque())
+        if not queue:
+            # an owner that was idle does not get to catch up on the bus time it did not use
+            backlogged = [self.bus_time[o] for o, q in self.queues.items() if q and o != owner]
+            self.bus_time[owner] = max(self.bus_time.get(owner, 0), min(backlogged, default=0))
+        queue.append(transaction)
+        self.send_queued()
+        return None if transaction.queued else transaction.command
+
+    def in_flight(self, command: str | None = None) -> int:
+        """
+        Commands the firmware still has to answer, the ones merged into one count once.
+        command is counted as if it was added to the outbox.
+        """
+        batches: dict[int, list[str]] = {}
+        for transaction in self.transactions.values():
+            if not transaction.queued:
+                batches.setdefault(transaction.batch, []).append(transaction.command)
+        if command is not None:
+            batches.setdefault(self.batch, []).append(command)
+        if self.merge_commands is None:
+            return sum(len(commands) for commands in batches.values())
+        return sum(len(self.merge_commands(commands)) for commands in batches.values())
+
+    def send_queued(self) -> None:
+        """Sends waiting transactions while there is room in flight, least bus time first"""
+        while True:
+            owners = [owner for owner, queue in self.queues.items() if queue]
+            if not owners:
+                return
+            owner = min(owners, key=lambda o: self.bus_time[o])
+            transaction = self.queues[owner][0]
+            if transaction.id not in self.transactions:
+                self.queues[owner].popleft()
+                continue # given up on before it was sent
+            keys = sorted(transaction.keys, key=str)
+            # one that merges into a command already in the outbox takes no room
+            if self.in_flight(transaction.build_command(keys)) > self.max_in_flight:
+                return
+            self.queues[owner].popleft()
+            transaction.queued = False
+            self.bus_time[owner] += transaction.timeout * len(keys)
+            self._send(transaction, keys)
+
+    def _send(self, transaction: Transaction, keys: list) -> str:
+        now = time.monotonic()
+        # the firmware works through commands one at a time, so this one
+        # can only start once everything sent before it has been answered
+        queued_until = max((t.deadline for t in self.transactions.values() if t is not transaction and not t.queued), default=now)
+        transaction.sent_at = now
+        transaction.deadline = max(now, queued_until) + transaction.timeout * len(keys)
+
+        command = transaction.build_command(keys)
+        transaction.command = command
+        transaction.batch = self.batch
+        if self.paused:
+            # sent by resume() once the port is back
+            return command
+        if not self.outbox:
+            QTimer.singleShot(0, self.flush)
+        self.outbox.append(command)
+        self.stats.sent += 1
+        return command
+
+    @Slot()
+    def flush(self) -> None:
+        commands, self.outbox = self.outbox, []
+        self.batch += 1
+        if self.merge_commands is not None:
+            commands = self.merge_commands(commands)
+        for command in commands:
+            self.com_port._write(command)
+
+    def reply(self, owner: str, key: Hashable) -> float | None:
+        """Marks a reply as received, returns its latency in seconds"""
+        transaction_id = self.pending.pop((owner, key), None)
+        if transaction_id is None:
+            self.stats.unexpected += 1
+            return None
+        transaction = self.transactions[transaction_id]
+        transaction.keys.discard(key)
+
+        # a late answer to an earlier request can come in before this one was even sent
+        latency = None if transaction.queued else time.monotonic() - transaction.sent_at
+        if latency is not None:
+            self.stats.add_latency(latency)
+        if not transaction.keys:
+            del self.transactions[transaction_id]
+            self.send_queued()
+        self.stats_changed.emit()
+        return latency
+
+    def clear(self) -> None:
+        """Forgets every command, sent or waiting, ex: the port is opened again for another run config"""
+        self.transactions.clear()
+        self.pending.clear()
+        self.queues.clear()
+        self.bus_time.clear()
+        self.outbox.clear()
+
+    def pause(self) -> None:
+        self.paused = True
+
+    def resume(self) -> None:
+        """Sends every command still waiting on replies again, in the order they were first sent"""
+        self.paused = False
+        in_flight = sorted((t for t in self.transactions.values() if not t.queued), key=lambda t: t.id)
+        for transaction in in_flight:
+            transaction.deadline = 0 # not queued behind the deadlines from before the pause
+        for transaction in in_flight:
+            self._send(transaction, sorted(transaction.keys, key=str))
+        self.send_queued()
+
+    @Slot()
+    def check_deadlines(self) -> None:
+        if self.paused:
+            return
+        now = time.monotonic()
+        changed = False
+        for transaction in list(self.transactions.values()):
+            if transaction.queued or now < transaction.deadline:
+                continue
+            changed = True
+            missing = sorted(transaction.keys, key=str)
+            if transaction.retries < self.max_retries:
+                # only ask again for the replies that never came
+                transaction.retries += 1
+                self.stats.retried += len(missing)
+                self._send(transaction, missing)
+                continue
+
+            self.stats.lost += len(missing)
+            for key in missing:
+                del self.pending[(transaction.owner, key)]
+                self.reply_lost.emit(transaction.owner, key)
+            del self.transactions[transaction.id]
+        if changed:
+            self.send_queued()
+            self.stats_changed.emit()